@@ -1,13 +1,17 @@
 from fastapi import APIRouter
 
 from app.api.api_v1.endpoints import (
+    introspection,
     login,
     roles,
     users,
+    websockets,
 )
 
 api_router = APIRouter()
 
 api_router.include_router(login.router, tags=["login"])
+api_router.include_router(introspection.router, tags=["introspection"])
 api_router.include_router(roles.router, prefix="/roles")
-api_router.include_router(users.router, prefix="/users")
\ No newline at end of file
+api_router.include_router(users.router, prefix="/users")
+api_router.include_router(websockets.router, prefix="/ws", tags=["websockets"])
\ No newline at end of file
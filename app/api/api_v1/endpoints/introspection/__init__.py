@@ -0,0 +1 @@
+from .introspection import router
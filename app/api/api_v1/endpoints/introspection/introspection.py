@@ -0,0 +1,51 @@
+from typing import Any
+
+from fastapi import APIRouter, Depends, Form, HTTPException
+from sqlalchemy.orm import Session
+
+from app import schemas
+from app.api import deps
+from app.core.config import settings
+from app.core.introspection import introspect_tokens
+
+router = APIRouter()
+
+
+@router.post("/introspect", response_model=schemas.TokenIntrospection, response_model_exclude_none=True)
+def introspect(
+    token: str = Form(...),
+    db: Session = Depends(deps.get_db),
+    has_permission: bool = Depends(deps.has_permission("IntrospectTokens")),
+) -> Any:
+    """
+    OAuth2 token introspection (RFC 7662): who a token belongs to and
+    what it may do. Accepts access tokens and API keys.
+    """
+    if not has_permission:
+        raise HTTPException(status_code=403, detail="You are not authorized.")
+
+    return introspect_tokens(db, [token])[0]
+
+
+@router.post(
+    "/introspect/batch",
+    response_model=schemas.BatchTokenIntrospection,
+    response_model_exclude_none=True,
+)
+def introspect_batch(
+    batch_in: schemas.BatchTokenIntrospectionRequest,
+    db: Session = Depends(deps.get_db),
+    has_permission: bool = Depends(deps.has_permission("IntrospectTokens")),
+) -> Any:
+    """
+    Introspect many tokens at once; results are in request order
+    """
+    if not has_permission:
+        raise HTTPException(status_code=403, detail="You are not authorized.")
+    if len(batch_in.tokens) > settings.INTROSPECTION_MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.INTROSPECTION_MAX_BATCH_SIZE} tokens per request.",
+        )
+
+    return {"results": introspect_tokens(db, batch_in.tokens)}
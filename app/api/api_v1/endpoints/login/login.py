@@ -9,10 +9,13 @@ from pydantic.networks import EmailStr
 from sqlalchemy.orm import Session
 from starlette.responses import Response
 
-from app import crud, models, schemas
+from app import crud, schemas
 from app.api import deps
-from app.core import security
+from app.core import clock, password_policy, security
 from app.core.config import settings
+from app.core.events import auth_events
+from app.core.mail import send_reset_password_email, send_verification_email
+from app.core.principal import Principal
 from app.core.security import get_password_hash
 
 router = APIRouter()
@@ -23,14 +26,27 @@ def login_access_token(
     request: Request,
     response: Response,
     db: Session = Depends(deps.get_db),
+    tenant_id: str = Depends(deps.get_current_tenant),
     form_data: OAuth2PasswordRequestForm = Depends(),
 ) -> Any:
     """
     OAuth2 compatible token login, get an access token for future requests
     """
-    user = crud.user.authenticate(db, email=form_data.username, password=form_data.password)
+    ip_address = request.client.host if request.client else None
+    user = crud.user.authenticate(
+        db, email=form_data.username, password=form_data.password, tenant_id=tenant_id
+    )
     if not user:
+        auth_events.emit("login_failed", ip_address=ip_address, login=form_data.username)
         raise HTTPException(status_code=400, detail="Incorrect email or password")
+    elif crud.user.is_password_expired(user):
+        auth_events.emit(
+            "login_failed", user_id=user.id, ip_address=ip_address, reason="password_expired"
+        )
+        raise HTTPException(
+            status_code=400,
+            detail="Your password has expired. Please choose a new one and try again.",
+        )
     elif user.email is None:
         raise HTTPException(
             status_code=400,
@@ -42,9 +58,10 @@ def login_access_token(
 
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token_secure_expires = timedelta(minutes=settings.ACCESS_TOKEN_SECURE_EXPIRE_MINUTES)
-    user.last_login = datetime.utcnow()
+    user.last_login = clock.utcnow()
     db.add(user)
     db.commit()
+    auth_events.emit("login", user_id=user.id, ip_address=ip_address)
 
     # This is the regular access token
     access_token = security.create_access_token(
@@ -106,6 +123,7 @@ def external_user_login(
     request: Request,
     response: Response,
     db: Session = Depends(deps.get_db),
+    tenant_id: str = Depends(deps.get_current_tenant),
     form_data: OAuth2PasswordRequestForm = Depends(),
     new_password: str = Body(...),
     new_email: EmailStr = Body(None),
@@ -115,16 +133,20 @@ def external_user_login(
     and
     Get OAuth2 compatible token for login and future requests
     """
-    user = crud.user.authenticate(db, email=form_data.username, password=form_data.password)
+    ip_address = request.client.host if request.client else None
+    user = crud.user.authenticate(
+        db, email=form_data.username, password=form_data.password, tenant_id=tenant_id
+    )
     if not user:
+        auth_events.emit("login_failed", ip_address=ip_address, login=form_data.username)
         raise HTTPException(status_code=400, detail="Incorrect username or password")
 
     current_user_data = jsonable_encoder(user)
     user_in = schemas.UserUpdate(**current_user_data)
 
     if new_email:
-        existing_user = crud.user.get_by_email(db, email=new_email)
-        if existing_user:
+        existing_user = crud.user.get_by_login(db, login=new_email, tenant_id=tenant_id)
+        if existing_user and existing_user.id != user.id:
             raise HTTPException(status_code=400, detail="Email already in use, please try again.")
         try:
             validate_email(new_email)
@@ -135,13 +157,17 @@ def external_user_login(
 
     if new_password is None or new_password == "":
         raise HTTPException(status_code=400, detail="New password is invalid, please try again.")
+    problems = password_policy.check_password(new_password)
+    if problems:
+        raise HTTPException(status_code=400, detail=" ".join(problems))
 
     user_in.email = new_email
     user_in.password = new_password
     user = crud.user.update(db, db_obj=user, obj_in=user_in)
-    user.last_login = datetime.utcnow()
+    user.last_login = clock.utcnow()
     db.add(user)
     db.commit()
+    auth_events.emit("login", user_id=user.id, ip_address=ip_address, updated_credentials=True)
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token_secure_expires = timedelta(minutes=settings.ACCESS_TOKEN_SECURE_EXPIRE_MINUTES)
     access_token = security.create_access_token(
@@ -173,3 +199,126 @@ def external_user_login(
     )
 
     return {"msg": "Authentication successful. Cookie set."}
+
+
+@router.post("/password-recovery/{email}", response_model=schemas.Msg)
+def recover_password(
+    email: str,
+    request: Request,
+    db: Session = Depends(deps.get_db),
+    tenant_id: str = Depends(deps.get_current_tenant),
+) -> Any:
+    """
+    Password Recovery
+    """
+    user = crud.user.get_by_login(db, login=email, tenant_id=tenant_id)
+    if user:
+        token = security.create_action_token(
+            "reset_password",
+            user.id,
+            user.hashed_password,
+            timedelta(hours=settings.EMAIL_RESET_TOKEN_EXPIRE_HOURS),
+        )
+        send_reset_password_email(user.email, user.username, token)
+        auth_events.emit(
+            "password_reset_requested",
+            user_id=user.id,
+            ip_address=request.client.host if request.client else None,
+        )
+    # The same answer either way, so this can't be used to find out who has an account
+    return {"msg": "If that email belongs to an account, a recovery email is on its way."}
+
+
+@router.post("/reset-password/", response_model=schemas.Msg)
+def reset_password(
+    request: Request,
+    token: str = Body(...),
+    new_password: str = Body(...),
+    db: Session = Depends(deps.get_db),
+    tenant_id: str = Depends(deps.get_current_tenant),
+) -> Any:
+    """
+    Reset password with the token from a recovery email
+    """
+    action_token = security.parse_action_token(token, "reset_password")
+    user = action_token and crud.user.get_in_tenant(
+        db, id=action_token.user_id, tenant_id=tenant_id
+    )
+    # The token is bound to the password hash, so it stops working once
+    # the password changes
+    if not user or not security.verify_action_token(action_token, user.hashed_password):
+        raise HTTPException(status_code=400, detail="Invalid token")
+    problems = password_policy.check_password(new_password)
+    if problems:
+        raise HTTPException(status_code=400, detail=" ".join(problems))
+    if not crud.consumed_nonce.consume(
+        db,
+        nonce=action_token.nonce,
+        expires_at=datetime.utcfromtimestamp(action_token.expires_at),
+    ):
+        raise HTTPException(status_code=400, detail="Invalid token")
+
+    user.hashed_password = get_password_hash(new_password)
+    db.add(user)
+    db.commit()
+    auth_events.emit(
+        "password_reset",
+        user_id=user.id,
+        ip_address=request.client.host if request.client else None,
+    )
+    return {"msg": "Password updated successfully"}
+
+
+@router.post("/verify-email/request", response_model=schemas.Msg)
+def request_email_verification(
+    current_user: Principal = Depends(deps.user.get_current_active_user),
+) -> Any:
+    """
+    Send the current user a link to verify their email address
+    """
+    if current_user.email is None:
+        raise HTTPException(status_code=400, detail="There is no email to verify.")
+    if current_user.email_verified_at is not None:
+        return {"msg": "Email already verified."}
+
+    token = security.create_action_token(
+        "verify_email",
+        current_user.id,
+        current_user.email,
+        timedelta(hours=settings.EMAIL_VERIFY_TOKEN_EXPIRE_HOURS),
+    )
+    if not send_verification_email(current_user.email, current_user.username, token):
+        raise HTTPException(status_code=503, detail="Please try again later.")
+    return {"msg": "Verification email sent."}
+
+
+@router.post("/verify-email/", response_model=schemas.Msg)
+def verify_email(
+    token: str = Body(..., embed=True),
+    db: Session = Depends(deps.get_db),
+    tenant_id: str = Depends(deps.get_current_tenant),
+) -> Any:
+    """
+    Verify an email address with the token from a verification email
+    """
+    action_token = security.parse_action_token(token, "verify_email")
+    user = action_token and crud.user.get_in_tenant(
+        db, id=action_token.user_id, tenant_id=tenant_id
+    )
+    # Bound to the address, so a link sent before an email change is void
+    if not user or not security.verify_action_token(action_token, user.email or ""):
+        raise HTTPException(status_code=400, detail="Invalid token")
+    if user.email_verified_at is not None:
+        return {"msg": "Email already verified."}
+    if not crud.consumed_nonce.consume(
+        db,
+        nonce=action_token.nonce,
+        expires_at=datetime.utcfromtimestamp(action_token.expires_at),
+    ):
+        raise HTTPException(status_code=400, detail="Invalid token")
+
+    user.email_verified_at = clock.utcnow()
+    db.add(user)
+    db.commit()
+    auth_events.emit("email_verified", user_id=user.id)
+    return {"msg": "Email verified."}
@@ -1,16 +1,25 @@
-from datetime import date, timedelta
-from typing import Any
+import uuid
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
 
 from bson import ObjectId
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from pymongo import MongoClient
-from sqlalchemy.orm import Session
-from starlette.responses import Response
+from sqlalchemy.orm import Session, sessionmaker
+from starlette.responses import JSONResponse, Response
 
-from app import schemas, crud
+from app import crud, models, schemas
 from app.api import deps
-from app.core import security
+from app.core import clock, security
 from app.core.config import settings
+from app.core.events import auth_events
+from app.core.principal import Principal
+from app.core.reset_campaigns import reset_campaigns
+from app.core.websocket_sessions import websocket_sessions
+from app.crud.crud_user import USER_PROFILES
+from app.db.maintenance import scheduler
+from app.db.query_budget import query_stats
+from app.db.search import SEARCH_MODES
 
 router = APIRouter()
 
@@ -21,17 +30,26 @@ def shadow_user(
     request: Request,
     response: Response,
     db: Session = Depends(deps.get_db),
+    current_user: Principal = Depends(deps.user.get_current_active_user),
     has_permission: bool = Depends(deps.has_permission("ShadowUser")),
 ) -> Any:
     if not has_permission:
         raise HTTPException(status_code=400, detail="You are not authorized.")
 
-    shadow_user = crud.user.get_by_username(db, username=shadow_username)
+    shadow_user = crud.user.get_by_login(
+        db, login=shadow_username, tenant_id=current_user.tenant_id
+    )
     if not shadow_user:
         raise HTTPException(status_code=400, detail="Incorrect username")
 
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = security.create_access_token(shadow_user.id, expires_delta=access_token_expires)
+    auth_events.emit(
+        "shadow_user",
+        user_id=shadow_user.id,
+        actor_user_id=current_user.id,
+        ip_address=request.client.host if request.client else None,
+    )
 
     response.set_cookie(
         key=settings.COOKIE_TOKEN_NAME,
@@ -43,16 +61,328 @@ def shadow_user(
     return {"msg": "Authentication successful. Cookie set."}
 
 
-@router.get("/all-users")
+@router.get("/all-users", response_model=schemas.UserListing)
 def get_all_users(
+    profile: str = Query("none", pattern=f"^({'|'.join(USER_PROFILES)})$"),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1, le=1000),
     db: Session = Depends(deps.get_db),
+    current_user: Principal = Depends(deps.user.get_current_active_user),
     created_after: date = Depends(deps.timestamps.get_current_timestamp(-timedelta(weeks=2))),
     created_before: date = Depends(deps.timestamps.get_current_timestamp(timedelta(days=1))),
     has_permission: bool = Depends(deps.has_permission("AdminSeeAllUsers")),
+    # The user, the permission check, the page, one permitted_targets query
+    # and a query per loading level for every 500 users; anything per user
+    # is an N+1
+    _: None = Depends(deps.query_budget(12)),
+) -> Any:
+    """
+    Users created in the window, a page at a time. The profile picks what
+    comes along: nothing, each user's role grants, or the grants plus the
+    effective permissions of the roles involved.
+    """
+    if not has_permission:
+        raise HTTPException(status_code=403, detail="You are not authorized.")
+
+    users = crud.user.get_all_users(
+        db,
+        created_after=created_after,
+        created_before=created_before,
+        tenant_id=current_user.tenant_id,
+        profile=profile,
+        skip=skip,
+        limit=limit,
+    )
+    # Grants scoped to particular users only reveal those users
+    permitted = crud.role.permitted_targets(
+        db,
+        user_id=current_user.id,
+        permission_name="AdminSeeAllUsers",
+        target_user_ids=[user.id for user in users],
+    )
+    users = [user for user in users if user.id in permitted]
+    listing = {
+        "users": [_listed_user(user, profile) for user in users],
+        "skip": skip,
+        "limit": limit,
+    }
+    if profile == "permissions":
+        role_ids = list({grant.role_id for user in users for grant in user.roles})
+        permissions = crud.role.get_effective_permissions_by_role(db, role_ids=role_ids)
+        listing["permissions"] = {
+            str(role_id): sorted(permissions.get(role_id, ())) for role_id in role_ids
+        }
+    # Built from plain values already, so it goes out in a single json.dumps
+    # without response_model validation or jsonable_encoder walking it again
+    return JSONResponse(listing)
+
+
+def _listed_user(user: models.User, profile: str) -> Dict[str, Any]:
+    listed = {
+        "id": str(user.id),
+        "username": user.username,
+        "email": user.email,
+        "created_at": user.created_at.isoformat(),
+    }
+    if profile != "none":
+        listed["roles"] = [
+            {
+                "id": str(grant.role_id),
+                "role_name": grant.role.role_name,
+                "target_user_id": grant.target_user_id and str(grant.target_user_id),
+            }
+            for grant in user.roles
+        ]
+    return listed
+
+
+@router.get("/users/search", response_model=schemas.UserSearchResults)
+def search_users(
+    q: str = Query(..., min_length=1, max_length=320),
+    mode: str = Query("substring", pattern=f"^({'|'.join(SEARCH_MODES)})$"),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(deps.get_db),
+    current_user: Principal = Depends(deps.user.get_current_active_user),
+    has_permission: bool = Depends(deps.has_permission("AdminSeeAllUsers")),
 ) -> Any:
+    """
+    Search users by username or email, ranked by relevance
+    """
     if not has_permission:
         raise HTTPException(status_code=403, detail="You are not authorized.")
 
-    users = crud.user.get_all_users(db, created_after=created_after, created_before=created_before)
-    return {"users": users}
+    users = crud.user.search(
+        db, query=q, mode=mode, skip=skip, limit=limit, tenant_id=current_user.tenant_id
+    )
+    return {"users": users, "skip": skip, "limit": limit}
+
+
+def _get_role_pair(
+    db: Session, current_user: Principal, role_name: str, parent_role_name: str
+) -> Tuple[models.Role, models.Role]:
+    role = crud.role.get_by_name(db, role_name=role_name, tenant_id=current_user.tenant_id)
+    parent = crud.role.get_by_name(
+        db, role_name=parent_role_name, tenant_id=current_user.tenant_id
+    )
+    if not role or not parent:
+        raise HTTPException(status_code=404, detail="Role not found")
+    # System roles are shared by every tenant, so only the default tenant
+    # may rearrange them. That goes for either side: a tenant role made to
+    # inherit a system role would hand the tenant its permissions.
+    if (
+        role.tenant_id is None or parent.tenant_id is None
+    ) and current_user.tenant_id != models.DEFAULT_TENANT_ID:
+        raise HTTPException(
+            status_code=403, detail="System roles can only be changed from the default tenant."
+        )
+    return role, parent
+
+
+@router.put("/roles/{role_name}/parents/{parent_role_name}", response_model=schemas.Msg)
+def add_role_parent(
+    role_name: str,
+    parent_role_name: str,
+    db: Session = Depends(deps.get_db),
+    current_user: Principal = Depends(deps.user.get_current_active_user),
+    has_permission: bool = Depends(deps.has_permission("AdminManageRoles")),
+) -> Any:
+    """
+    Make the parent role inherit every permission of the role
+    """
+    if not has_permission:
+        raise HTTPException(status_code=403, detail="You are not authorized.")
+
+    role, parent = _get_role_pair(db, current_user, role_name, parent_role_name)
+    try:
+        crud.role.add_parent(db, role=role, parent=parent)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from None
+
+    auth_events.emit(
+        "role_parent_added",
+        actor_user_id=current_user.id,
+        role_id=role.id,
+        parent_role_id=parent.id,
+    )
+    return {"msg": "Success"}
+
+
+@router.delete("/roles/{role_name}/parents/{parent_role_name}", response_model=schemas.Msg)
+def remove_role_parent(
+    role_name: str,
+    parent_role_name: str,
+    db: Session = Depends(deps.get_db),
+    current_user: Principal = Depends(deps.user.get_current_active_user),
+    has_permission: bool = Depends(deps.has_permission("AdminManageRoles")),
+) -> Any:
+    if not has_permission:
+        raise HTTPException(status_code=403, detail="You are not authorized.")
+
+    role, parent = _get_role_pair(db, current_user, role_name, parent_role_name)
+    if crud.role.remove_parent(db, role=role, parent=parent):
+        auth_events.emit(
+            "role_parent_removed",
+            actor_user_id=current_user.id,
+            role_id=role.id,
+            parent_role_id=parent.id,
+        )
+    return {"msg": "Success"}
+
+
+@router.get("/auth-events", response_model=schemas.AuthEvents)
+def get_auth_events(
+    db: Session = Depends(deps.get_db),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    event_type: Optional[str] = None,
+    user_id: Optional[uuid.UUID] = None,
+    skip: int = 0,
+    limit: int = 100,
+    has_permission: bool = Depends(deps.has_permission("AdminSeeAuthEvents")),
+    _: None = Depends(deps.require_default_tenant),
+) -> Any:
+    if not has_permission:
+        raise HTTPException(status_code=403, detail="You are not authorized.")
+
+    end = end or clock.utcnow()
+    start = start or end - timedelta(days=1)
+    events = crud.auth_event.get_range(
+        db,
+        start=start,
+        end=end,
+        event_type=event_type,
+        user_id=user_id,
+        skip=skip,
+        limit=min(limit, 1000),
+    )
+    return {"events": events}
+
+
+@router.get("/auth-events/stats", response_model=schemas.AuthEventStats)
+def get_auth_event_stats(
+    has_permission: bool = Depends(deps.has_permission("AdminSeeAuthEvents")),
+    _: None = Depends(deps.require_default_tenant),
+) -> Any:
+    if not has_permission:
+        raise HTTPException(status_code=403, detail="You are not authorized.")
 
+    return auth_events.stats()
+
+
+@router.get("/db-usage", response_model=schemas.DBUsage)
+def get_db_usage(
+    has_permission: bool = Depends(deps.has_permission("AdminSeeServerStats")),
+) -> Any:
+    """
+    Requests that asked for a database session, how many of them
+    actually opened one, and the statements they ran
+    """
+    if not has_permission:
+        raise HTTPException(status_code=403, detail="You are not authorized.")
+
+    return deps.db.db_usage.stats()
+
+
+@router.get("/scheduler", response_model=schemas.SchedulerStats)
+def get_scheduler_stats(
+    has_permission: bool = Depends(deps.has_permission("AdminSeeServerStats")),
+) -> Any:
+    """
+    This worker's view of the maintenance scheduler. Only the leader
+    runs jobs, so other workers report no runs.
+    """
+    if not has_permission:
+        raise HTTPException(status_code=403, detail="You are not authorized.")
+
+    return scheduler.stats()
+
+
+@router.get("/websocket-sessions", response_model=schemas.WebSocketSessionStats)
+def get_websocket_session_stats(
+    has_permission: bool = Depends(deps.has_permission("AdminSeeServerStats")),
+) -> Any:
+    """
+    This worker's open WebSocket sessions and their revalidation
+    """
+    if not has_permission:
+        raise HTTPException(status_code=403, detail="You are not authorized.")
+
+    return websocket_sessions.stats()
+
+
+@router.get("/query-stats", response_model=schemas.QueryStats)
+def get_query_stats(
+    top: int = Query(50, ge=1, le=1000),
+    has_permission: bool = Depends(deps.has_permission("AdminSeeServerStats")),
+) -> Any:
+    """
+    Statements per request by route, as histograms, and the statement
+    fingerprints run most often or repeated within a request
+    """
+    if not has_permission:
+        raise HTTPException(status_code=403, detail="You are not authorized.")
+
+    return query_stats.stats(top=top)
+
+
+@router.post("/tenants", response_model=schemas.Tenant)
+def create_tenant(
+    tenant_in: schemas.TenantCreate,
+    db: Session = Depends(deps.get_db),
+    current_user: Principal = Depends(deps.user.get_current_active_user),
+    has_permission: bool = Depends(deps.has_permission("AdminManageTenants")),
+    _: None = Depends(deps.require_default_tenant),
+) -> Any:
+    if not has_permission:
+        raise HTTPException(status_code=403, detail="You are not authorized.")
+    if crud.tenant.get(db, id=tenant_in.id):
+        raise HTTPException(status_code=400, detail="A tenant with this id already exists.")
+
+    tenant = crud.tenant.create(db, obj_in=tenant_in)
+    auth_events.emit("tenant_created", actor_user_id=current_user.id, tenant_id=tenant.id)
+    return tenant
+
+
+@router.get("/tenants", response_model=schemas.Tenants)
+def get_tenants(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(deps.get_db),
+    has_permission: bool = Depends(deps.has_permission("AdminManageTenants")),
+    _: None = Depends(deps.require_default_tenant),
+) -> Any:
+    if not has_permission:
+        raise HTTPException(status_code=403, detail="You are not authorized.")
+
+    return {"tenants": crud.tenant.get_multi(db, skip=skip, limit=limit)}
+
+
+@router.post(
+    "/password-reset-campaign",
+    response_model=schemas.PasswordResetCampaignResult,
+    status_code=202,
+)
+def password_reset_campaign(
+    campaign_in: schemas.PasswordResetCampaign,
+    db: Session = Depends(deps.get_db),
+    current_user: Principal = Depends(deps.user.get_current_active_user),
+    has_permission: bool = Depends(deps.has_permission("AdminResetPasswords")),
+) -> Any:
+    """
+    Email a password reset link to every matching user of the tenant, e.g.
+    after a credential leak. The campaign runs in the background; see
+    app.core.reset_campaigns.
+    """
+    if not has_permission:
+        raise HTTPException(status_code=403, detail="You are not authorized.")
+
+    campaign = reset_campaigns.start(
+        # The campaign's own sessions, on the database this request uses
+        sessionmaker(autocommit=False, autoflush=False, bind=db.get_bind()),
+        tenant_id=current_user.tenant_id,
+        actor_user_id=current_user.id,
+        user_ids=campaign_in.user_ids,
+        created_before=campaign_in.created_before,
+    )
+    return {"campaign_id": campaign.id}
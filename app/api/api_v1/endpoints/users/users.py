@@ -1,4 +1,4 @@
-from datetime import datetime, timedelta
+import uuid
 from typing import Any
 
 from fastapi import APIRouter, Depends, HTTPException, Request
@@ -6,8 +6,9 @@ from sqlalchemy.orm import Session
 from sqlalchemy import text
 from starlette.responses import Response
 
-from app import crud, models, schemas
+from app import crud, schemas
 from app.api import deps
+from app.core.principal import Principal
 
 
 router = APIRouter()
@@ -20,63 +21,116 @@ def create_user(
     *,
     db: Session = Depends(deps.get_db),
     user_in: schemas.UserCreate,
-    date: datetime = Depends(
-        deps.timestamps.get_current_timezone_timestamp(timedelta(days=0))
-    ),
+    tenant_id: str = Depends(deps.get_current_tenant),
 ) -> Any:
     """
     Create new user.
     """
-    user = crud.user.get_by_email(db, email=user_in.email)
+    # Login keys are case-insensitive and shared by usernames and emails,
+    # so neither may match an existing user's username or email
+    user = crud.user.get_by_login(db, login=user_in.email, tenant_id=tenant_id)
     if user:
         raise HTTPException(
             status_code=400,
             detail="The user with this email already exists in the system.",
         )
-    user = crud.user.get_by_username(db, username=user_in.username)
+    user = crud.user.get_by_login(db, login=user_in.username, tenant_id=tenant_id)
     if user:
         raise HTTPException(
             status_code=400,
             detail="The user with this username already exists in the system.",
         )
 
-    user = crud.user.create(db, obj_in=user_in)
-    return schemas.Me(username=user.username, email=user.email, id = str(user.id))
+    user = crud.user.create(db, obj_in=user_in, tenant_id=tenant_id)
+    return schemas.Me(
+        username=user.username, email=user.email, id=str(user.id), tenant_id=user.tenant_id
+    )
 
 
 @router.get("/me", response_model=schemas.Me)
 def read_user_me(
-    current_user: models.User = Depends(deps.user.get_current_user),
+    current_user: Principal = Depends(deps.user.get_current_user),
+    # An API key lookup, then the principal on a cache miss
+    _: None = Depends(deps.query_budget(2)),
 ) -> Any:
     """
     Get current user.
     """
-    return schemas.Me(username=current_user.username, email=current_user.email, id = str(current_user.id))
+    return schemas.Me(
+        username=current_user.username,
+        email=current_user.email,
+        id=str(current_user.id),
+        tenant_id=current_user.tenant_id,
+    )
+
+
+@router.post("/me/api-keys", response_model=schemas.ApiKeyCreated)
+def create_api_key(
+    *,
+    db: Session = Depends(deps.get_db),
+    api_key_in: schemas.ApiKeyCreate,
+    current_user: Principal = Depends(deps.user.get_current_active_user),
+) -> Any:
+    """
+    Create an API key for the current user.
+    The key itself is only ever returned here.
+    """
+    db_obj, api_key = crud.api_key.create_for_user(db, user_id=current_user.id, obj_in=api_key_in)
+    return schemas.ApiKeyCreated(**schemas.ApiKey.from_orm(db_obj).dict(), api_key=api_key)
+
+
+@router.get("/me/api-keys", response_model=schemas.ApiKeys)
+def read_api_keys(
+    db: Session = Depends(deps.get_db),
+    current_user: Principal = Depends(deps.user.get_current_active_user),
+) -> Any:
+    return {"api_keys": crud.api_key.get_multi_by_user(db, user_id=current_user.id)}
+
+
+@router.delete("/me/api-keys/{api_key_id}", response_model=schemas.Msg)
+def revoke_api_key(
+    api_key_id: uuid.UUID,
+    db: Session = Depends(deps.get_db),
+    current_user: Principal = Depends(deps.user.get_current_active_user),
+) -> Any:
+    if not crud.api_key.revoke(db, user_id=current_user.id, id=api_key_id):
+        raise HTTPException(status_code=404, detail="API key not found")
+    return {"msg": "Success"}
 
 
 @router.get("/{user_id}", response_model=schemas.User)
 def read_user_by_id(
     user_id: str,
-    current_user: models.User = Depends(deps.user.get_current_active_user),
+    current_user: Principal = Depends(deps.user.get_current_active_user),
     db: Session = Depends(deps.get_db),
+    can_see_user: bool = Depends(deps.has_scoped_permission("AdminSeeAllUsers")),
 ) -> Any:
     """
     Get a specific user by id.
     """
-    user = crud.user.get(db, id=user_id)
-    if user == current_user:
-        return user
-    if not crud.user.is_superuser(current_user):
+    if user_id == str(current_user.id):
+        return schemas.User(
+            username=current_user.username,
+            email=current_user.email,
+            id=user_id,
+            tenant_id=current_user.tenant_id,
+        )
+    if not can_see_user:
         raise HTTPException(
             status_code=401, detail="The user doesn't have enough privileges"
         )
-    return user
+    user = crud.user.get_in_tenant(db, id=user_id, tenant_id=current_user.tenant_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return schemas.User(
+        username=user.username, email=user.email, id=user_id, tenant_id=user.tenant_id
+    )
 
 
 @router.delete("/me", response_model=schemas.Msg)
 def delete_user_me(
     db: Session = Depends(deps.get_db),
-    current_user: models.User = Depends(deps.user.get_current_active_user),
+    current_user: Principal = Depends(deps.user.get_current_active_user),
 ) -> Any:
     crud.user.delete_user(db=db, user=current_user)
     return {"msg": "Success"}
@@ -0,0 +1 @@
+from .websockets import router
\ No newline at end of file
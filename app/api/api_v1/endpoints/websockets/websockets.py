@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Depends
+
+from app.api import deps
+from app.core.websocket_sessions import WebSocketSession
+
+router = APIRouter()
+
+
+@router.websocket("/session")
+async def websocket_session(
+    session: WebSocketSession = Depends(deps.get_websocket_session),
+) -> None:
+    """
+    Stays open for as long as the credentials it was opened with are
+    good, answering "ping" with a pong. It's closed with 4401 when the
+    access token expires and 4403 when the user or API key is revoked.
+    """
+    await session.send_json(
+        {
+            "type": "session",
+            "user_id": str(session.principal.id),
+            "tenant_id": session.principal.tenant_id,
+            "expires_at": session.expires_at,
+        }
+    )
+    async for message in session.iter_text():
+        if message == "ping":
+            await session.send_json({"type": "pong"})
@@ -8,19 +8,23 @@ from jose import jwt
 from pydantic import ValidationError
 from sqlalchemy.orm import Session
 
-from app import models, schemas
+from app import crud, schemas
 from app.core import security
 from app.core.config import settings
+from app.core.principal import Principal
 
-from . import timestamps, user
-from .db import get_db
+from . import db, tenant, timestamps, user, websocket
+from .auth_backends import authentication_chain
+from .db import get_db, query_budget
 from .oauth_token_from_cookie import reusable_oauth2
+from .tenant import get_current_tenant, require_default_tenant
+from .websocket import get_websocket_session
 
 
 def is_request_secure(
     request: Request = None,
     websocket: WebSocket = None,
-    user: models.User = Depends(user.get_current_user),
+    user: Principal = Depends(user.get_current_user),
 ):
     """
     This checks the secure_access_token which is a stricter cookie to completely
@@ -61,7 +65,7 @@ def is_request_secure(
         ) from None
     token_data = schemas.SecureTokenPayload(**payload)
 
-    if (token_data.token_type != "secure") or (token_data.sub != user.id):
+    if (token_data.token_type != "secure") or (token_data.sub != str(user.id)):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
@@ -73,23 +77,41 @@ def is_request_secure(
 def has_permission(permission: str, target_user_id: uuid.UUID | None = None):
     def factory(
         db: Session = Depends(get_db),
-        user: models.User = Depends(user.get_current_active_user),
+        user: Principal = Depends(user.get_current_active_user),
     ) -> bool:
-        permission_record = (
-            db.query(models.Permission).filter_by(permission_name=permission).first()
+        # Inherited permissions come through roles_closure,
+        # so this stays a single query however deep the hierarchy is
+        return crud.role.user_has_permission(
+            db,
+            user_id=user.id,
+            permission_name=permission,
+            target_user_id=target_user_id,
         )
-        if permission_record is None:
+
+    return factory
+
+
+def has_scoped_permission(permission: str, target_path_param: str = "user_id"):
+    """
+    Like has_permission, but scoped to the user named by a path parameter
+    of the current request, e.g. /users/{user_id}. Grants for that user and
+    unscoped grants both count.
+    """
+
+    def factory(
+        request: Request,
+        db: Session = Depends(get_db),
+        user: Principal = Depends(user.get_current_active_user),
+    ) -> bool:
+        try:
+            target_user_id = uuid.UUID(request.path_params[target_path_param])
+        except (KeyError, ValueError):
             return False
-        roles = db.query(models.User).filter_by(id=user.id).join(models.User.roles)
-        if target_user_id:
-            roles = roles.filter_by(target_user_id=target_user_id)
-
-        return bool(
-            roles.join(models.join_tables.UsersRole.role)
-            .join(models.Role.permissions)
-            .filter_by(id=permission_record.id)
-            .first()
+        return crud.role.user_has_permission(
+            db,
+            user_id=user.id,
+            permission_name=permission,
+            target_user_id=target_user_id,
         )
 
     return factory
-
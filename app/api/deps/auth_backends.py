@@ -0,0 +1,97 @@
+from typing import List, NamedTuple, Optional
+
+from fastapi import WebSocket
+from fastapi.security.utils import get_authorization_scheme_param
+from starlette.requests import HTTPConnection, Request
+
+from app.core.config import settings
+
+from .oauth_token_from_cookie import CustomOAuth2PasswordBearerWithCookie
+
+
+class Credentials(NamedTuple):
+    # "jwt" for access tokens, "api_key" for API keys
+    scheme: str
+    value: str
+
+
+def _classify(value: str) -> Credentials:
+    if value.startswith(f"{settings.API_KEY_PREFIX}_"):
+        return Credentials("api_key", value)
+    return Credentials("jwt", value)
+
+
+class BearerHeaderBackend:
+    """
+    Authorization: Bearer <access token or API key>
+    """
+
+    def extract(self, connection: HTTPConnection) -> Optional[Credentials]:
+        scheme, param = get_authorization_scheme_param(
+            connection.headers.get("Authorization")
+        )
+        if scheme.lower() != "bearer" or not param:
+            return None
+        return _classify(param)
+
+
+class CookieBackend:
+    """
+    The access token cookie set by /login/access-token
+    """
+
+    def extract(self, connection: HTTPConnection) -> Optional[Credentials]:
+        scheme, param = get_authorization_scheme_param(
+            connection.cookies.get(settings.COOKIE_TOKEN_NAME)
+        )
+        if scheme.lower() != "bearer" or not param:
+            return None
+        return Credentials("jwt", param)
+
+
+class APIKeyHeaderBackend:
+    """
+    X-API-Key: <API key>, for machine clients that never log in
+    """
+
+    def extract(self, connection: HTTPConnection) -> Optional[Credentials]:
+        api_key = connection.headers.get(settings.API_KEY_HEADER_NAME)
+        if not api_key:
+            return None
+        return Credentials("api_key", api_key)
+
+
+class AuthenticationChain(CustomOAuth2PasswordBearerWithCookie):
+    """
+    Tries each backend in order and returns the first credentials found.
+    Only extraction happens here; get_current_user verifies them.
+
+    It keeps the OAuth2 password flow in the OpenAPI schema and the
+    websocket handling of the cookie scheme it replaces.
+    """
+
+    def __init__(self, tokenUrl: str, backends: List, **kwargs):
+        super().__init__(tokenUrl=tokenUrl, **kwargs)
+        self.backends = backends
+
+    def extract(self, connection: HTTPConnection) -> Optional[Credentials]:
+        for backend in self.backends:
+            credentials = backend.extract(connection)
+            if credentials is not None:
+                return credentials
+        return None
+
+    async def __call__(
+        self, request: Request = None, websocket: WebSocket = None
+    ) -> Optional[Credentials]:
+        credentials = self.extract(request or websocket)
+        if credentials is not None:
+            return credentials
+        # Nothing matched: let the cookie scheme raise its usual error
+        return await super().__call__(request=request, websocket=websocket)
+
+
+authentication_chain = AuthenticationChain(
+    tokenUrl=f"{settings.API_V1_STR}/login/access-token",
+    backends=[BearerHeaderBackend(), CookieBackend(), APIKeyHeaderBackend()],
+)
@@ -1,18 +1,123 @@
-from typing import Generator
+import threading
+from typing import Any, Callable, Dict, Generator, Optional
 
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from starlette.requests import HTTPConnection
 
-from app.core.config import settings
-from app.db.session import SessionLocal
+from app.db.query_budget import current_recorder, route_name
+from app.db.session import ReadOnlySessionLocal, SessionLocal
 
+READ_ONLY_METHODS = ("GET", "HEAD", "OPTIONS")
 
-def get_db() -> Generator:
-    try:
-        db = SessionLocal()
-        yield db
-    except SQLAlchemyError as e:
-        db.rollback()
-        print("Rolling back from db error")
-        print(e)
-    finally:
-        db.close()
\ No newline at end of file
+
+class LazySession:
+    """
+    Stands in for a Session and only creates one when it's first used.
+
+    A request that's answered from a cache, or rejected before it needs
+    the database, never creates a session or checks out a connection, so
+    pool pressure follows the database work actually done rather than the
+    number of requests.
+    """
+
+    __slots__ = ("_factory", "_session")
+
+    def __init__(self, factory: Callable[[], Session]):
+        self._factory = factory
+        self._session: Optional[Session] = None
+
+    @property
+    def opened(self) -> bool:
+        return self._session is not None
+
+    def __getattr__(self, name: str) -> Any:
+        if self._session is None:
+            self._session = self._factory()
+        return getattr(self._session, name)
+
+    def rollback(self) -> None:
+        if self._session is not None:
+            self._session.rollback()
+
+    def close(self) -> None:
+        if self._session is not None:
+            self._session.close()
+
+
+class DBUsage:
+    """
+    How many requests asked for a session, how many used one, and how
+    many statements they ran. Statements are counted at the cursor, as
+    the query budget counts them, so flushes and text() count as well as
+    ORM queries.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.sessions_opened = 0
+        self.statements = 0
+
+    def record(self, opened: bool, statements: int) -> None:
+        with self._lock:
+            self.requests += 1
+            self.sessions_opened += opened
+            self.statements += statements
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "requests": self.requests,
+            "sessions_opened": self.sessions_opened,
+            "statements": self.statements,
+        }
+
+
+db_usage = DBUsage()
+
+
+def session_dependency(
+    session_factory: Callable[[], Session],
+    read_only_session_factory: Callable[[], Session],
+) -> Callable[..., Generator]:
+    def get_db(connection: HTTPConnection) -> Generator:
+        # WebSockets have no method; treat them like any other read-write caller
+        read_only = connection.scope.get("method") in READ_ONLY_METHODS
+        db = LazySession(read_only_session_factory if read_only else session_factory)
+        recorder = current_recorder()
+        started_at = recorder.statements if recorder is not None else 0
+        try:
+            yield db
+        except Exception:
+            # Leave nothing half-done on the connection, and let the error
+            # reach the exception handlers
+            db.rollback()
+            raise
+        finally:
+            db.close()
+            # What the request ran while it held the session
+            statements = recorder.statements - started_at if recorder and db.opened else 0
+            db_usage.record(db.opened, statements)
+            connection.state.db_session_opened = db.opened
+            connection.state.db_statements = statements
+
+    return get_db
+
+
+get_db = session_dependency(SessionLocal, ReadOnlySessionLocal)
+
+
+def query_budget(max_statements: int) -> Callable[[HTTPConnection], None]:
+    """
+    Declare the most statements a route may run per request, dependencies
+    included. See app.db.query_budget for what happens when it runs more.
+    """
+
+    def factory(connection: HTTPConnection) -> None:
+        recorder = current_recorder()
+        if recorder is not None:
+            recorder.budget = max_statements
+            recorder.route = route_name(connection.scope)
+            # Auth and tenant dependencies may already have run some
+            recorder.check_budget()
+
+    return factory
@@ -1,12 +1,12 @@
 from typing import Optional
 
-from fastapi import WebSocket, WebSocketDisconnect
+from fastapi import WebSocket, WebSocketException
 from fastapi.exceptions import HTTPException
 from fastapi.openapi.models import OAuthFlows as OAuthFlowsModel
 from fastapi.security import OAuth2
 from fastapi.security.utils import get_authorization_scheme_param
 from starlette.requests import Request
-from starlette.status import HTTP_401_UNAUTHORIZED
+from starlette.status import HTTP_401_UNAUTHORIZED, WS_1008_POLICY_VIOLATION
 
 from app.core.config import settings
 
@@ -64,17 +64,11 @@ class CustomOAuth2PasswordBearerWithCookie(OAuth2PasswordBearerWithCookie):
             return await super().__call__(request or websocket)
         except HTTPException as e:
             if websocket is not None:
-                # This is a websocket that has called for authentication
-                # websockets don't return HTTPExceptions; they just close the connection
-                # We need to upgrade fastapi to raise a proper WebSocketException
-                # for now, we raise WebSocketDisconnect instead
-                # This is one option, to just close the websocket directly
-                # but then the rest of the code still executes and will eventually cause a
-                # server error anyway
-                # await websocket.close()
-                # This still raises a server error but the server should recover fine
-                # And it will halt any further processing
-                raise WebSocketDisconnect(code=4001) from e
+                # A WebSocket has no HTTP response to carry the error; this
+                # closes the handshake with a policy violation instead
+                raise WebSocketException(
+                    code=WS_1008_POLICY_VIOLATION, reason="Not authenticated"
+                ) from e
             else:
                 raise e
 
@@ -0,0 +1,48 @@
+from fastapi import Depends, HTTPException
+from sqlalchemy.orm import Session
+from starlette.requests import HTTPConnection
+
+from app import crud
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.models import DEFAULT_TENANT_ID
+
+from .db import get_db
+
+# Tenants are rarely created and never renamed, so remembering the ones
+# that exist saves a query on every request
+known_tenants: TTLCache[bool] = TTLCache(settings.TENANT_CACHE_SIZE)
+
+
+def resolve_tenant_id(connection: HTTPConnection) -> str:
+    """
+    The tenant named by the tenant header, else by the subdomain of
+    TENANT_HOST_SUFFIX, else the default tenant
+    """
+    tenant_id = connection.headers.get(settings.TENANT_HEADER_NAME)
+    if not tenant_id and settings.TENANT_HOST_SUFFIX:
+        host = connection.headers.get("host", "").split(":", 1)[0].lower()
+        if host.endswith(settings.TENANT_HOST_SUFFIX):
+            tenant_id = host[: -len(settings.TENANT_HOST_SUFFIX)].rstrip(".")
+    return tenant_id or DEFAULT_TENANT_ID
+
+
+def get_current_tenant(
+    connection: HTTPConnection,
+    db: Session = Depends(get_db),
+) -> str:
+    tenant_id = resolve_tenant_id(connection)
+    if tenant_id == DEFAULT_TENANT_ID or known_tenants.get(tenant_id):
+        return tenant_id
+    if not crud.tenant.get(db, id=tenant_id):
+        raise HTTPException(status_code=404, detail="Tenant not found")
+    known_tenants.set(tenant_id, True, settings.TENANT_CACHE_TTL_SECONDS)
+    return tenant_id
+
+
+def require_default_tenant(tenant_id: str = Depends(get_current_tenant)) -> None:
+    """
+    For routes that see or change data shared by every tenant
+    """
+    if tenant_id != DEFAULT_TENANT_ID:
+        raise HTTPException(status_code=403, detail="Only available in the default tenant.")
@@ -1,6 +1,6 @@
 from datetime import datetime, timedelta
 
-import pytz
+from app.core import clock
 
 
 def get_current_timestamp(timedelta_value: timedelta = timedelta(seconds=0)):
@@ -8,18 +8,18 @@ def get_current_timestamp(timedelta_value: timedelta = timedelta(seconds=0)):
     Use this when we need dynamic default parameters
     If you use e.g. datetime.utcnow() as a default parameter, it will be evaluated at runtime and from then on
     will be a static default value. That's probably not what you want.
-    This Depends will generate a new current timestamp each time it's called
+    This Depends will generate a new current timestamp each time it's called,
+    from the request's clock reading (see app.core.clock)
     """
 
     def factory() -> datetime:
-        return datetime.utcnow() + timedelta_value
+        return clock.utcnow() + timedelta_value
 
     return factory
 
 
 def get_current_timezone_timestamp(timedelta_value: timedelta = timedelta(seconds=0)):
     def factory() -> datetime:
-        return datetime.now(tz=pytz.utc) + timedelta_value
+        return clock.now().aware + timedelta_value
 
     return factory
-
@@ -1,43 +1,93 @@
+import uuid
+from dataclasses import replace
+from typing import NamedTuple, Optional
+
 from fastapi import Depends, HTTPException, status
 from jose import jwt
 from pydantic import ValidationError
 from sqlalchemy.orm import Session
 
-from app import crud, models, schemas
+from app import crud, schemas
 from app.core import security
 from app.core.config import settings
+from app.core.principal import Principal, principal_cache
 
+from .auth_backends import Credentials, authentication_chain
 from .db import get_db
-from .oauth_token_from_cookie import reusable_oauth2
+from .tenant import get_current_tenant
 
 
-def get_current_user(
-    db: Session = Depends(get_db),
-    token: str = Depends(reusable_oauth2),
-) -> models.User:
+def _load_principal(
+    db: Session, user_id: uuid.UUID, tenant_id: str, via_api_key: bool = False
+) -> Optional[Principal]:
+    principal = principal_cache.get(user_id)
+    if principal is None:
+        principal = crud.user.get_principal(db, user_id=user_id, tenant_id=tenant_id)
+        if principal is None:
+            return None
+        principal_cache.set(user_id, principal, settings.PRINCIPAL_CACHE_TTL_SECONDS)
+    if principal.tenant_id != tenant_id:
+        return None
+    if via_api_key:
+        principal = replace(principal, via_api_key=True)
+    return principal
+
+
+class Authenticated(NamedTuple):
+    principal: Principal
+    # When the access token runs out, as a Unix timestamp; None for API keys
+    expires_at: Optional[float] = None
+
+
+def authenticate(db: Session, credentials: Credentials, tenant_id: str) -> Authenticated:
+    """
+    Verify the credentials and load who they belong to, or raise 403/404
+    """
+    if credentials.scheme == "api_key":
+        user_id = crud.api_key.authenticate_user_id(db, api_key=credentials.value)
+        # A key only works against its own user's tenant
+        principal = user_id and _load_principal(db, user_id, tenant_id, via_api_key=True)
+        if not principal:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Could not validate credentials",
+            )
+        return Authenticated(principal)
+
     try:
-        payload = jwt.decode(token, settings.JWT_TOKEN_KEY_LOGIN, algorithms=[security.ALGORITHM])
+        payload = jwt.decode(
+            credentials.value, settings.JWT_TOKEN_KEY_LOGIN, algorithms=[security.ALGORITHM]
+        )
         token_data = schemas.TokenPayload(**payload)
-    except (jwt.JWTError, ValidationError):
+        user_id = uuid.UUID(token_data.sub)
+    except (jwt.JWTError, ValidationError, TypeError, ValueError):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         ) from None
-    user = crud.user.get(db, id=token_data.sub)
-    if not user:
+    principal = _load_principal(db, user_id, tenant_id)
+    if not principal:
         raise HTTPException(status_code=404, detail="User not found")
-    return user
+    return Authenticated(principal, payload.get("exp"))
+
+
+def get_current_user(
+    db: Session = Depends(get_db),
+    credentials: Credentials = Depends(authentication_chain),
+    tenant_id: str = Depends(get_current_tenant),
+) -> Principal:
+    return authenticate(db, credentials, tenant_id).principal
 
 
 def get_current_active_user(
-    current_user: models.User = Depends(get_current_user),
-) -> models.User:
+    current_user: Principal = Depends(get_current_user),
+) -> Principal:
     return current_user
 
 
 def get_current_active_superuser(
-    current_user: models.User = Depends(get_current_user),
-) -> models.User:
+    current_user: Principal = Depends(get_current_user),
+) -> Principal:
     if not crud.user.is_superuser(current_user):
         raise HTTPException(status_code=400, detail="The user doesn't have enough privileges")
     return current_user
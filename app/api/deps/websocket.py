@@ -0,0 +1,49 @@
+from typing import AsyncGenerator
+
+from fastapi import HTTPException, WebSocket, WebSocketException
+from starlette.concurrency import run_in_threadpool
+from starlette.status import WS_1008_POLICY_VIOLATION
+
+from app.core import security
+from app.core.websocket_sessions import WebSocketSession, websocket_sessions
+
+from .auth_backends import Credentials, authentication_chain
+from .tenant import get_current_tenant
+from .user import Authenticated, authenticate
+
+
+def _authenticate(websocket: WebSocket, credentials: Credentials) -> Authenticated:
+    # A session of its own rather than deps.get_db's, which would stay
+    # open, holding a connection, for as long as the socket does
+    with websocket_sessions.session_factory() as db:
+        try:
+            tenant_id = get_current_tenant(websocket, db)
+            return authenticate(db, credentials, tenant_id)
+        except HTTPException as e:
+            raise WebSocketException(code=WS_1008_POLICY_VIOLATION, reason=e.detail) from e
+
+
+async def get_websocket_session(websocket: WebSocket) -> AsyncGenerator[WebSocketSession, None]:
+    """
+    Authenticate the handshake, accept it and register the socket for
+    revalidation. A failed handshake is refused with 1008 Policy Violation.
+    """
+    credentials = authentication_chain.extract(websocket)
+    if credentials is None:
+        raise WebSocketException(code=WS_1008_POLICY_VIOLATION, reason="Not authenticated")
+    principal, expires_at = await run_in_threadpool(_authenticate, websocket, credentials)
+    session = websocket_sessions.open(
+        websocket,
+        principal,
+        expires_at=expires_at,
+        api_key_prefix=(
+            security.get_api_key_prefix(credentials.value)
+            if credentials.scheme == "api_key"
+            else None
+        ),
+    )
+    try:
+        await websocket.accept()
+        yield session
+    finally:
+        websocket_sessions.discard(session)
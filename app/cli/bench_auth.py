@@ -0,0 +1,96 @@
+"""
+Compare the cost of resolving the current user per request: loading the
+ORM User, building a Principal from rows, and a Principal cache hit.
+
+Each iteration is one simulated request with its own session, like
+deps.get_db gives an endpoint. Timings and allocations are per request.
+
+    python -m app.cli.bench_auth --users 10000 --requests 5000
+"""
+import argparse
+import random
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app import crud
+from app.core.principal import principal_cache
+from app.db.testing import TemplateDatabase
+from app.models import DEFAULT_TENANT_ID, User
+
+
+def _orm_user(db: Session, user_id) -> object:
+    user = crud.user.get_in_tenant(db, id=user_id, tenant_id=DEFAULT_TENANT_ID)
+    # The roles a permission check or a response would touch
+    return user, list(user.roles)
+
+
+def _principal(db: Session, user_id) -> object:
+    return crud.user.get_principal(db, user_id=user_id, tenant_id=DEFAULT_TENANT_ID)
+
+
+def _cached_principal(db: Session, user_id) -> object:
+    principal = principal_cache.get(user_id)
+    if principal is None:
+        principal = _principal(db, user_id)
+        principal_cache.set(user_id, principal, 3600)
+    return principal
+
+
+def measure(
+    engine, user_ids: List, load: Callable[[Session, object], object]
+) -> Dict[str, float]:
+    # Warm up statement caches, and the principal cache, so the timed run
+    # measures the steady state
+    for user_id in user_ids:
+        with Session(bind=engine) as db:
+            load(db, user_id)
+
+    started = time.perf_counter()
+    for user_id in user_ids:
+        with Session(bind=engine) as db:
+            load(db, user_id)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    sample = user_ids[:500]
+    for user_id in sample:
+        with Session(bind=engine) as db:
+            load(db, user_id)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"us_per_request": elapsed / len(user_ids) * 1e6, "peak_kib": peak / 1024}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--requests", type=int, default=5_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    template = TemplateDatabase(users=args.users, grants={"Admin": 0.5}, seed=args.seed)
+    engine = template.clone()
+    with engine.connect() as connection:
+        all_ids = list(connection.execute(select(User.id)).scalars())
+    rng = random.Random(args.seed)
+    user_ids = [rng.choice(all_ids) for _ in range(args.requests)]
+
+    principal_cache.clear()
+    for name, load in (
+        ("orm user", _orm_user),
+        ("principal", _principal),
+        ("principal, cached", _cached_principal),
+    ):
+        result = measure(engine, user_ids, load)
+        print(
+            f"{name:<18} {result['us_per_request']:8.1f} us/request"
+            f"  peak {result['peak_kib']:8.1f} KiB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Measure what each middleware adds to a request, and what serving
+openapi.json costs with and without precompression.
+
+Each middleware wraps, alone, an endpoint that returns a fixed JSON
+body, and is called directly as an ASGI app with no client or server
+in between. Overheads are the difference from the bare endpoint. The
+request carries a valid session cookie and accepts gzip, as a browser's
+would.
+
+    python -m app.cli.bench_middleware --requests 20000 --body-size 4096
+"""
+import argparse
+import asyncio
+import json
+import time
+from base64 import b64encode
+from typing import Callable, List, Tuple
+
+import itsdangerous
+from fastapi.middleware.gzip import GZipMiddleware
+from starlette.middleware.sessions import SessionMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.admission import AdmissionControlMiddleware, RouteClass
+from app.core.clock import RequestClockMiddleware
+from app.core.compression import CompressionMiddleware
+from app.core.config import settings
+from app.core.openapi import PrecompressedOpenAPI
+from app.core.sessions import LazySessionMiddleware
+from app.db.query_budget import QueryBudgetMiddleware
+from app.main import app as main_app
+
+SECRET_KEY = "benchmark"
+
+
+def endpoint(body_size: int) -> ASGIApp:
+    content = {"data": "x" * body_size}
+
+    async def app(scope: Scope, receive: Receive, send: Send) -> None:
+        await JSONResponse(content)(scope, receive, send)
+
+    return app
+
+
+def request_scope(path: str) -> Scope:
+    session = b64encode(json.dumps({"user": "benchmark"}).encode())
+    cookie = itsdangerous.TimestampSigner(SECRET_KEY).sign(session).decode()
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [
+            (b"host", b"bench"),
+            (b"accept-encoding", b"gzip, deflate, br"),
+            (b"cookie", f"session={cookie}; other=1".encode()),
+        ],
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+
+
+async def measure(app: ASGIApp, scope: Scope, requests: int) -> Tuple[float, int]:
+    """
+    Seconds per request, and the size of the body sent
+    """
+    sent: List[int] = []
+
+    async def receive() -> Message:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message: Message) -> None:
+        if message["type"] == "http.response.body":
+            sent.append(len(message.get("body", b"")))
+
+    for _ in range(min(requests, 1000)):
+        await app(dict(scope), receive, send)
+    sent.clear()
+    started = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    elapsed = time.perf_counter() - started
+    return elapsed / requests, sum(sent) // requests
+
+
+def middlewares() -> List[Tuple[str, Callable[[ASGIApp], ASGIApp]]]:
+    route_class = RouteClass(name="bench", concurrency=64, queue_timeout=1, target_latency=1)
+    return [
+        ("SessionMiddleware", lambda app: SessionMiddleware(app, secret_key=SECRET_KEY)),
+        ("LazySessionMiddleware", lambda app: LazySessionMiddleware(app, secret_key=SECRET_KEY)),
+        ("GZipMiddleware", lambda app: GZipMiddleware(app, minimum_size=1000)),
+        ("CompressionMiddleware", lambda app: CompressionMiddleware(app, minimum_size=1000)),
+        ("QueryBudgetMiddleware", QueryBudgetMiddleware),
+        ("RequestClockMiddleware", RequestClockMiddleware),
+        (
+            "AdmissionControlMiddleware",
+            lambda app: AdmissionControlMiddleware(app, route_classes=[], default=route_class),
+        ),
+    ]
+
+
+async def run(requests: int, body_size: int) -> None:
+    scope = request_scope("/bench")
+    bare, size = await measure(endpoint(body_size), scope, requests)
+    print(f"{'bare endpoint':<28} {bare * 1e6:8.1f} us/request  {size:7d} bytes")
+    for name, wrap in middlewares():
+        wrapped, size = await measure(wrap(endpoint(body_size)), scope, requests)
+        print(f"{name:<28} {(wrapped - bare) * 1e6:+8.1f} us/request  {size:7d} bytes")
+
+    # openapi.json as FastAPI serves it, serialized per request and then
+    # gzipped by the middleware, against the precompressed document
+    openapi_url = f"{settings.API_V1_STR}/openapi.json"
+    scope = request_scope(openapi_url)
+
+    async def serialized(request: Request) -> Response:
+        return JSONResponse(main_app.openapi())
+
+    precompressed = PrecompressedOpenAPI(main_app)
+    precompressed.build()
+    for name, app in (
+        ("openapi.json, per request", GZipMiddleware(Route(openapi_url, serialized).app)),
+        (
+            "openapi.json, precompressed",
+            CompressionMiddleware(Route(openapi_url, precompressed.respond).app),
+        ),
+    ):
+        elapsed, size = await measure(app, scope, max(1, requests // 20))
+        print(f"{name:<28} {elapsed * 1e6:8.1f} us/request  {size:7d} bytes")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--body-size", type=int, default=4096, help="bytes of JSON per response")
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.body_size))
+
+
+if __name__ == "__main__":
+    main()
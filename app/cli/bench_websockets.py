@@ -0,0 +1,153 @@
+"""
+Measure what idle authenticated WebSocket sessions cost a worker:
+memory per socket, handshake throughput, and the timer wheel's work to
+revalidate them all.
+
+Sockets are driven through the ASGI app in-process, with no network in
+between, so the numbers are the app's own: the middleware, the handshake
+authentication and the session each socket holds while idle.
+
+    python -m app.cli.bench_websockets --sockets 20000 --users 1000
+"""
+import argparse
+import asyncio
+import math
+import random
+import time
+import tracemalloc
+from typing import Any, Dict, List
+
+from sqlalchemy import select
+from sqlalchemy.orm import sessionmaker
+
+from app.core import security
+from app.core.config import settings
+from app.core.websocket_sessions import websocket_sessions
+from app.db.testing import TemplateDatabase
+from app.main import app
+from app.models import User
+
+
+class IdleSocket:
+    """
+    A client that completes the handshake, reads the greeting and then
+    sends nothing until told to disconnect
+    """
+
+    def __init__(self, token: str, port: int):
+        self.scope = {
+            "type": "websocket",
+            "asgi": {"version": "3.0"},
+            "scheme": "ws",
+            "path": f"{settings.API_V1_STR}/ws/session",
+            "raw_path": f"{settings.API_V1_STR}/ws/session".encode(),
+            "root_path": "",
+            "query_string": b"",
+            "headers": [(b"host", b"bench"), (b"authorization", f"Bearer {token}".encode())],
+            "client": ("127.0.0.1", port),
+            "server": ("bench", 80),
+            "subprotocols": [],
+        }
+        self.connected = False
+        self.greeted = asyncio.Event()
+        self.closed_with = None
+        self._disconnect = asyncio.Event()
+        self.task = None
+
+    async def receive(self) -> Dict[str, Any]:
+        if not self.connected:
+            self.connected = True
+            return {"type": "websocket.connect"}
+        await self._disconnect.wait()
+        return {"type": "websocket.disconnect", "code": 1000}
+
+    async def send(self, message: Dict[str, Any]) -> None:
+        if message["type"] == "websocket.send":
+            self.greeted.set()
+        elif message["type"] == "websocket.close":
+            self.closed_with = message.get("code")
+            self.greeted.set()
+
+    def start(self) -> None:
+        self.task = asyncio.get_running_loop().create_task(app(self.scope, self.receive, self.send))
+
+    async def disconnect(self) -> None:
+        self._disconnect.set()
+        await self.task
+
+
+async def run(sockets: int, tokens: List[str], concurrency: int) -> None:
+    clients = [IdleSocket(tokens[i % len(tokens)], i) for i in range(sockets)]
+    # One socket first, so module imports and first-call caches aren't
+    # counted against the rest
+    clients[0].start()
+    await clients[0].greeted.wait()
+
+    async def open_all(group: List[IdleSocket]) -> None:
+        for i in range(0, len(group), concurrency):
+            batch = group[i : i + concurrency]
+            for client in batch:
+                client.start()
+            await asyncio.gather(*(client.greeted.wait() for client in batch))
+
+    # Memory on a sample, since tracing allocations slows everything down
+    sample = clients[1 : 1 + min(1000, sockets - 1)]
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    await open_all(sample)
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rest = clients[1 + len(sample) :]
+    started = time.perf_counter()
+    await open_all(rest)
+    elapsed = time.perf_counter() - started
+
+    refused = sum(client.closed_with is not None for client in clients)
+    print(f"{sockets} sockets open ({refused} refused), {len(websocket_sessions.sessions)} sessions")
+    print(f"memory            {(after - before) / len(sample) / 1024:8.1f} KiB per idle socket")
+    if rest:
+        print(f"handshakes        {len(rest) / elapsed:8.0f} /s")
+
+    # What the timer task does for these sockets over one revalidation
+    # interval: its ticks, and a check of every session
+    ticks = math.ceil(websocket_sessions.revalidate_interval / websocket_sessions.wheel.tick)
+    started = time.perf_counter()
+    due = sum(len(websocket_sessions.wheel.advance()) for _ in range(ticks))
+    wheel = time.perf_counter() - started
+    started = time.perf_counter()
+    queries = websocket_sessions.revalidation_queries
+    await websocket_sessions.revalidate(list(websocket_sessions.sessions))
+    revalidation = time.perf_counter() - started
+    print(f"wheel             {wheel * 1000:8.1f} ms for {ticks} ticks, {due} sessions due")
+    print(
+        f"revalidation      {revalidation * 1000:8.1f} ms for every session,"
+        f" {websocket_sessions.revalidation_queries - queries} queries"
+    )
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client.disconnect() for client in clients))
+    print(f"disconnect        {time.perf_counter() - started:8.2f} s for all")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--sockets", type=int, default=20_000)
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--concurrency", type=int, default=100, help="handshakes in flight")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    template = TemplateDatabase(users=args.users, seed=args.seed)
+    engine = template.clone()
+    websocket_sessions.session_factory = sessionmaker(bind=engine)
+    websocket_sessions.max_sessions = max(websocket_sessions.max_sessions, args.sockets)
+    with engine.connect() as connection:
+        user_ids = list(connection.execute(select(User.id)).scalars())
+    random.Random(args.seed).shuffle(user_ids)
+    tokens = [security.create_access_token(user_id) for user_id in user_ids]
+
+    asyncio.run(run(args.sockets, tokens, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
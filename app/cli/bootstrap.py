@@ -0,0 +1,26 @@
+"""
+Create the schema and bring roles and permissions in line with the manifest.
+
+    python -m app.cli.bootstrap [--manifest path/to/manifest.json] [--dry-run]
+"""
+import argparse
+import json
+
+from app.db.bootstrap import bootstrap, load_manifest
+from app.db.session import engine
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--manifest", help="defaults to settings.BOOTSTRAP_MANIFEST_PATH")
+    parser.add_argument(
+        "--dry-run", action="store_true", help="report the changes without applying them"
+    )
+    args = parser.parse_args()
+
+    report = bootstrap(engine, load_manifest(args.manifest), dry_run=args.dry_run)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
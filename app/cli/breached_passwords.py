@@ -0,0 +1,121 @@
+"""
+Build the breached password index used by the password policy.
+
+Input is one entry per line, either a SHA-1 hex digest (optionally
+followed by ":count", as in the Have I Been Pwned downloads) or, with
+--plaintext, the password itself. Lines that aren't a SHA-1 digest, such
+as the NTLM hashes of the other HIBP download, are skipped and counted.
+Input bigger than memory is sorted in chunks to temporary files and
+merged, so any corpus size works.
+
+    python -m app.cli.breached_passwords pwned-passwords-sha1.txt -o breached.idx
+
+Then point BREACHED_PASSWORDS_PATH at the output file.
+"""
+import argparse
+import hashlib
+import heapq
+import os
+import tempfile
+import time
+from typing import IO, Iterator, List, Optional, Tuple
+
+from app.core.password_policy import MAGIC, RECORD_SIZE
+
+
+def _digests(lines: IO[str], plaintext: bool) -> Iterator[Optional[bytes]]:
+    """
+    The digest of each line, or None for a line that isn't one
+    """
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if not line:
+            continue
+        if plaintext:
+            yield hashlib.sha1(line.encode()).digest()
+            continue
+        try:
+            digest = bytes.fromhex(line.split(":", 1)[0])
+        except ValueError:
+            digest = None
+        # A digest of any other size would shift every record after it
+        yield digest if digest is not None and len(digest) == RECORD_SIZE else None
+
+
+def _read_run(f: IO[bytes]) -> Iterator[bytes]:
+    while True:
+        record = f.read(RECORD_SIZE)
+        if not record:
+            return
+        yield record
+
+
+def build_index(
+    input_paths: List[str], output_path: str, *, plaintext: bool = False, chunk_size: int = 10_000_000
+) -> Tuple[int, int]:
+    """
+    Returns how many distinct digests were written and how many input
+    lines were skipped as malformed
+    """
+    runs = []
+    chunk: List[bytes] = []
+    skipped = 0
+
+    def flush_run() -> None:
+        chunk.sort()
+        run = tempfile.TemporaryFile()
+        run.write(b"".join(chunk))
+        run.seek(0)
+        runs.append(run)
+        chunk.clear()
+
+    for path in input_paths:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for digest in _digests(f, plaintext):
+                if digest is None:
+                    skipped += 1
+                    continue
+                chunk.append(digest)
+                if len(chunk) >= chunk_size:
+                    flush_run()
+    if chunk or not runs:
+        flush_run()
+
+    written = 0
+    previous = None
+    temporary_path = output_path + ".tmp"
+    with open(temporary_path, "wb") as out:
+        out.write(MAGIC)
+        for digest in heapq.merge(*(_read_run(run) for run in runs)):
+            if digest != previous:
+                out.write(digest)
+                written += 1
+                previous = digest
+    for run in runs:
+        run.close()
+    # Workers may have the old index mapped; swap the file in atomically
+    os.replace(temporary_path, output_path)
+    return written, skipped
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("inputs", nargs="+")
+    parser.add_argument("-o", "--output", required=True)
+    parser.add_argument(
+        "--plaintext", action="store_true", help="input lines are passwords, not SHA-1 digests"
+    )
+    parser.add_argument("--chunk-size", type=int, default=10_000_000)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    count, skipped = build_index(
+        args.inputs, args.output, plaintext=args.plaintext, chunk_size=args.chunk_size
+    )
+    print(f"Wrote {count} digests to {args.output} in {time.perf_counter() - started:.2f}s")
+    if skipped:
+        print(f"Skipped {skipped} lines that aren't SHA-1 digests")
+
+
+if __name__ == "__main__":
+    main()
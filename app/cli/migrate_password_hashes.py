@@ -0,0 +1,152 @@
+"""
+Check every stored password hash against the registered schemes.
+
+Rows are streamed from users in id order, chunk_size at a time, and parsed
+on a process pool. Progress is checkpointed after every chunk so an
+interrupted run can pick up where it stopped with --resume.
+
+Legacy hashes can only be upgraded with the plain password, so that happens
+in crud.user.authenticate on the next login. This tool reports how many
+users are still on each scheme and lists the hashes no scheme can parse,
+which would otherwise just fail every login.
+
+    python -m app.cli.migrate_password_hashes --workers 8 --invalid-output invalid.ndjson
+"""
+import argparse
+import json
+import os
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from app.core.security import pwd_context
+from app.db.session import engine
+from app.models.user import User
+
+Row = Tuple[str, str]
+
+
+def iter_chunks(chunk_size: int, after_id: Optional[str] = None) -> Iterator[List[Row]]:
+    # Keyset pagination: each chunk is an index range scan on the primary key,
+    # however far into the table we are
+    while True:
+        statement = select(User.id, User.hashed_password).order_by(User.id).limit(chunk_size)
+        if after_id is not None:
+            statement = statement.where(User.id > after_id)
+        with engine.connect() as connection:
+            rows = [(str(id_), hashed) for id_, hashed in connection.execute(statement)]
+        if not rows:
+            return
+        yield rows
+        after_id = rows[-1][0]
+
+
+def check_chunk(rows: List[Row]) -> Tuple[Dict[str, int], List[Dict[str, str]]]:
+    """
+    Count hashes per scheme and collect the ones that can't be used
+    """
+    counts: Counter = Counter()
+    invalid = []
+    for user_id, hashed_password in rows:
+        scheme = pwd_context.identify(hashed_password) if hashed_password else None
+        if scheme is None:
+            counts["unknown"] += 1
+            invalid.append({"id": user_id, "reason": "unknown scheme"})
+            continue
+        try:
+            # Parsing validates salt, rounds and digest, not just the prefix
+            pwd_context.handler(scheme).from_string(hashed_password)
+        except ValueError as e:
+            counts["invalid"] += 1
+            invalid.append({"id": user_id, "reason": f"{scheme}: {e}"})
+            continue
+        counts[scheme] += 1
+        if pwd_context.needs_update(hashed_password):
+            counts["needs_update"] += 1
+    return dict(counts), invalid
+
+
+def load_checkpoint(path: str) -> Dict:
+    if not os.path.exists(path):
+        return {"last_id": None, "rows": 0, "counts": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_checkpoint(path: str, checkpoint: Dict) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+def run(
+    *,
+    chunk_size: int,
+    workers: int,
+    checkpoint_path: str,
+    resume: bool,
+    invalid_output: Optional[str],
+) -> Dict:
+    checkpoint = load_checkpoint(checkpoint_path) if resume else {
+        "last_id": None,
+        "rows": 0,
+        "counts": {},
+    }
+    counts = Counter(checkpoint["counts"])
+    invalid_file = open(invalid_output, "a" if resume else "w") if invalid_output else None
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # Bound the chunks in flight so memory stays flat, and complete
+            # them in submission order so the checkpoint only ever moves past
+            # rows that have been fully processed
+            in_flight = deque()
+
+            def complete_oldest():
+                last_id, size, future = in_flight.popleft()
+                chunk_counts, invalid = future.result()
+                counts.update(chunk_counts)
+                if invalid_file:
+                    invalid_file.writelines(json.dumps(row) + "\n" for row in invalid)
+                    invalid_file.flush()
+                checkpoint.update(
+                    last_id=last_id, rows=checkpoint["rows"] + size, counts=dict(counts)
+                )
+                save_checkpoint(checkpoint_path, checkpoint)
+
+            for rows in iter_chunks(chunk_size, after_id=checkpoint["last_id"]):
+                in_flight.append((rows[-1][0], len(rows), pool.submit(check_chunk, rows)))
+                if len(in_flight) >= workers * 2:
+                    complete_oldest()
+            while in_flight:
+                complete_oldest()
+    finally:
+        if invalid_file:
+            invalid_file.close()
+    return checkpoint
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--checkpoint", default="password_hash_migration.checkpoint.json")
+    parser.add_argument("--resume", action="store_true", help="continue from the checkpoint")
+    parser.add_argument("--invalid-output", help="NDJSON file listing unusable hashes")
+    args = parser.parse_args()
+
+    checkpoint = run(
+        chunk_size=args.chunk_size,
+        workers=args.workers,
+        checkpoint_path=args.checkpoint,
+        resume=args.resume,
+        invalid_output=args.invalid_output,
+    )
+    print(json.dumps({"rows": checkpoint["rows"], "counts": checkpoint["counts"]}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""
+Run the API in production: a master process and forked uvicorn workers
+sharing one listening socket.
+
+The master imports the app, configures the ORM mappers and builds the
+OpenAPI document before forking, then freezes the garbage collector so
+that what it loaded stays shared copy-on-write between the workers
+instead of being copied into each one. Workers default to one per CPU
+this process may run on, use uvloop and httptools when they're
+installed, and each get a threadpool of --threads for sync endpoints
+and dependencies.
+
+The master restarts workers that die. On SIGHUP it replaces them one at
+a time, each only after its replacement is serving, so a restart never
+leaves the socket without workers. With --no-preload, workers import the
+app themselves, which is slower but lets a SIGHUP pick up new code.
+Settings are always loaded by the master, so every worker shares them,
+including secrets generated because they weren't configured; changing
+them takes a full restart.
+SIGTERM or SIGINT stops everything gracefully.
+
+Each worker reports when it's ready to serve, and the master logs how
+long it took to boot.
+
+    python -m app.cli.serve --port 8000
+    python -m app.cli.serve --workers 8 --threads 20
+"""
+import argparse
+import gc
+import importlib.util
+import json
+import logging
+import os
+import select
+import signal
+import socket
+import sys
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger("app.cli.serve")
+
+
+def default_workers() -> int:
+    if "WEB_CONCURRENCY" in os.environ:
+        return int(os.environ["WEB_CONCURRENCY"])
+    try:
+        # The CPUs this process may run on, e.g. limited by a container
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # pragma: no cover - not Linux
+        return os.cpu_count() or 1
+
+
+def fastest(*candidates: str, default: str) -> str:
+    for module in candidates:
+        if importlib.util.find_spec(module) is not None:
+            return module
+    return default
+
+
+def preload() -> Any:
+    from sqlalchemy.orm import configure_mappers
+
+    from app.db.session import engine
+    from app.main import app, openapi
+
+    configure_mappers()
+    openapi.build()
+    # Connections must never cross a fork
+    engine.dispose()
+    return app
+
+
+@dataclass
+class Worker:
+    pid: int
+    forked_at: float
+    ready: Optional[Dict[str, Any]] = None
+    # Told to exit, so its exit is expected
+    terminating: bool = False
+
+
+class Master:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.loop = fastest("uvloop", default="asyncio")
+        self.http = fastest("httptools", default="h11")
+        self.app = None
+        self.workers: Dict[int, Worker] = {}
+        self.stopping = False
+        self.restart_requested = False
+        self.socket = socket.create_server(
+            (args.host, args.port), backlog=args.backlog, reuse_port=False
+        )
+        self.socket.set_inheritable(True)
+        # Workers say they're ready on this pipe, a line of JSON each; lines
+        # under PIPE_BUF bytes are written atomically
+        self._ready_read, self._ready_write = os.pipe()
+
+    def run(self) -> None:
+        # Even without preloading, settings are loaded here, once: secrets
+        # left unset are generated at import, and workers that each made
+        # their own would reject each other's tokens, cookies and API keys
+        import app.core.config  # noqa: F401
+
+        if self.args.preload:
+            started = time.perf_counter()
+            self.app = preload()
+            gc.collect()
+            # Whatever is loaded now is never scanned by the collector, so
+            # workers don't write to, and copy, the pages it lives on
+            gc.freeze()
+            logger.info("Preloaded the app in %.2fs", time.perf_counter() - started)
+
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGHUP, self._request_restart)
+        logger.info(
+            "Serving on %s:%d with %d workers (%s, %s, %d threads each)",
+            self.args.host,
+            self.args.port,
+            self.args.workers,
+            self.loop,
+            self.http,
+            self.args.threads,
+        )
+        started = time.monotonic()
+        for _ in range(self.args.workers):
+            self.spawn()
+        booting = True
+
+        while not self.stopping:
+            self.poll(1.0)
+            if booting and all(worker.ready for worker in self.workers.values()):
+                booting = False
+                self.report(time.monotonic() - started)
+            if self.restart_requested:
+                self.restart_requested = False
+                self.rolling_restart()
+            # Replace workers that died
+            while not self.stopping and len(self.workers) < self.args.workers:
+                self.spawn()
+                time.sleep(self.args.respawn_delay)
+
+        self.shutdown()
+
+    def spawn(self) -> Worker:
+        pid = os.fork()
+        if pid == 0:
+            os.close(self._ready_read)
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                signal.signal(sig, signal.SIG_DFL)
+            # A terminal hangup reaches the whole process group; only the
+            # master acts on it
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            code = 0
+            try:
+                self.serve()
+            except BaseException:  # noqa: BLE001 - the master restarts us
+                logger.exception("Worker %d failed", os.getpid())
+                code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+        worker = Worker(pid=pid, forked_at=time.monotonic())
+        self.workers[pid] = worker
+        return worker
+
+    def serve(self) -> None:
+        """
+        The worker's side of a fork
+        """
+        import asyncio
+
+        import anyio.to_thread
+        import uvicorn
+
+        forked_at = time.monotonic()
+        if self.app is None:
+            from app.main import app
+        else:
+            from app.db.session import engine
+
+            # Leave any pooled connections to the master rather than
+            # closing them under it
+            engine.dispose(close=False)
+            app = self.app
+        config = uvicorn.Config(
+            app,
+            loop=self.loop,
+            http=self.http,
+            proxy_headers=self.args.proxy_headers,
+            forwarded_allow_ips=self.args.forwarded_allow_ips,
+            timeout_keep_alive=self.args.keep_alive,
+            timeout_graceful_shutdown=self.args.graceful_timeout,
+            log_level=self.args.log_level,
+            access_log=self.args.access_log,
+        )
+        server = uvicorn.Server(config)
+
+        async def serve() -> None:
+            anyio.to_thread.current_default_thread_limiter().total_tokens = self.args.threads
+            serving = asyncio.create_task(server.serve(sockets=[self.socket]))
+            # started is set once the lifespan startup has run and the
+            # socket is being served
+            while not server.started and not serving.done():
+                await asyncio.sleep(0.01)
+            if server.started:
+                report = {
+                    "pid": os.getpid(),
+                    "boot_seconds": round(time.monotonic() - forked_at, 3),
+                    "loop": self.loop,
+                    "http": self.http,
+                    "threads": self.args.threads,
+                }
+                os.write(self._ready_write, (json.dumps(report) + "\n").encode())
+            await serving
+
+        config.setup_event_loop()
+        asyncio.run(serve())
+
+    def poll(self, timeout: float) -> None:
+        """
+        Read readiness reports and reap workers that exited, waiting up to
+        timeout for something to happen
+        """
+        readable, _, _ = select.select([self._ready_read], [], [], timeout)
+        if readable:
+            for line in os.read(self._ready_read, 65536).decode().splitlines():
+                report = json.loads(line)
+                worker = self.workers.get(report["pid"])
+                if worker is not None:
+                    worker.ready = report
+                logger.info(
+                    "Worker %d ready in %.3fs", report["pid"], report["boot_seconds"]
+                )
+        while self.workers:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                break
+            worker = self.workers.pop(pid, None)
+            if worker is not None and not worker.terminating and not self.stopping:
+                logger.warning(
+                    "Worker %d exited with status %d", pid, os.waitstatus_to_exitcode(status)
+                )
+
+    def report(self, elapsed: float) -> None:
+        boot_seconds = sorted(worker.ready["boot_seconds"] for worker in self.workers.values())
+        logger.info(
+            "All %d workers ready %.2fs after the first fork; boot times %s",
+            len(boot_seconds),
+            elapsed,
+            ", ".join(f"{seconds:.3f}s" for seconds in boot_seconds),
+        )
+
+    def rolling_restart(self) -> None:
+        logger.info("Restarting %d workers one at a time", len(self.workers))
+        for old in list(self.workers.values()):
+            if self.stopping:
+                return
+            new = self.spawn()
+            deadline = time.monotonic() + self.args.boot_timeout
+            while new.ready is None and new.pid in self.workers and time.monotonic() < deadline:
+                self.poll(0.1)
+            if new.ready is None:
+                # Keep the old worker rather than leave its place empty
+                logger.error("Worker %d didn't become ready; stopping the restart", new.pid)
+                self.terminate(new)
+                return
+            self.terminate(old)
+
+    def terminate(self, worker: Worker) -> None:
+        """
+        Ask a worker to finish its requests and exit, and kill it if it
+        hasn't within the graceful timeout
+        """
+        worker.terminating = True
+        try:
+            os.kill(worker.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        deadline = time.monotonic() + self.args.graceful_timeout + 5
+        while worker.pid in self.workers and time.monotonic() < deadline:
+            self.poll(0.1)
+        if worker.pid in self.workers:
+            os.kill(worker.pid, signal.SIGKILL)
+            os.waitpid(worker.pid, 0)
+            self.workers.pop(worker.pid, None)
+
+    def shutdown(self) -> None:
+        logger.info("Stopping %d workers", len(self.workers))
+        for worker in list(self.workers.values()):
+            try:
+                os.kill(worker.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + self.args.graceful_timeout + 5
+        while self.workers and time.monotonic() < deadline:
+            self.poll(0.1)
+        for worker in list(self.workers.values()):
+            os.kill(worker.pid, signal.SIGKILL)
+        self.socket.close()
+
+    def _stop(self, signum, frame) -> None:
+        self.stopping = True
+
+    def _request_restart(self, signum, frame) -> None:
+        self.restart_requested = True
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--workers", type=int, default=default_workers(), help="default: WEB_CONCURRENCY or CPUs"
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=40,
+        help="per worker, for sync endpoints and dependencies; beyond the "
+        "database pool's size they only queue for connections",
+    )
+    parser.add_argument(
+        "--no-preload",
+        dest="preload",
+        action="store_false",
+        help="import the app in each worker instead of once in the master",
+    )
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--keep-alive", type=int, default=5, help="seconds")
+    parser.add_argument(
+        "--graceful-timeout", type=int, default=30, help="seconds a stopping worker gets"
+    )
+    parser.add_argument(
+        "--boot-timeout", type=float, default=60, help="seconds a new worker gets to become ready"
+    )
+    parser.add_argument("--respawn-delay", type=float, default=1.0, help="seconds")
+    parser.add_argument("--proxy-headers", action="store_true")
+    parser.add_argument("--forwarded-allow-ips", default=None)
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--no-access-log", dest="access_log", action="store_false")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(message)s")
+    Master(args).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import asyncio
+import json
+import math
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after: int):
+        self.retry_after = retry_after
+
+
+@dataclass
+class RouteClass:
+    """
+    A group of routes sharing one concurrency limit, e.g. everything that
+    hashes a password. Requests over the limit wait at most queue_timeout
+    seconds for a slot (and only max_queue of them wait at all) before they
+    are shed.
+    """
+
+    name: str
+    concurrency: int
+    queue_timeout: float
+    target_latency: float
+    max_queue: int = 1000
+    min_concurrency: int = 1
+    max_concurrency: Optional[int] = None
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit for one route class.
+
+    Every completed request adds 1/limit to the limit while latency stays
+    under target, so the limit grows by about one per limit's worth of
+    requests, and cuts it by 10% when latency overshoots. Under a storm
+    of slow requests the limit shrinks towards what the backend can
+    actually serve, so queues (and Little's law wait times) stay short.
+    """
+
+    def __init__(self, route_class: RouteClass):
+        self.route_class = route_class
+        self.limit = float(route_class.concurrency)
+        self.min_limit = route_class.min_concurrency
+        self.max_limit = route_class.max_concurrency or route_class.concurrency * 4
+        self.in_flight = 0
+        self.average_latency = route_class.target_latency
+        self._waiters: Deque[asyncio.Future] = deque()
+
+        self.admitted = 0
+        self.shed = 0
+
+    async def acquire(self) -> None:
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.route_class.max_queue:
+            self._reject()
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.route_class.queue_timeout)
+        except BaseException as e:
+            # Timed out, or cancelled by a client disconnect or shutdown
+            if waiter.done():
+                # Granted a slot just as we gave up; give it back
+                self.release(None)
+            else:
+                waiter.cancel()
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject()
+            raise
+        self.admitted += 1
+
+    def release(self, latency: Optional[float]) -> None:
+        self.in_flight -= 1
+        if latency is not None:
+            self.average_latency += 0.1 * (latency - self.average_latency)
+            if latency > self.route_class.target_latency:
+                self.limit = max(self.min_limit, self.limit * 0.9)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        # Hand freed slots straight to waiters so new arrivals can't barge in
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def retry_after(self) -> int:
+        # Little's law: the queue drains at about limit / latency requests per second
+        backlog = len(self._waiters) + self.in_flight
+        return max(1, math.ceil(backlog * self.average_latency / max(self.limit, 1)))
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "average_latency": round(self.average_latency, 4),
+            "admitted": self.admitted,
+            "shed": self.shed,
+        }
+
+    def _reject(self) -> None:
+        self.shed += 1
+        raise Overloaded(self.retry_after())
+
+
+Matcher = Callable[[str, str], bool]
+
+
+class AdmissionControlMiddleware:
+    """
+    Fail fast instead of queueing without bound in the threadpool.
+
+    Each HTTP request is assigned to the first route class whose matcher
+    accepts its (method, path), or to the default class. Password hashing
+    routes get their own small limit, so a login storm sheds logins with
+    503 + Retry-After instead of slowing down every other route.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        route_classes: List[Tuple[Matcher, RouteClass]],
+        default: RouteClass,
+    ):
+        self.app = app
+        # One limiter per route class, shared by all of the class's matchers
+        limiters: Dict[int, AdaptiveLimiter] = {}
+        for _, rc in route_classes:
+            limiters.setdefault(id(rc), AdaptiveLimiter(rc))
+        self.route_classes = [(matcher, limiters[id(rc)]) for matcher, rc in route_classes]
+        self.default = limiters.get(id(default)) or AdaptiveLimiter(default)
+
+    def limiter_for(self, method: str, path: str) -> AdaptiveLimiter:
+        for matcher, limiter in self.route_classes:
+            if matcher(method, path):
+                return limiter
+        return self.default
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        limiters = [limiter for _, limiter in self.route_classes] + [self.default]
+        return {limiter.route_class.name: limiter.stats() for limiter in dict.fromkeys(limiters)}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        limiter = self.limiter_for(scope["method"], scope["path"])
+        try:
+            await limiter.acquire()
+        except Overloaded as e:
+            await self._send_overloaded(send, e.retry_after)
+            return
+
+        started = time.perf_counter()
+        latency = None
+        try:
+            await self.app(scope, receive, send)
+            latency = time.perf_counter() - started
+        finally:
+            # Failed requests don't say much about capacity; free the slot
+            # without moving the limit
+            limiter.release(latency)
+
+    @staticmethod
+    async def _send_overloaded(send: Send, retry_after: int) -> None:
+        body = json.dumps({"detail": "Server is overloaded, please retry later."}).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(retry_after).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+
+def route_matcher(method: str, path: str, prefix: bool = False) -> Matcher:
+    def matches(request_method: str, request_path: str) -> bool:
+        if request_method != method:
+            return False
+        if prefix:
+            return request_path.startswith(path)
+        return request_path == path or request_path == path.rstrip("/")
+
+    return matches
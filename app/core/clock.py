@@ -0,0 +1,115 @@
+"""
+Request-scoped clock.
+
+RequestClockMiddleware reads the clock once when a request arrives, and
+everything that asks for the time while serving it (timestamp
+dependencies, token expiry, ORM column defaults, auth events) gets that
+same reading. A request's timestamps then agree with each other, and
+the clock is read once instead of once per caller.
+
+Outside a request, e.g. in CLIs and background threads, every call
+reads the clock afresh.
+
+freeze() pins the clock for every thread, so tests and benchmarks are
+deterministic:
+
+    with clock.freeze(datetime(2024, 1, 1)):
+        ...
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Iterator, Optional
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+
+@dataclass(frozen=True)
+class Instant:
+    # Naive UTC, as the database columns store it
+    wall: datetime
+    monotonic: float
+
+    @property
+    def aware(self) -> datetime:
+        return self.wall.replace(tzinfo=timezone.utc)
+
+    @property
+    def timestamp(self) -> float:
+        return self.aware.timestamp()
+
+
+_request_instant: ContextVar[Optional[Instant]] = ContextVar("request_instant", default=None)
+_frozen: Optional[Instant] = None
+
+
+def read() -> Instant:
+    """
+    A new reading of the clock, ignoring the request's
+    """
+    if _frozen is not None:
+        return _frozen
+    return Instant(
+        wall=datetime.now(timezone.utc).replace(tzinfo=None),
+        monotonic=time.monotonic(),
+    )
+
+
+def now() -> Instant:
+    return _request_instant.get() or read()
+
+
+def utcnow() -> datetime:
+    """
+    Drop-in replacement for datetime.utcnow, e.g. as a column default
+    """
+    return now().wall
+
+
+def timestamp() -> float:
+    return now().timestamp
+
+
+@contextmanager
+def request_clock() -> Iterator[Instant]:
+    instant = read()
+    token = _request_instant.set(instant)
+    try:
+        yield instant
+    finally:
+        _request_instant.reset(token)
+
+
+@contextmanager
+def freeze(at: Optional[datetime] = None) -> Iterator[Instant]:
+    """
+    Stop the clock at `at` (naive UTC, or aware) or at the current time
+    """
+    global _frozen
+    if at is None:
+        instant = read()
+    else:
+        if at.tzinfo is not None:
+            at = at.astimezone(timezone.utc).replace(tzinfo=None)
+        instant = Instant(wall=at, monotonic=time.monotonic())
+    previous, _frozen = _frozen, instant
+    try:
+        yield instant
+    finally:
+        _frozen = previous
+
+
+class RequestClockMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        # Not WebSockets: they stay open for hours, and a reading taken at
+        # the handshake would soon be wrong
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with request_clock():
+            await self.app(scope, receive, send)
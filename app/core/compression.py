@@ -0,0 +1,79 @@
+"""
+Gzip compression of responses, decided from their headers alone.
+
+Starlette's GZipMiddleware holds back the first chunk of every response
+to see whether the body reaches minimum_size. CompressionMiddleware
+decides as soon as the response starts, from its headers:
+
+- It skips responses that are already encoded or aren't a compressible
+  type.
+- It skips responses whose Content-Length is under minimum_size.
+- It compresses everything else as it streams, with no buffering.
+  Streamed responses without a Content-Length are flushed chunk by
+  chunk, so a client sees each chunk as soon as it's sent.
+
+HEAD requests, and responses that have no body, pass through untouched.
+"""
+import zlib
+from typing import Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+COMPRESSIBLE_TYPES: Tuple[str, ...] = (
+    "text/",
+    "application/json",
+    "application/problem+json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+)
+
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp, minimum_size: int = 500, compresslevel: int = 6):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.compresslevel = compresslevel
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or scope["method"] == "HEAD"
+            or "gzip" not in Headers(scope=scope).get("accept-encoding", "")
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        compressor = None
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal compressor
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                if self.should_compress(message["status"], headers):
+                    # wbits over 16 writes a gzip header and trailer
+                    compressor = zlib.compressobj(
+                        self.compresslevel, zlib.DEFLATED, 16 + zlib.MAX_WBITS
+                    )
+                    del headers["content-length"]
+                    headers["content-encoding"] = "gzip"
+                    headers.add_vary_header("Accept-Encoding")
+            elif message["type"] == "http.response.body" and compressor is not None:
+                more_body = message.get("more_body", False)
+                body = compressor.compress(message.get("body", b""))
+                body += compressor.flush(zlib.Z_SYNC_FLUSH if more_body else zlib.Z_FINISH)
+                message = {"type": "http.response.body", "body": body, "more_body": more_body}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    def should_compress(self, status: int, headers: Headers) -> bool:
+        if status < 200 or status in (204, 304):
+            return False
+        if "content-encoding" in headers:
+            return False
+        if not headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES):
+            return False
+        content_length = headers.get("content-length")
+        return content_length is None or int(content_length) >= self.minimum_size
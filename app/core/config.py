@@ -1,9 +1,11 @@
+import os
 import secrets
+from pathlib import Path
 from pydantic import (
     AnyHttpUrl,
     BaseSettings,
 )
-from typing import List
+from typing import List, Optional
 
 
 class Settings(BaseSettings):
@@ -18,10 +20,115 @@ class Settings(BaseSettings):
     JWT_TOKEN_KEY_SECURE: str = secrets.token_urlsafe(32)
     SQLALCHEMY_DATABASE_URI: str = "sqlite:///./data.db"
     SQLALCHEMY_TESTING_DATABASE_URI :str = "sqlite:///./test_data.db"
+    # Roles and permissions applied by app.db.bootstrap
+    BOOTSTRAP_MANIFEST_PATH: str = str(Path(__file__).parent.parent / "db" / "manifest.json")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 8
     ACCESS_TOKEN_SECURE_EXPIRE_MINUTES: int = 60 * 24
     COOKIE_TOKEN_NAME: str = "api_access_token"
     COOKIE_TOKEN_SECURE_NAME: str = "secure_access_token"
+    # Requests name their tenant in this header, or as a subdomain of
+    # TENANT_HOST_SUFFIX (e.g. acme.auth.example.com for ".auth.example.com");
+    # neither means the default tenant
+    TENANT_HEADER_NAME: str = "X-Tenant-ID"
+    TENANT_HOST_SUFFIX: Optional[str] = None
+    TENANT_CACHE_TTL_SECONDS: int = 300
+    TENANT_CACHE_SIZE: int = 10_000
+    PASSWORD_MIN_LENGTH: int = 8
+    # Passwords expire this many days after they're set, and then have to
+    # be changed through /login-and-update; they never expire when unset,
+    # even if expiries were stamped while it was set
+    PASSWORD_MAX_AGE_DAYS: Optional[int] = None
+    # Sorted SHA-1 index built with app.cli.breached_passwords; no breach
+    # check when unset
+    BREACHED_PASSWORDS_PATH: Optional[str] = None
+    # API keys are stored as HMAC-SHA256 digests keyed with this secret
+    API_KEY_HMAC_SECRET: str = secrets.token_urlsafe(32)
+    API_KEY_PREFIX: str = "uak"
+    API_KEY_HEADER_NAME: str = "X-API-Key"
+    # Authenticated principals are cached per process for this long, so a
+    # deleted user or a changed grant may take this long to show up in
+    # other workers
+    PRINCIPAL_CACHE_TTL_SECONDS: float = 5
+    PRINCIPAL_CACHE_SIZE: int = 100_000
+    # Verified token claims are cached until the token expires, but never
+    # for longer than this, so role changes show up within the TTL
+    INTROSPECTION_CACHE_TTL_SECONDS: int = 60
+    INTROSPECTION_CACHE_SIZE: int = 100_000
+    INTROSPECTION_MAX_BATCH_SIZE: int = 1000
+
+    # Email verification and password reset links carry HMAC-signed tokens
+    ACTION_TOKEN_HMAC_SECRET: str = secrets.token_urlsafe(32)
+    EMAIL_VERIFY_TOKEN_EXPIRE_HOURS: int = 48
+    EMAIL_RESET_TOKEN_EXPIRE_HOURS: int = 1
+    EMAIL_VERIFY_URL: str = "http://localhost:3000/verify-email?token={token}"
+    EMAIL_RESET_URL: str = "http://localhost:3000/reset-password?token={token}"
+    EMAILS_FROM: str = "noreply@example.com"
+
+    # Outgoing mail is queued in memory and delivered by a background
+    # thread: "ndjson" appends to a local file, "smtp" relays to SMTP_HOST
+    EMAIL_SINK: str = "ndjson"
+    EMAIL_NDJSON_PATH: str = "./outbox.ndjson"
+    EMAIL_QUEUE_SIZE: int = 100_000
+    EMAIL_BATCH_SIZE: int = 1000
+    EMAIL_FLUSH_INTERVAL_SECONDS: float = 1.0
+    SMTP_HOST: Optional[str] = None
+    SMTP_PORT: int = 587
+    SMTP_TLS: bool = True
+    SMTP_USER: Optional[str] = None
+    SMTP_PASSWORD: Optional[str] = None
+
+    # Auth event pipeline: "database" writes to the auth_events table,
+    # "ndjson" appends to a size-rotated file
+    AUTH_EVENTS_SINK: str = "database"
+    AUTH_EVENTS_NDJSON_PATH: str = "./auth_events.ndjson"
+    AUTH_EVENTS_NDJSON_MAX_BYTES: int = 64 * 1024 * 1024
+    AUTH_EVENTS_NDJSON_BACKUP_COUNT: int = 5
+    AUTH_EVENTS_BUFFER_SIZE: int = 10_000
+    AUTH_EVENTS_BATCH_SIZE: int = 500
+    AUTH_EVENTS_FLUSH_INTERVAL_SECONDS: float = 1.0
+    # Older events are purged by the scheduler; kept forever when unset
+    AUTH_EVENTS_RETENTION_DAYS: Optional[int] = 365
+    # Revoked and expired API keys are kept this long, then purged
+    API_KEY_RETENTION_DAYS: int = 30
+
+    # Background maintenance (app.db.maintenance). One worker at a time
+    # holds the lock file and runs the jobs, each in chunks, working at
+    # most SCHEDULER_DUTY_CYCLE of the time
+    SCHEDULER_ENABLED: bool = True
+    SCHEDULER_LOCK_PATH: str = "./scheduler.lock"
+    SCHEDULER_DUTY_CYCLE: float = 0.2
+    SCHEDULER_CHUNK_SIZE: int = 1000
+    SCHEDULER_SWEEP_INTERVAL_SECONDS: float = 300
+    SCHEDULER_CHECKPOINT_INTERVAL_SECONDS: float = 60
+    SCHEDULER_OPTIMIZE_INTERVAL_SECONDS: float = 6 * 3600
+
+    # WebSockets authenticate once, at the handshake (see
+    # app.core.websocket_sessions). Their users and API keys are checked
+    # again every WEBSOCKET_REVALIDATE_INTERVAL_SECONDS, so a revoked key
+    # or deleted user keeps its sockets for up to that long
+    WEBSOCKET_REVALIDATE_INTERVAL_SECONDS: float = 60
+    WEBSOCKET_TIMER_TICK_SECONDS: float = 1
+    WEBSOCKET_TIMER_SLOTS: int = 512
+    WEBSOCKET_REVALIDATE_BATCH_SIZE: int = 500
+    # Per worker; further handshakes are refused with 1013 Try Again Later
+    WEBSOCKET_MAX_SESSIONS: int = 50_000
+
+    # Admission control. Password hashing routes are CPU bound, so running
+    # more of them at once than there are cores only adds queueing
+    ADMISSION_CONTROL_ENABLED: bool = True
+    ADMISSION_PASSWORD_CONCURRENCY: int = os.cpu_count() or 1
+    ADMISSION_PASSWORD_QUEUE_TIMEOUT_SECONDS: float = 2.0
+    ADMISSION_PASSWORD_TARGET_LATENCY_SECONDS: float = 0.5
+    ADMISSION_DEFAULT_CONCURRENCY: int = 64
+    ADMISSION_DEFAULT_QUEUE_TIMEOUT_SECONDS: float = 0.5
+    ADMISSION_DEFAULT_TARGET_LATENCY_SECONDS: float = 0.1
+
+    # Per-request SQL accounting. Strict mode fails requests that go over
+    # their budget or repeat a statement too often; otherwise they're logged
+    QUERY_BUDGET_STRICT: bool = False
+    QUERY_BUDGET_DEFAULT: Optional[int] = None
+    QUERY_REPEAT_THRESHOLD: int = 10
+    QUERY_STATS_MAX_FINGERPRINTS: int = 1000
 
 
 settings = Settings()
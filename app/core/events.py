@@ -0,0 +1,186 @@
+import json
+import logging
+import os
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from app.core import clock
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseEventSink:
+    """
+    Bulk-inserts a batch of events into the auth_events table
+    with a single executemany per batch
+    """
+
+    def write(self, events: List[Dict[str, Any]]) -> None:
+        from app.db.session import engine
+        from app.models import AuthEvent
+
+        with engine.begin() as connection:
+            connection.execute(AuthEvent.__table__.insert(), events)
+
+
+class NDJSONEventSink:
+    """
+    Appends a batch of events to a newline-delimited JSON file,
+    rotating it to path.1 ... path.N once it grows past max_bytes
+    """
+
+    def __init__(self, path: str, max_bytes: int, backup_count: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+
+    def write(self, events: List[Dict[str, Any]]) -> None:
+        payload = "".join(json.dumps(event, default=str) + "\n" for event in events)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(payload)
+            size = f.tell()
+        if size >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self) -> None:
+        for i in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{i}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+
+class AuthEventPipeline:
+    """
+    Collects auth events from the request path without touching the database.
+
+    Endpoints call emit(), which only appends to a bounded in-memory buffer.
+    A background thread drains the buffer in batches into the sink. When the
+    buffer is full new events are dropped and counted rather than blocking
+    the request that produced them.
+    """
+
+    def __init__(
+        self,
+        sink,
+        capacity: int,
+        batch_size: int,
+        flush_interval: float,
+    ):
+        self.sink = sink
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._buffer: Deque[Dict[str, Any]] = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.emitted = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+
+    def emit(
+        self,
+        event_type: str,
+        *,
+        user_id=None,
+        actor_user_id=None,
+        ip_address: Optional[str] = None,
+        **detail: Any,
+    ) -> bool:
+        event = {
+            "occurred_at": clock.utcnow(),
+            "event_type": event_type,
+            "user_id": user_id,
+            "actor_user_id": actor_user_id,
+            "ip_address": ip_address,
+            "detail": json.dumps(detail, default=str) if detail else None,
+        }
+        with self._lock:
+            if len(self._buffer) >= self.capacity:
+                self.dropped += 1
+                return False
+            self._buffer.append(event)
+            self.emitted += 1
+            if len(self._buffer) >= self.batch_size:
+                self._wakeup.set()
+        return True
+
+    def flush(self) -> None:
+        while True:
+            with self._lock:
+                if not self._buffer:
+                    return
+                batch = [
+                    self._buffer.popleft()
+                    for _ in range(min(self.batch_size, len(self._buffer)))
+                ]
+            try:
+                self.sink.write(batch)
+            except Exception:
+                # The events are lost either way; don't let a broken sink
+                # take the writer thread down with it
+                logger.exception("Failed to write %d auth events", len(batch))
+                self.failed += len(batch)
+            else:
+                self.written += len(batch)
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="auth-event-writer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "buffered": len(self._buffer),
+            "capacity": self.capacity,
+            "emitted": self.emitted,
+            "dropped": self.dropped,
+            "written": self.written,
+            "failed": self.failed,
+        }
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+def _create_sink():
+    if settings.AUTH_EVENTS_SINK == "ndjson":
+        return NDJSONEventSink(
+            settings.AUTH_EVENTS_NDJSON_PATH,
+            max_bytes=settings.AUTH_EVENTS_NDJSON_MAX_BYTES,
+            backup_count=settings.AUTH_EVENTS_NDJSON_BACKUP_COUNT,
+        )
+    return DatabaseEventSink()
+
+
+auth_events = AuthEventPipeline(
+    _create_sink(),
+    capacity=settings.AUTH_EVENTS_BUFFER_SIZE,
+    batch_size=settings.AUTH_EVENTS_BATCH_SIZE,
+    flush_interval=settings.AUTH_EVENTS_FLUSH_INTERVAL_SECONDS,
+)
@@ -0,0 +1,150 @@
+"""
+RFC 7662 style token introspection.
+
+Verified claims are cached by the SHA-256 of the token until the token
+expires, capped at INTROSPECTION_CACHE_TTL_SECONDS. A gateway asking
+about the same session over and over costs one dictionary lookup. Cache
+misses in a batch are resolved together, with one query each for users,
+grants and effective permissions however many tokens there are.
+
+Claims are not invalidated when grants change, so a role change shows up
+in introspection results within INTROSPECTION_CACHE_TTL_SECONDS. API
+keys are cached no longer than until they expire, and cached ones are
+checked for revocation on every call, with one query for all of a
+batch's keys, so a revoked key turns inactive at once in every worker.
+"""
+import hashlib
+import uuid
+from collections import defaultdict
+from datetime import timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from jose import jwt
+from sqlalchemy.orm import Session
+
+from app import crud
+from app.core import clock, security
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.models import Role, UsersRole
+
+Claims = Dict[str, Any]
+
+INACTIVE: Claims = {"active": False}
+
+claims_cache: TTLCache[Claims] = TTLCache(settings.INTROSPECTION_CACHE_SIZE)
+
+
+def _cache_key(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+
+def _verify(db: Session, token: str) -> Optional[Tuple[uuid.UUID, Optional[int], str]]:
+    """
+    Check the token's signature and expiry, or the API key's hash, and
+    return (user id, exp, token type)
+    """
+    if security.get_api_key_prefix(token) is not None:
+        key = crud.api_key.verify(db, api_key=token)
+        if key is None:
+            return None
+        exp = None
+        if key.expires_at is not None:
+            exp = int(key.expires_at.replace(tzinfo=timezone.utc).timestamp())
+        return key.user_id, exp, "api_key"
+    try:
+        payload = jwt.decode(token, settings.JWT_TOKEN_KEY_LOGIN, algorithms=[security.ALGORITHM])
+        return uuid.UUID(payload["sub"]), payload.get("exp"), "access_token"
+    except (jwt.JWTError, KeyError, ValueError):
+        return None
+
+
+def _load_claims(db: Session, user_ids: List[uuid.UUID]) -> Dict[uuid.UUID, Claims]:
+    users = crud.user.get_multiple(db, user_ids=user_ids)
+    grants = (
+        db.query(UsersRole.user_id, UsersRole.role_id, UsersRole.target_user_id, Role.role_name)
+        .join(Role, Role.id == UsersRole.role_id)
+        .filter(UsersRole.user_id.in_(user_ids))
+        .all()
+    )
+    permissions_by_role = crud.role.get_effective_permissions_by_role(
+        db, role_ids=list({grant.role_id for grant in grants})
+    )
+
+    grants_by_user = defaultdict(list)
+    for grant in grants:
+        grants_by_user[grant.user_id].append(grant)
+
+    claims = {}
+    for user in users:
+        roles, permissions = set(), set()
+        scoped_permissions = defaultdict(set)
+        for grant in grants_by_user[user.id]:
+            if grant.target_user_id is None:
+                roles.add(grant.role_name)
+                permissions |= permissions_by_role.get(grant.role_id, set())
+            else:
+                scoped_permissions[str(grant.target_user_id)] |= permissions_by_role.get(
+                    grant.role_id, set()
+                )
+        claims[user.id] = {
+            "active": True,
+            "sub": str(user.id),
+            "tenant_id": user.tenant_id,
+            "username": user.username,
+            "email": user.email,
+            "roles": sorted(roles),
+            "permissions": sorted(permissions),
+            "scoped_permissions": {
+                target: sorted(names) for target, names in scoped_permissions.items()
+            },
+        }
+    return claims
+
+
+def introspect_tokens(db: Session, tokens: List[str]) -> List[Claims]:
+    results: Dict[str, Claims] = {}
+    misses: Dict[str, Tuple[uuid.UUID, Optional[int], str]] = {}
+    # Cached API keys, by prefix, still to be checked for revocation
+    cached_keys: Dict[str, str] = {}
+    for token in dict.fromkeys(tokens):
+        cached = claims_cache.get(_cache_key(token))
+        if cached is not None:
+            results[token] = cached
+            if cached.get("token_type") == "api_key":
+                cached_keys[security.get_api_key_prefix(token)] = token
+            continue
+        verified = _verify(db, token)
+        if verified is None:
+            # Bad signatures and expired tokens are cheap to reject again,
+            # so they aren't worth a cache slot
+            results[token] = INACTIVE
+        else:
+            misses[token] = verified
+
+    if misses:
+        claims_by_user = _load_claims(db, list({user_id for user_id, _, _ in misses.values()}))
+        now = clock.timestamp()
+        for token, (user_id, exp, token_type) in misses.items():
+            ttl = settings.INTROSPECTION_CACHE_TTL_SECONDS
+            if exp is not None:
+                ttl = min(ttl, exp - now)
+            claims = claims_by_user.get(user_id)
+            if claims is None:
+                # Validly signed, but the user is gone
+                claims = INACTIVE
+            else:
+                claims = {**claims, "exp": exp, "token_type": token_type}
+            claims_cache.set(_cache_key(token), claims, ttl)
+            results[token] = claims
+
+    if cached_keys:
+        live = crud.api_key.get_live_prefixes(
+            db, prefixes=list(cached_keys), now=clock.utcnow()
+        )
+        for prefix, token in cached_keys.items():
+            if prefix not in live:
+                claims_cache.delete(_cache_key(token))
+                results[token] = INACTIVE
+
+    return [results[token] for token in tokens]
@@ -0,0 +1,220 @@
+import json
+import logging
+import smtplib
+import threading
+from collections import deque
+from email.message import EmailMessage
+from typing import Any, Deque, Dict, List, Optional
+
+from app.core import clock
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+Message = Dict[str, Any]
+
+
+class NDJSONMailSink:
+    """
+    Appends a batch of messages to a newline-delimited JSON file, for
+    development or for another process to pick up and deliver
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def write(self, messages: List[Message]) -> None:
+        payload = "".join(json.dumps(message, default=str) + "\n" for message in messages)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(payload)
+
+
+class SMTPMailSink:
+    """
+    Relays a batch of messages over one SMTP connection
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        tls: bool,
+        user: Optional[str],
+        password: Optional[str],
+    ):
+        self.host = host
+        self.port = port
+        self.tls = tls
+        self.user = user
+        self.password = password
+
+    def write(self, messages: List[Message]) -> None:
+        with smtplib.SMTP(self.host, self.port) as smtp:
+            if self.tls:
+                smtp.starttls()
+            if self.user:
+                smtp.login(self.user, self.password or "")
+            for message in messages:
+                email = EmailMessage()
+                email["From"] = message["from"]
+                email["To"] = message["to"]
+                email["Subject"] = message["subject"]
+                email.set_content(message["body"])
+                smtp.send_message(email)
+
+
+class MailOutbox:
+    """
+    Queues outgoing mail so requests never wait on delivery.
+
+    Like the auth event pipeline, a background thread drains a bounded
+    in-memory queue in batches into the sink. Mail shouldn't be dropped
+    as casually as events, so send() can block for room instead, which
+    is what bulk senders like reset campaigns do.
+    """
+
+    def __init__(self, sink, capacity: int, batch_size: int, flush_interval: float):
+        self.sink = sink
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._queue: Deque[Message] = deque()
+        self._lock = threading.Lock()
+        self._not_full = threading.Condition(self._lock)
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.queued = 0
+        self.rejected = 0
+        self.delivered = 0
+        self.failed = 0
+
+    def send(
+        self,
+        to: str,
+        subject: str,
+        body: str,
+        *,
+        block: bool = False,
+        timeout: Optional[float] = 30.0,
+    ) -> bool:
+        message = {
+            "queued_at": clock.utcnow(),
+            "from": settings.EMAILS_FROM,
+            "to": to,
+            "subject": subject,
+            "body": body,
+        }
+        with self._not_full:
+            if len(self._queue) >= self.capacity:
+                if not block or not self._not_full.wait_for(
+                    lambda: len(self._queue) < self.capacity, timeout
+                ):
+                    self.rejected += 1
+                    return False
+            self._queue.append(message)
+            self.queued += 1
+            if len(self._queue) >= self.batch_size:
+                self._wakeup.set()
+        return True
+
+    def flush(self) -> None:
+        while True:
+            with self._not_full:
+                if not self._queue:
+                    return
+                batch = [
+                    self._queue.popleft()
+                    for _ in range(min(self.batch_size, len(self._queue)))
+                ]
+                self._not_full.notify_all()
+            try:
+                self.sink.write(batch)
+            except Exception:
+                logger.exception("Failed to deliver %d emails", len(batch))
+                self.failed += len(batch)
+            else:
+                self.delivered += len(batch)
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="mail-outbox", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queued_now": len(self._queue),
+            "capacity": self.capacity,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "delivered": self.delivered,
+            "failed": self.failed,
+        }
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+def send_verification_email(
+    email_to: str, username: str, token: str, *, block: bool = False
+) -> bool:
+    link = settings.EMAIL_VERIFY_URL.format(token=token)
+    return outbox.send(
+        email_to,
+        f"{settings.PROJECT_NAME} - Verify your email address",
+        f"Hi {username},\n\n"
+        f"Please confirm this is your email address by opening the link below. "
+        f"It is valid for {settings.EMAIL_VERIFY_TOKEN_EXPIRE_HOURS} hours.\n\n{link}\n",
+        block=block,
+    )
+
+
+def send_reset_password_email(
+    email_to: str, username: str, token: str, *, block: bool = False
+) -> bool:
+    link = settings.EMAIL_RESET_URL.format(token=token)
+    return outbox.send(
+        email_to,
+        f"{settings.PROJECT_NAME} - Password recovery for user {username}",
+        f"Hi {username},\n\n"
+        f"We received a request to reset your password. Open the link below to "
+        f"choose a new one. It is valid for {settings.EMAIL_RESET_TOKEN_EXPIRE_HOURS} "
+        f"hours and can only be used once.\n\n{link}\n\n"
+        f"If you didn't ask for this, you can ignore this email.\n",
+        block=block,
+    )
+
+
+def _create_sink():
+    if settings.EMAIL_SINK == "smtp":
+        return SMTPMailSink(
+            settings.SMTP_HOST,
+            settings.SMTP_PORT,
+            tls=settings.SMTP_TLS,
+            user=settings.SMTP_USER,
+            password=settings.SMTP_PASSWORD,
+        )
+    return NDJSONMailSink(settings.EMAIL_NDJSON_PATH)
+
+
+outbox = MailOutbox(
+    _create_sink(),
+    capacity=settings.EMAIL_QUEUE_SIZE,
+    batch_size=settings.EMAIL_BATCH_SIZE,
+    flush_interval=settings.EMAIL_FLUSH_INTERVAL_SECONDS,
+)
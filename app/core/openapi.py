@@ -0,0 +1,62 @@
+"""
+openapi.json, serialized and compressed once.
+
+FastAPI caches the schema as a dict but serializes it to JSON on every
+request, and the compression middleware then gzips it again every time.
+The document can't change while the process runs. PrecompressedOpenAPI
+keeps its JSON and a gzip of it, serves whichever the client accepts,
+and answers a matching If-None-Match with 304.
+"""
+import gzip
+import hashlib
+import json
+from typing import Optional
+
+from fastapi import FastAPI
+from starlette.requests import Request
+from starlette.responses import Response
+
+
+class PrecompressedOpenAPI:
+    def __init__(self, app: FastAPI):
+        self.app = app
+        self.body: Optional[bytes] = None
+        self.gzipped: Optional[bytes] = None
+        self.etag: Optional[str] = None
+
+    def build(self) -> None:
+        # Serialized as FastAPI's JSONResponse would
+        body = json.dumps(
+            self.app.openapi(),
+            ensure_ascii=False,
+            allow_nan=False,
+            indent=None,
+            separators=(",", ":"),
+        ).encode("utf-8")
+        # mtime=0 makes the gzip the same in every worker
+        self.gzipped = gzip.compress(body, compresslevel=9, mtime=0)
+        self.etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        self.body = body
+
+    async def respond(self, request: Request) -> Response:
+        if self.body is None:
+            self.build()
+        headers = {"ETag": self.etag, "Vary": "Accept-Encoding"}
+        if request.headers.get("if-none-match") == self.etag:
+            return Response(status_code=304, headers=headers)
+        if "gzip" in request.headers.get("accept-encoding", ""):
+            headers["Content-Encoding"] = "gzip"
+            return Response(self.gzipped, media_type="application/json", headers=headers)
+        return Response(self.body, media_type="application/json", headers=headers)
+
+
+def serve_precompressed_openapi(app: FastAPI) -> PrecompressedOpenAPI:
+    """
+    Replace the app's openapi.json route with a PrecompressedOpenAPI
+    """
+    openapi = PrecompressedOpenAPI(app)
+    app.router.routes = [
+        route for route in app.router.routes if getattr(route, "path", None) != app.openapi_url
+    ]
+    app.add_route(app.openapi_url, openapi.respond, include_in_schema=False)
+    return openapi
@@ -0,0 +1,104 @@
+"""
+Password policy: a minimum length, and a lookup in an offline corpus of
+breached passwords.
+
+The corpus is a file of raw 20-byte SHA-1 digests in sorted order, built
+with `python -m app.cli.breached_passwords`. It is memory-mapped and
+binary-searched in place: a lookup touches about log2(n) records, so it
+takes microseconds even for a billion passwords, nothing is loaded into
+the process heap, and every worker shares the same page cache.
+"""
+import hashlib
+import mmap
+import os
+import threading
+from typing import List, Optional
+
+from app.core.config import settings
+
+MAGIC = b"UAPWNED1"
+RECORD_SIZE = 20
+
+
+class BreachedPasswordIndex:
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if (
+            self._map[: len(MAGIC)] != MAGIC
+            or (len(self._map) - len(MAGIC)) % RECORD_SIZE
+        ):
+            self._map.close()
+            raise ValueError(f"{path} is not a breached password index")
+        if hasattr(mmap, "MADV_RANDOM"):
+            # Binary search jumps around; read-ahead would only waste cache
+            self._map.madvise(mmap.MADV_RANDOM)
+        self._records = (len(self._map) - len(MAGIC)) // RECORD_SIZE
+
+    def __len__(self) -> int:
+        return self._records
+
+    def contains_digest(self, digest: bytes) -> bool:
+        low, high = 0, self._records
+        data = self._map
+        while low < high:
+            middle = (low + high) // 2
+            offset = len(MAGIC) + middle * RECORD_SIZE
+            record = data[offset : offset + RECORD_SIZE]
+            if record < digest:
+                low = middle + 1
+            elif record > digest:
+                high = middle
+            else:
+                return True
+        return False
+
+    def __contains__(self, password: str) -> bool:
+        return self.contains_digest(hashlib.sha1(password.encode()).digest())
+
+    def close(self) -> None:
+        self._map.close()
+
+
+_index: Optional[BreachedPasswordIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_breached_password_index() -> Optional[BreachedPasswordIndex]:
+    """
+    The index at BREACHED_PASSWORDS_PATH, opened on first use in each
+    process; None when no corpus is configured
+    """
+    global _index
+    if _index is None and settings.BREACHED_PASSWORDS_PATH:
+        with _index_lock:
+            if _index is None and os.path.exists(settings.BREACHED_PASSWORDS_PATH):
+                _index = BreachedPasswordIndex(settings.BREACHED_PASSWORDS_PATH)
+    return _index
+
+
+def check_password(password: str) -> List[str]:
+    """
+    Everything wrong with a candidate password; an empty list means it's acceptable
+    """
+    problems = []
+    if len(password) < settings.PASSWORD_MIN_LENGTH:
+        problems.append(
+            f"Password must be at least {settings.PASSWORD_MIN_LENGTH} characters long."
+        )
+    index = get_breached_password_index()
+    if index is not None and password in index:
+        problems.append(
+            "This password has appeared in a data breach, please choose another one."
+        )
+    return problems
+
+
+def validate_password(password: str) -> str:
+    """
+    Pydantic validator: raise ValueError if the password breaks the policy
+    """
+    problems = check_password(password)
+    if problems:
+        raise ValueError(" ".join(problems))
+    return password
@@ -0,0 +1,148 @@
+"""
+Password reset campaigns, run in the background.
+
+A campaign emails a reset link to every matching user of a tenant, e.g.
+after a credential leak. That can be millions of users, and the mail
+outbox makes senders wait when it's full, so a campaign runs on a thread
+of its own rather than on the request that started it. The request only
+gets the campaign's id back.
+
+Targets are read a chunk at a time, and the campaign's session gives its
+connection back to the pool between chunks. When the campaign ends, a
+password_reset_campaign auth event records how many emails were queued,
+so its outcome can be looked up from any worker.
+"""
+import logging
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app import crud
+from app.core import security
+from app.core.config import settings
+from app.core.events import auth_events
+from app.core.mail import send_reset_password_email
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Campaign:
+    id: uuid.UUID
+    tenant_id: str
+    actor_user_id: uuid.UUID
+    user_ids: Optional[List[uuid.UUID]]
+    created_before: Optional[datetime]
+    queued: int = 0
+    not_queued: int = 0
+    finished: threading.Event = field(default_factory=threading.Event)
+
+
+class PasswordResetCampaigns:
+    def __init__(self, chunk_size: int = 1000):
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self._running: Dict[uuid.UUID, Campaign] = {}
+        self._stopping = threading.Event()
+
+    def start(
+        self,
+        session_factory: Callable[[], Session],
+        *,
+        tenant_id: str,
+        actor_user_id: uuid.UUID,
+        user_ids: Optional[List[uuid.UUID]] = None,
+        created_before: Optional[datetime] = None,
+    ) -> Campaign:
+        campaign = Campaign(
+            id=uuid.uuid4(),
+            tenant_id=tenant_id,
+            actor_user_id=actor_user_id,
+            user_ids=user_ids,
+            created_before=created_before,
+        )
+        with self._lock:
+            self._running[campaign.id] = campaign
+        threading.Thread(
+            target=self._run,
+            args=(campaign, session_factory),
+            name=f"password-reset-campaign-{campaign.id}",
+            daemon=True,
+        ).start()
+        return campaign
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        Stop running campaigns after their current chunk, waiting up to
+        timeout for them to record how far they got
+        """
+        self._stopping.set()
+        self.join(timeout)
+        self._stopping.clear()
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait up to timeout for the running campaigns to end, and return
+        whether they all have
+        """
+        with self._lock:
+            running = list(self._running.values())
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for campaign in running:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not campaign.finished.wait(remaining):
+                return False
+        return True
+
+    def _run(self, campaign: Campaign, session_factory: Callable[[], Session]) -> None:
+        started = time.perf_counter()
+        expires_delta = timedelta(hours=settings.EMAIL_RESET_TOKEN_EXPIRE_HOURS)
+        completed = False
+        db = session_factory()
+        try:
+            for chunk in crud.user.iter_password_reset_targets(
+                db,
+                tenant_id=campaign.tenant_id,
+                user_ids=campaign.user_ids,
+                created_before=campaign.created_before,
+                chunk_size=self.chunk_size,
+            ):
+                # Hand the connection back while the chunk is mailed
+                db.rollback()
+                for user_id, username, email, hashed_password in chunk:
+                    token = security.create_action_token(
+                        "reset_password", user_id, hashed_password, expires_delta
+                    )
+                    # Wait for the outbox to drain rather than drop anyone's email
+                    if send_reset_password_email(email, username, token, block=True):
+                        campaign.queued += 1
+                    else:
+                        campaign.not_queued += 1
+                if self._stopping.is_set():
+                    break
+            else:
+                completed = True
+        except Exception:
+            logger.exception("Password reset campaign %s failed", campaign.id)
+        finally:
+            db.close()
+            auth_events.emit(
+                "password_reset_campaign",
+                actor_user_id=campaign.actor_user_id,
+                campaign_id=str(campaign.id),
+                completed=completed,
+                queued=campaign.queued,
+                not_queued=campaign.not_queued,
+                seconds=round(time.perf_counter() - started, 3),
+            )
+            with self._lock:
+                self._running.pop(campaign.id, None)
+            campaign.finished.set()
+
+
+reset_campaigns = PasswordResetCampaigns()
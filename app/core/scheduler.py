@@ -0,0 +1,190 @@
+"""
+In-process scheduler for periodic maintenance jobs.
+
+Every worker process starts one, but only the one holding the leader
+lock runs jobs: an exclusive flock on SCHEDULER_LOCK_PATH, which the
+kernel releases when its holder exits, so another worker takes over
+on its next attempt. Jobs run one at a time on the scheduler's own
+thread and never on a request's.
+
+Long jobs work in chunks and pause between them through a Throttle,
+which keeps them to a fraction of the wall clock so the database has
+room for foreground requests.
+"""
+import logging
+import math
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderLock:
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    @property
+    def held(self) -> bool:
+        return self._file is not None
+
+    def acquire(self) -> bool:
+        """
+        Try to become the leader without waiting
+        """
+        if self._file is not None:
+            return True
+        if fcntl is None:
+            # No flock; assume a single process
+            self._file = True
+            return True
+        f = open(self.path, "a+")
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        f.seek(0)
+        f.truncate()
+        f.write(f"{os.getpid()}\n")
+        f.flush()
+        self._file = f
+        return True
+
+    def release(self) -> None:
+        if self._file is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            self._file.close()
+        self._file = None
+
+
+class Throttle:
+    """
+    Paces a chunked job to at most duty_cycle of the wall clock: after a
+    chunk that took t seconds it sleeps t * (1 - duty_cycle) / duty_cycle,
+    so a slower database automatically gets longer breaks
+    """
+
+    def __init__(self, duty_cycle: float, stopping: threading.Event):
+        self.duty_cycle = duty_cycle
+        self.stopping = stopping
+
+    def run(self, step: Callable[[int], int], chunk_size: int) -> int:
+        """
+        Call step(chunk_size) until it handles fewer than chunk_size rows
+        or the scheduler stops, and return the total handled
+        """
+        total = 0
+        while True:
+            started = time.monotonic()
+            handled = step(chunk_size)
+            total += handled
+            if handled < chunk_size:
+                return total
+            elapsed = time.monotonic() - started
+            if self.stopping.wait(elapsed * (1 - self.duty_cycle) / self.duty_cycle):
+                return total
+
+
+@dataclass
+class Job:
+    name: str
+    interval: float
+    run: Callable[[Throttle], Any]
+    next_run: float = 0.0
+    runs: int = 0
+    failures: int = 0
+    last_result: Any = None
+    last_duration: Optional[float] = None
+    last_error: Optional[str] = None
+
+
+class Scheduler:
+    def __init__(self, lock: LeaderLock, duty_cycle: float, lock_retry_interval: float = 30.0):
+        self.lock = lock
+        self.duty_cycle = duty_cycle
+        # How often a follower tries to become the leader
+        self.lock_retry_interval = lock_retry_interval
+        self.jobs: List[Job] = []
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, name: str, interval: float, run: Callable[[Throttle], Any]) -> None:
+        self.jobs.append(Job(name=name, interval=interval, run=run))
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        now = time.monotonic()
+        for job in self.jobs:
+            # Nothing runs at boot, and jobs sharing an interval are spread out
+            job.next_run = now + job.interval * random.uniform(0.5, 1.0)
+        self._thread = threading.Thread(target=self._run, name="scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.lock.release()
+
+    def run_pending(self) -> None:
+        throttle = Throttle(self.duty_cycle, self._stopping)
+        for job in self.jobs:
+            if self._stopping.is_set():
+                return
+            if job.next_run > time.monotonic():
+                continue
+            started = time.monotonic()
+            try:
+                job.last_result = job.run(throttle)
+                job.last_error = None
+            except Exception as e:
+                logger.exception("Scheduled job %s failed", job.name)
+                job.failures += 1
+                job.last_error = repr(e)
+            job.runs += 1
+            job.last_duration = time.monotonic() - started
+            job.next_run = time.monotonic() + job.interval
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "leader": self.lock.held,
+            "jobs": [
+                {
+                    "name": job.name,
+                    "interval": job.interval,
+                    "due_in": max(0.0, job.next_run - now),
+                    "runs": job.runs,
+                    "failures": job.failures,
+                    "last_result": job.last_result,
+                    "last_duration": job.last_duration,
+                    "last_error": job.last_error,
+                }
+                for job in self.jobs
+            ],
+        }
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            if self.lock.acquire():
+                self.run_pending()
+                next_run = min((job.next_run for job in self.jobs), default=math.inf)
+                wait = min(next_run - time.monotonic(), self.lock_retry_interval)
+            else:
+                wait = self.lock_retry_interval
+            self._stopping.wait(max(wait, 0.1))
@@ -1,14 +1,26 @@
+import base64
+import binascii
+import hashlib
+import hmac
 import secrets
 import string
-from datetime import datetime, timedelta
+import struct
+import uuid
+from dataclasses import dataclass
+from datetime import timedelta
 from typing import Any, Optional, Tuple, Union
 
 from jose import jwt
 from passlib.context import CryptContext
 
+from app.core import clock
 from app.core.config import settings
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt is the scheme new hashes use. The others are only there to verify
+# hashes imported from legacy systems; deprecated="auto" marks them for
+# an upgrade to bcrypt the next time the user logs in.
+LEGACY_PASSWORD_SCHEMES = ["pbkdf2_sha512", "sha512_crypt", "django_pbkdf2_sha256"]
+pwd_context = CryptContext(schemes=["bcrypt", *LEGACY_PASSWORD_SCHEMES], deprecated="auto")
 
 
 ALGORITHM = "HS256"
@@ -20,9 +32,9 @@ def create_access_token(
     token_type: str = "login",
 ) -> str:
     if expires_delta:
-        expire = datetime.utcnow() + expires_delta
+        expire = clock.utcnow() + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(
+        expire = clock.utcnow() + timedelta(
             minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES
         )
     to_encode = {"exp": expire, "sub": str(subject)}
@@ -42,7 +54,19 @@ def create_access_token(
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return verify_and_update_password(plain_password, hashed_password)[0]
+
+
+def verify_and_update_password(
+    plain_password: str, hashed_password: str
+) -> Tuple[bool, Optional[str]]:
+    # Return whether the password matches and, if the stored hash uses a
+    # deprecated scheme, its replacement hash
+    try:
+        return pwd_context.verify_and_update(plain_password, hashed_password)
+    except ValueError:
+        # Not a hash any registered scheme recognises
+        return False, None
 
 
 def get_password_hash(password: str) -> str:
@@ -57,3 +81,99 @@ def get_temporary_password(length: int) -> Tuple[str, str]:
         secrets.choice(temporary_password_string) for i in range(length)
     )
     return temporary_password, pwd_context.hash(temporary_password)
+
+
+def hash_api_key(api_key: str) -> str:
+    # API keys are long random strings, so a keyed fast hash is enough;
+    # there's nothing for bcrypt's work factor to protect
+    return hmac.new(
+        settings.API_KEY_HMAC_SECRET.encode(), api_key.encode(), hashlib.sha256
+    ).hexdigest()
+
+
+def verify_api_key(api_key: str, key_hash: str) -> bool:
+    return hmac.compare_digest(hash_api_key(api_key), key_hash)
+
+
+def generate_api_key() -> Tuple[str, str, str]:
+    # Return the api key, its lookup prefix and its hash.
+    # Keys look like uak_<prefix>_<secret>; the prefix is hex so it never
+    # contains the separator
+    prefix = secrets.token_hex(6)
+    api_key = f"{settings.API_KEY_PREFIX}_{prefix}_{secrets.token_urlsafe(32)}"
+    return api_key, prefix, hash_api_key(api_key)
+
+
+def get_api_key_prefix(api_key: str) -> Optional[str]:
+    parts = api_key.split("_", 2)
+    if len(parts) != 3 or parts[0] != settings.API_KEY_PREFIX or not parts[2]:
+        return None
+    return parts[1]
+
+
+# Signed single-use tokens for links we email (verify email, reset password).
+# Nothing is stored when one is issued: the token carries its purpose, user,
+# expiry and a random nonce, signed with HMAC-SHA256 over those fields plus
+# a binding value (the user's email or password hash). Changing the bound
+# value voids every outstanding token, and the nonce is recorded when the
+# token is used so it can't be replayed before it expires.
+ACTION_TOKEN_PURPOSES = {"verify_email": 1, "reset_password": 2}
+_ACTION_TOKEN_PAYLOAD = struct.Struct(">B16sI8s")
+_ACTION_TOKEN_SIGNATURE_SIZE = 16
+
+
+@dataclass(frozen=True)
+class ActionToken:
+    purpose: str
+    user_id: uuid.UUID
+    expires_at: int
+    nonce: str
+    payload: bytes
+    signature: bytes
+
+
+def _sign_action_token(payload: bytes, binding: str) -> bytes:
+    return hmac.new(
+        settings.ACTION_TOKEN_HMAC_SECRET.encode(), payload + binding.encode(), hashlib.sha256
+    ).digest()[:_ACTION_TOKEN_SIGNATURE_SIZE]
+
+
+def create_action_token(
+    purpose: str, user_id: uuid.UUID, binding: str, expires_delta: timedelta
+) -> str:
+    expires_at = int(clock.timestamp() + expires_delta.total_seconds())
+    payload = _ACTION_TOKEN_PAYLOAD.pack(
+        ACTION_TOKEN_PURPOSES[purpose], user_id.bytes, expires_at, secrets.token_bytes(8)
+    )
+    token = payload + _sign_action_token(payload, binding)
+    return base64.urlsafe_b64encode(token).rstrip(b"=").decode()
+
+
+def parse_action_token(token: str, purpose: str) -> Optional[ActionToken]:
+    """
+    Decode a token for the given purpose that hasn't expired yet.
+    The signature still has to be checked with verify_action_token,
+    once the caller has loaded the binding value.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+    except (binascii.Error, ValueError):
+        return None
+    if len(raw) != _ACTION_TOKEN_PAYLOAD.size + _ACTION_TOKEN_SIGNATURE_SIZE:
+        return None
+    payload, signature = raw[: _ACTION_TOKEN_PAYLOAD.size], raw[_ACTION_TOKEN_PAYLOAD.size :]
+    code, user_id, expires_at, nonce = _ACTION_TOKEN_PAYLOAD.unpack(payload)
+    if code != ACTION_TOKEN_PURPOSES[purpose] or expires_at <= clock.timestamp():
+        return None
+    return ActionToken(
+        purpose=purpose,
+        user_id=uuid.UUID(bytes=user_id),
+        expires_at=expires_at,
+        nonce=nonce.hex(),
+        payload=payload,
+        signature=signature,
+    )
+
+
+def verify_action_token(token: ActionToken, binding: str) -> bool:
+    return hmac.compare_digest(_sign_action_token(token.payload, binding), token.signature)
@@ -0,0 +1,128 @@
+"""
+Signed cookie sessions, decoded only for requests that use them.
+
+Starlette's SessionMiddleware checks the cookie's signature and decodes
+it on every request, and signs and sets it again on every response,
+whether or not anything reads request.session. LazySessionMiddleware
+puts a LazySession in the scope instead. The LazySession checks and
+decodes the cookie the first time it's used. A request that never
+touches request.session costs one small object, and its response leaves
+the cookie as it was.
+
+The cookie format is Starlette's, so either middleware can read
+sessions the other wrote.
+"""
+import json
+from base64 import b64decode, b64encode
+from typing import Any, Dict, Iterator, MutableMapping, Optional
+
+import itsdangerous
+from itsdangerous.exc import BadSignature
+from starlette.datastructures import MutableHeaders
+from starlette.requests import cookie_parser
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+class LazySession(MutableMapping[str, Any]):
+    __slots__ = ("_cookie", "_signer", "_max_age", "_data", "was_empty")
+
+    def __init__(
+        self, cookie: Optional[str], signer: itsdangerous.TimestampSigner, max_age: Optional[int]
+    ):
+        self._cookie = cookie
+        self._signer = signer
+        self._max_age = max_age
+        self._data: Optional[Dict[str, Any]] = None
+        # Whether the request came without a valid session
+        self.was_empty = True
+
+    @property
+    def loaded(self) -> bool:
+        return self._data is not None
+
+    def _load(self) -> Dict[str, Any]:
+        if self._data is None:
+            self._data = {}
+            if self._cookie is not None:
+                try:
+                    data = self._signer.unsign(self._cookie.encode("utf-8"), max_age=self._max_age)
+                    self._data = json.loads(b64decode(data))
+                    self.was_empty = False
+                except BadSignature:
+                    pass
+        return self._data
+
+    def __getitem__(self, key: str) -> Any:
+        return self._load()[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self._load()[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        del self._load()[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._load())
+
+    def __len__(self) -> int:
+        return len(self._load())
+
+    def __repr__(self) -> str:
+        return f"LazySession({self._data if self.loaded else '...'})"
+
+
+class LazySessionMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        secret_key: str,
+        session_cookie: str = "session",
+        max_age: Optional[int] = 14 * 24 * 60 * 60,
+        path: str = "/",
+        same_site: str = "lax",
+        https_only: bool = False,
+    ):
+        self.app = app
+        self.signer = itsdangerous.TimestampSigner(str(secret_key))
+        self.session_cookie = session_cookie
+        self.max_age = max_age
+        self.path = path
+        self.security_flags = "httponly; samesite=" + same_site
+        if https_only:
+            self.security_flags += "; secure"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        session = LazySession(self._cookie(scope), self.signer, self.max_age)
+        scope["session"] = session
+
+        async def send_wrapper(message: Message) -> None:
+            # An untouched session can't have changed
+            if message["type"] == "http.response.start" and session.loaded:
+                if session:
+                    data = self.signer.sign(b64encode(json.dumps(dict(session)).encode("utf-8")))
+                    max_age = f"Max-Age={self.max_age}; " if self.max_age else ""
+                    MutableHeaders(scope=message).append(
+                        "Set-Cookie",
+                        f"{self.session_cookie}={data.decode('utf-8')}; path={self.path}; "
+                        f"{max_age}{self.security_flags}",
+                    )
+                elif not session.was_empty:
+                    # The session was cleared
+                    MutableHeaders(scope=message).append(
+                        "Set-Cookie",
+                        f"{self.session_cookie}=null; path={self.path}; "
+                        f"expires=Thu, 01 Jan 1970 00:00:00 GMT; {self.security_flags}",
+                    )
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _cookie(self, scope: Scope) -> Optional[str]:
+        for name, value in scope["headers"]:
+            if name == b"cookie":
+                return cookie_parser(value.decode("latin-1")).get(self.session_cookie)
+        return None
@@ -0,0 +1,324 @@
+"""
+Authenticated WebSocket sessions.
+
+A socket authenticates once, at the handshake, and keeps the resulting
+Principal for as long as it stays open. Messages carry no credentials and
+aren't checked one by one. Instead each worker keeps one timer wheel for
+all of its sockets, and one task visits the sessions that fall due on
+each tick:
+
+- A session whose access token has expired is closed with CLOSE_EXPIRED.
+- The others are checked again in batches, a query or two for every
+  WEBSOCKET_REVALIDATE_BATCH_SIZE sessions. A session is closed with
+  CLOSE_REVOKED if its user was deleted or moved to another tenant, or
+  if its API key was revoked or has expired.
+
+Sessions are checked every WEBSOCKET_REVALIDATE_INTERVAL_SECONDS, and
+when their token expires if that comes sooner. An idle session costs a
+wheel entry and a small object, with no task or timer of its own, so a
+worker can hold tens of thousands of them.
+"""
+import asyncio
+import contextvars
+import itertools
+import logging
+import math
+import random
+import time
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Generic, Hashable, List, Optional, Set, TypeVar
+
+from fastapi import WebSocket, WebSocketException
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from starlette.status import WS_1001_GOING_AWAY, WS_1013_TRY_AGAIN_LATER
+from starlette.websockets import WebSocketState
+
+from app import crud
+from app.core import clock
+from app.core.config import settings
+from app.core.principal import Principal
+from app.db.session import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Application close codes (4000-4999), after the HTTP statuses they mirror.
+# The token ran out: get a new one and reconnect
+CLOSE_EXPIRED = 4401
+# The user or API key is gone: reconnecting with the same credentials fails
+CLOSE_REVOKED = 4403
+
+KeyType = TypeVar("KeyType", bound=Hashable)
+
+
+class TimerWheel(Generic[KeyType]):
+    """
+    A hashed timing wheel. Its slots are tick seconds apart, and an entry
+    due more than one turn ahead waits the remaining turns in its slot.
+    Scheduling, cancelling and expiring an entry are O(1) however many
+    there are.
+    """
+
+    def __init__(self, tick: float, slots: int):
+        self.tick = tick
+        self._slots: List[Dict[KeyType, int]] = [{} for _ in range(slots)]
+        self._where: Dict[KeyType, int] = {}
+        self._position = 0
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def schedule(self, key: KeyType, delay: float) -> None:
+        self.cancel(key)
+        ticks = max(1, math.ceil(delay / self.tick))
+        slot = (self._position + ticks) % len(self._slots)
+        self._slots[slot][key] = (ticks - 1) // len(self._slots)
+        self._where[key] = slot
+
+    def cancel(self, key: KeyType) -> None:
+        slot = self._where.pop(key, None)
+        if slot is not None:
+            del self._slots[slot][key]
+
+    def advance(self) -> List[KeyType]:
+        """
+        Move on one tick and return the entries that fell due
+        """
+        self._position = (self._position + 1) % len(self._slots)
+        slot = self._slots[self._position]
+        due = [key for key, turns in slot.items() if turns == 0]
+        for key in due:
+            del slot[key]
+            del self._where[key]
+        for key in slot:
+            slot[key] -= 1
+        return due
+
+
+class WebSocketSession:
+    __slots__ = ("id", "websocket", "principal", "expires_at", "api_key_prefix", "close_code")
+
+    def __init__(
+        self,
+        id: int,  # noqa: A002
+        websocket: WebSocket,
+        principal: Principal,
+        expires_at: Optional[float],
+        api_key_prefix: Optional[str],
+    ):
+        self.id = id
+        self.websocket = websocket
+        self.principal = principal
+        # Unix timestamp the access token expires at; None for API keys
+        self.expires_at = expires_at
+        self.api_key_prefix = api_key_prefix
+        # Set once the server has closed the socket
+        self.close_code: Optional[int] = None
+
+    @property
+    def open(self) -> bool:
+        return (
+            self.close_code is None
+            and self.websocket.application_state == WebSocketState.CONNECTED
+        )
+
+    async def iter_text(self) -> AsyncIterator[str]:
+        """
+        The client's text messages, until either side closes the socket
+        """
+        while self.open:
+            message = await self.websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("text") is not None:
+                yield message["text"]
+
+    async def send_json(self, data: Any) -> bool:
+        """
+        Send unless the socket has been closed, and return whether it was sent
+        """
+        if not self.open:
+            return False
+        await self.websocket.send_json(data)
+        return True
+
+
+class WebSocketSessionManager:
+    def __init__(
+        self,
+        *,
+        tick: float,
+        slots: int,
+        revalidate_interval: float,
+        batch_size: int,
+        max_sessions: int,
+        session_factory=SessionLocal,
+    ):
+        self.wheel: TimerWheel[int] = TimerWheel(tick, slots)
+        self.revalidate_interval = revalidate_interval
+        self.batch_size = batch_size
+        self.max_sessions = max_sessions
+        # Where revalidation reads users and keys from
+        self.session_factory = session_factory
+        self.sessions: Dict[int, WebSocketSession] = {}
+        self._ids = itertools.count(1)
+        self._task: Optional[asyncio.Task] = None
+        self.opened = 0
+        self.closed: Dict[str, int] = {"expired": 0, "revoked": 0, "shutdown": 0}
+        self.revalidated = 0
+        self.revalidation_queries = 0
+        self.last_revalidation_seconds: Optional[float] = None
+        self.max_tick_lag_seconds = 0.0
+
+    def open(
+        self,
+        websocket: WebSocket,
+        principal: Principal,
+        *,
+        expires_at: Optional[float] = None,
+        api_key_prefix: Optional[str] = None,
+    ) -> WebSocketSession:
+        """
+        Register an authenticated socket, before it's accepted
+        """
+        if len(self.sessions) >= self.max_sessions:
+            raise WebSocketException(code=WS_1013_TRY_AGAIN_LATER, reason="Too many connections")
+        self._start()
+        session = WebSocketSession(next(self._ids), websocket, principal, expires_at, api_key_prefix)
+        self.sessions[session.id] = session
+        # The first check is spread over the interval, so sockets opened
+        # together, e.g. as clients reconnect after a deploy, don't all fall
+        # due on the same tick
+        delay = self.revalidate_interval * random.uniform(0.5, 1.0)
+        self.wheel.schedule(session.id, self._until_expiry(session, delay))
+        self.opened += 1
+        return session
+
+    def discard(self, session: WebSocketSession) -> None:
+        if self.sessions.pop(session.id, None) is not None:
+            self.wheel.cancel(session.id)
+
+    async def close(self, session: WebSocketSession, code: int, reason: str) -> None:
+        self.discard(session)
+        if session.close_code is not None:
+            return
+        session.close_code = code
+        if session.websocket.application_state != WebSocketState.CONNECTED:
+            return
+        try:
+            await session.websocket.close(code=code, reason=reason)
+        except Exception:  # noqa: BLE001 - the client went away first
+            logger.debug("Closing WebSocket session %s failed", session.id, exc_info=True)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        sessions = list(self.sessions.values())
+        self.closed["shutdown"] += len(sessions)
+        await asyncio.gather(
+            *(self.close(session, WS_1001_GOING_AWAY, "Server shutting down") for session in sessions)
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self.sessions),
+            "opened": self.opened,
+            "closed": dict(self.closed),
+            "revalidated": self.revalidated,
+            "revalidation_queries": self.revalidation_queries,
+            "last_revalidation_seconds": self.last_revalidation_seconds,
+            "max_tick_lag_seconds": self.max_tick_lag_seconds,
+        }
+
+    def _until_expiry(self, session: WebSocketSession, delay: float) -> float:
+        if session.expires_at is not None:
+            delay = min(delay, session.expires_at - clock.read().timestamp)
+        return delay
+
+    def _start(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+        # In a context of its own: started from a socket's handler, the task
+        # would otherwise inherit that request's clock and query recorder
+        self._task = contextvars.Context().run(asyncio.get_running_loop().create_task, self._run())
+
+    async def _run(self) -> None:
+        next_tick = time.monotonic() + self.wheel.tick
+        while True:
+            await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
+            # Catch up on ticks missed while the event loop was busy
+            lag = time.monotonic() - next_tick
+            self.max_tick_lag_seconds = max(self.max_tick_lag_seconds, lag)
+            due: List[int] = []
+            for _ in range(1 + max(0, int(lag // self.wheel.tick))):
+                due.extend(self.wheel.advance())
+                next_tick += self.wheel.tick
+            if due:
+                try:
+                    await self.revalidate(due)
+                except Exception:
+                    logger.exception("WebSocket revalidation failed")
+
+    async def revalidate(self, session_ids: List[int]) -> None:
+        """
+        Close the sessions that have expired or been revoked and schedule
+        the next check of the rest
+        """
+        sessions = [self.sessions[i] for i in session_ids if i in self.sessions]
+        now = clock.read()
+        expired = [s for s in sessions if s.expires_at is not None and s.expires_at <= now.timestamp]
+        current = [s for s in sessions if s.expires_at is None or s.expires_at > now.timestamp]
+
+        started = time.perf_counter()
+        revoked: Set[int] = set()
+        for i in range(0, len(current), self.batch_size):
+            batch = current[i : i + self.batch_size]
+            try:
+                revoked |= await run_in_threadpool(self._revoked, batch, now.wall)
+            except Exception:
+                # Keep the sessions and try again next time rather than
+                # dropping every socket while the database is unavailable
+                logger.exception("WebSocket revalidation query failed")
+        self.last_revalidation_seconds = time.perf_counter() - started
+        self.revalidated += len(current)
+
+        for session in current:
+            if session.id not in revoked and session.id in self.sessions:
+                self.wheel.schedule(
+                    session.id, self._until_expiry(session, self.revalidate_interval)
+                )
+        self.closed["expired"] += len(expired)
+        self.closed["revoked"] += len(revoked)
+        await asyncio.gather(
+            *(self.close(s, CLOSE_EXPIRED, "Token expired") for s in expired),
+            *(self.close(s, CLOSE_REVOKED, "Credentials revoked") for s in current if s.id in revoked),
+        )
+
+    def _revoked(self, sessions: List[WebSocketSession], now: datetime) -> Set[int]:
+        db: Session
+        with self.session_factory() as db:
+            tenant_ids = crud.user.get_tenant_ids(
+                db, user_ids=list({s.principal.id for s in sessions})
+            )
+            self.revalidation_queries += 1
+            prefixes = list({s.api_key_prefix for s in sessions if s.api_key_prefix})
+            live_prefixes = set()
+            if prefixes:
+                live_prefixes = crud.api_key.get_live_prefixes(db, prefixes=prefixes, now=now)
+                self.revalidation_queries += 1
+        return {
+            s.id
+            for s in sessions
+            if tenant_ids.get(s.principal.id) != s.principal.tenant_id
+            or (s.api_key_prefix is not None and s.api_key_prefix not in live_prefixes)
+        }
+
+
+websocket_sessions = WebSocketSessionManager(
+    tick=settings.WEBSOCKET_TIMER_TICK_SECONDS,
+    slots=settings.WEBSOCKET_TIMER_SLOTS,
+    revalidate_interval=settings.WEBSOCKET_REVALIDATE_INTERVAL_SECONDS,
+    batch_size=settings.WEBSOCKET_REVALIDATE_BATCH_SIZE,
+    max_sessions=settings.WEBSOCKET_MAX_SESSIONS,
+)
@@ -1 +1,6 @@
+from .crud_api_key import api_key
+from .crud_auth_event import auth_event
+from .crud_consumed_nonce import consumed_nonce
+from .crud_role import role
+from .crud_tenant import tenant
 from .crud_user import user
@@ -0,0 +1,126 @@
+import uuid
+from datetime import datetime
+from typing import List, Optional, Set, Tuple
+
+from sqlalchemy import delete, or_, select
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session
+
+from app.core import clock
+from app.core.security import generate_api_key, get_api_key_prefix, verify_api_key
+from app.crud.base import CRUDBase
+from app.models.api_key import ApiKey
+from app.models.user import User
+from app.schemas.api_key import ApiKeyCreate
+
+
+class CRUDApiKey(CRUDBase[ApiKey, ApiKeyCreate, ApiKeyCreate]):
+    def create_for_user(
+        self, db: Session, *, user_id: uuid.UUID, obj_in: ApiKeyCreate
+    ) -> Tuple[ApiKey, str]:
+        api_key, prefix, key_hash = generate_api_key()
+        db_obj = ApiKey(
+            user_id=user_id,
+            name=obj_in.name,
+            expires_at=obj_in.expires_at,
+            prefix=prefix,
+            key_hash=key_hash,
+        )
+        db.add(db_obj)
+        db.commit()
+        db.refresh(db_obj)
+        return db_obj, api_key
+
+    def get_multi_by_user(self, db: Session, *, user_id: uuid.UUID) -> List[ApiKey]:
+        return (
+            db.query(ApiKey)
+            .filter(ApiKey.user_id == user_id)
+            .order_by(ApiKey.created_at)
+            .all()
+        )
+
+    def revoke(self, db: Session, *, user_id: uuid.UUID, id: uuid.UUID) -> bool:  # noqa: A002
+        db_obj = (
+            db.query(ApiKey)
+            .filter(ApiKey.id == id, ApiKey.user_id == user_id)
+            .first()
+        )
+        if not db_obj:
+            return False
+        if db_obj.revoked_at is None:
+            db_obj.revoked_at = clock.utcnow()
+            db.add(db_obj)
+            db.commit()
+        return True
+
+    def purge_dead(self, db: Session, *, before: datetime, limit: int) -> int:
+        """
+        Delete up to limit keys that were revoked or expired before `before`
+        """
+        dead = (
+            select(ApiKey.id)
+            .where(or_(ApiKey.revoked_at < before, ApiKey.expires_at < before))
+            .limit(limit)
+        )
+        deleted = db.execute(
+            delete(ApiKey)
+            .where(ApiKey.id.in_(dead))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        return deleted
+
+    def authenticate(self, db: Session, *, api_key: str) -> Optional[User]:
+        user_id = self.authenticate_user_id(db, api_key=api_key)
+        if user_id is None:
+            return None
+        return db.get(User, user_id)
+
+    def authenticate_user_id(self, db: Session, *, api_key: str) -> Optional[uuid.UUID]:
+        """
+        The id of the key's user, read without loading the key or the user
+        into the session
+        """
+        row = self.verify(db, api_key=api_key)
+        return row.user_id if row else None
+
+    def verify(self, db: Session, *, api_key: str) -> Optional[Row]:
+        """
+        The key's row, with its user_id and expires_at, if api_key is a
+        live key
+        """
+        prefix = get_api_key_prefix(api_key)
+        if prefix is None:
+            return None
+        row = db.execute(
+            select(ApiKey.user_id, ApiKey.expires_at, ApiKey.key_hash, ApiKey.revoked_at)
+            .where(ApiKey.prefix == prefix)
+            .limit(1)
+        ).first()
+        if not row:
+            return None
+        if row.revoked_at is not None:
+            return None
+        if row.expires_at is not None and row.expires_at <= clock.utcnow():
+            return None
+        if not verify_api_key(api_key, row.key_hash):
+            return None
+        return row
+
+    def get_live_prefixes(
+        self, db: Session, *, prefixes: List[str], now: datetime
+    ) -> Set[str]:
+        """
+        Those of the prefixes whose keys are neither revoked nor expired
+        """
+        return set(
+            db.execute(
+                select(ApiKey.prefix).where(
+                    ApiKey.prefix.in_(prefixes),
+                    ApiKey.revoked_at.is_(None),
+                    or_(ApiKey.expires_at.is_(None), ApiKey.expires_at > now),
+                )
+            ).scalars()
+        )
+
+api_key = CRUDApiKey(ApiKey)
@@ -0,0 +1,56 @@
+import uuid
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from app.crud.base import CRUDBase
+from app.models.auth_event import AuthEvent
+from app.schemas.auth_event import AuthEventCreate
+
+
+class CRUDAuthEvent(CRUDBase[AuthEvent, AuthEventCreate, AuthEventCreate]):
+    def get_range(
+        self,
+        db: Session,
+        *,
+        start: datetime,
+        end: datetime,
+        event_type: Optional[str] = None,
+        user_id: Optional[uuid.UUID] = None,
+        skip: int = 0,
+        limit: int = 100,
+    ) -> List[AuthEvent]:
+        # Each filter combination is served by one of the
+        # (..., occurred_at) indexes on auth_events
+        query = db.query(AuthEvent).filter(
+            AuthEvent.occurred_at >= start,
+            AuthEvent.occurred_at < end,
+        )
+        if event_type is not None:
+            query = query.filter(AuthEvent.event_type == event_type)
+        if user_id is not None:
+            query = query.filter(AuthEvent.user_id == user_id)
+        return query.order_by(AuthEvent.occurred_at).offset(skip).limit(limit).all()
+
+    def purge_before(self, db: Session, *, before: datetime, limit: int) -> int:
+        """
+        Delete up to limit of the oldest events that occurred before `before`
+        """
+        oldest = (
+            select(AuthEvent.id)
+            .where(AuthEvent.occurred_at < before)
+            .order_by(AuthEvent.occurred_at)
+            .limit(limit)
+        )
+        deleted = db.execute(
+            delete(AuthEvent)
+            .where(AuthEvent.id.in_(oldest))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        return deleted
+
+
+auth_event = CRUDAuthEvent(AuthEvent)
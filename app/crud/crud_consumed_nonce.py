@@ -0,0 +1,42 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models.consumed_nonce import ConsumedNonce
+
+
+class CRUDConsumedNonce:
+    def consume(self, db: Session, *, nonce: str, expires_at: datetime) -> bool:
+        """
+        Record the nonce in the current transaction, and return False if it
+        was used before. Call it before making any other changes, since a
+        reused nonce rolls the transaction back; the caller commits it
+        together with whatever the token allows.
+        """
+        db.add(ConsumedNonce(nonce=nonce, expires_at=expires_at))
+        try:
+            db.flush()
+        except IntegrityError:
+            db.rollback()
+            return False
+        return True
+
+    def purge_expired(self, db: Session, *, now: datetime, limit: Optional[int] = None) -> int:
+        """
+        Delete up to limit expired nonces (all of them without a limit)
+        """
+        expired = select(ConsumedNonce.nonce).where(ConsumedNonce.expires_at <= now)
+        if limit is not None:
+            expired = expired.limit(limit)
+        deleted = db.execute(
+            delete(ConsumedNonce)
+            .where(ConsumedNonce.nonce.in_(expired))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        return deleted
+
+consumed_nonce = CRUDConsumedNonce()
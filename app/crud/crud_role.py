@@ -0,0 +1,265 @@
+import uuid
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import and_, exists, lambda_stmt, or_, select
+from sqlalchemy.orm import Session, aliased
+
+from app.crud.base import CRUDBase
+from app.models.join_tables import RolesClosure, RolesParent, RolesPermission, UsersRole
+from app.models.permission import Permission
+from app.models.role import Role
+from app.schemas.role import RoleCreate, RoleUpdate
+
+
+class CRUDRole(CRUDBase[Role, RoleCreate, RoleUpdate]):
+    def get_by_name(
+        self, db: Session, *, role_name: str, tenant_id: Optional[str] = None
+    ) -> Optional[Role]:
+        """
+        The tenant's own role of that name, or else the system role.
+        Without a tenant only system roles are considered.
+        """
+        query = db.query(Role).filter(Role.role_name == role_name)
+        if tenant_id is None:
+            return query.filter(Role.tenant_id.is_(None)).first()
+        return (
+            query.filter(or_(Role.tenant_id == tenant_id, Role.tenant_id.is_(None)))
+            .order_by(Role.tenant_id.is_(None))
+            .first()
+        )
+
+    def add_parent(self, db: Session, *, role: Role, parent: Role) -> RolesParent:
+        """
+        Make parent inherit every permission of role, and update the closure
+        with only the (ancestor, descendant) pairs the new edge creates
+        """
+        edge = (
+            db.query(RolesParent)
+            .filter_by(role_id=role.id, parent_role_id=parent.id)
+            .first()
+        )
+        if edge:
+            return edge
+        if self.inherits(db, role_id=role.id, from_role_id=parent.id):
+            raise ValueError(
+                f"Role {role.role_name!r} already inherits from {parent.role_name!r}"
+            )
+
+        edge = RolesParent(role_id=role.id, parent_role_id=parent.id)
+        db.add(edge)
+
+        # Every ancestor of parent (parent included) now reaches every
+        # descendant of role (role included)
+        ancestors = aliased(RolesClosure)
+        descendants = aliased(RolesClosure)
+        existing = aliased(RolesClosure)
+        new_pairs = select(
+            ancestors.ancestor_role_id,
+            descendants.descendant_role_id,
+            ancestors.depth + descendants.depth + 1,
+        ).where(
+            ancestors.descendant_role_id == parent.id,
+            descendants.ancestor_role_id == role.id,
+            ~exists().where(
+                and_(
+                    existing.ancestor_role_id == ancestors.ancestor_role_id,
+                    existing.descendant_role_id == descendants.descendant_role_id,
+                )
+            ),
+        )
+        db.execute(
+            RolesClosure.__table__.insert().from_select(
+                ["ancestor_role_id", "descendant_role_id", "depth"], new_pairs
+            )
+        )
+        db.commit()
+        db.refresh(edge)
+        return edge
+
+    def remove_parent(self, db: Session, *, role: Role, parent: Role) -> bool:
+        edge = (
+            db.query(RolesParent)
+            .filter_by(role_id=role.id, parent_role_id=parent.id)
+            .first()
+        )
+        if not edge:
+            return False
+        db.delete(edge)
+        db.flush()
+        # Other paths may still connect the same pairs, so recompute the
+        # closure of the roles that could have lost something: parent and
+        # everything above it
+        affected = set(
+            db.execute(
+                select(RolesClosure.ancestor_role_id).where(
+                    RolesClosure.descendant_role_id == parent.id
+                )
+            ).scalars()
+        )
+        self._rebuild_closure(db, ancestor_ids=affected)
+        db.commit()
+        return True
+
+    def rebuild_closure(self, db: Session) -> None:
+        """
+        Recompute the whole closure from roles_parents, e.g. to backfill it
+        for roles created before the hierarchy existed
+        """
+        role_ids = set(db.execute(select(Role.id)).scalars())
+        self._rebuild_closure(db, ancestor_ids=role_ids)
+        db.commit()
+
+    def inherits(
+        self, db: Session, *, role_id: uuid.UUID, from_role_id: uuid.UUID
+    ) -> bool:
+        """
+        Whether role_id already holds every permission of from_role_id
+        """
+        return db.query(
+            exists().where(
+                RolesClosure.ancestor_role_id == role_id,
+                RolesClosure.descendant_role_id == from_role_id,
+            )
+        ).scalar()
+
+    def user_has_permission(
+        self,
+        db: Session,
+        *,
+        user_id: uuid.UUID,
+        permission_name: str,
+        target_user_id: Optional[uuid.UUID] = None,
+    ) -> bool:
+        """
+        Without a target any grant of the permission counts. With a target,
+        only grants for that user or unscoped grants (target_user_id NULL) do.
+        """
+        statement = _grants_statement(user_id, permission_name)
+        if target_user_id:
+            statement += lambda s: s.where(
+                or_(
+                    UsersRole.target_user_id.is_(None),
+                    UsersRole.target_user_id == target_user_id,
+                )
+            )
+        statement += lambda s: s.limit(1)
+        return db.execute(statement).first() is not None
+
+    def permitted_targets(
+        self,
+        db: Session,
+        *,
+        user_id: uuid.UUID,
+        permission_name: str,
+        target_user_ids: Iterable[uuid.UUID],
+        chunk_size: int = 500,
+    ) -> Set[uuid.UUID]:
+        """
+        Which of target_user_ids the user holds the permission for,
+        in one round-trip per chunk_size targets instead of one per target
+        """
+        target_user_ids = list(dict.fromkeys(target_user_ids))
+        permitted: Set[uuid.UUID] = set()
+        for i in range(0, len(target_user_ids), chunk_size):
+            chunk = target_user_ids[i : i + chunk_size]
+            statement = _grants_statement(user_id, permission_name)
+            statement += lambda s: s.where(
+                or_(
+                    UsersRole.target_user_id.is_(None),
+                    UsersRole.target_user_id.in_(chunk),
+                )
+            ).distinct()
+            granted = set(db.execute(statement).scalars())
+            if None in granted:
+                # An unscoped grant covers every target
+                return set(target_user_ids)
+            permitted |= granted
+        return permitted
+
+    def get_effective_permission_names(
+        self, db: Session, *, role_ids: List[uuid.UUID]
+    ) -> Set[str]:
+        return set(
+            db.execute(
+                select(Permission.permission_name)
+                .join(RolesPermission, RolesPermission.permission_id == Permission.id)
+                .join(
+                    RolesClosure,
+                    RolesClosure.descendant_role_id == RolesPermission.role_id,
+                )
+                .where(RolesClosure.ancestor_role_id.in_(role_ids))
+                .distinct()
+            ).scalars()
+        )
+
+    def get_effective_permissions_by_role(
+        self, db: Session, *, role_ids: List[uuid.UUID]
+    ) -> Dict[uuid.UUID, Set[str]]:
+        permissions: Dict[uuid.UUID, Set[str]] = defaultdict(set)
+        if not role_ids:
+            return permissions
+        for role_id, permission_name in db.execute(
+            select(RolesClosure.ancestor_role_id, Permission.permission_name)
+            .join(RolesPermission, RolesPermission.role_id == RolesClosure.descendant_role_id)
+            .join(Permission, Permission.id == RolesPermission.permission_id)
+            .where(RolesClosure.ancestor_role_id.in_(role_ids))
+        ):
+            permissions[role_id].add(permission_name)
+        return permissions
+
+    def _rebuild_closure(self, db: Session, *, ancestor_ids: Set[uuid.UUID]) -> None:
+        if not ancestor_ids:
+            return
+        children: Dict[uuid.UUID, List[uuid.UUID]] = defaultdict(list)
+        for role_id, parent_role_id in db.execute(
+            select(RolesParent.role_id, RolesParent.parent_role_id)
+        ):
+            children[parent_role_id].append(role_id)
+
+        rows = []
+        for ancestor_id in ancestor_ids:
+            # Breadth-first, so each descendant is recorded at its shortest depth
+            depths = {ancestor_id: 0}
+            frontier = [ancestor_id]
+            while frontier:
+                next_frontier = []
+                for role_id in frontier:
+                    for child_id in children[role_id]:
+                        if child_id not in depths:
+                            depths[child_id] = depths[role_id] + 1
+                            next_frontier.append(child_id)
+                frontier = next_frontier
+            rows.extend(
+                {
+                    "ancestor_role_id": ancestor_id,
+                    "descendant_role_id": descendant_id,
+                    "depth": depth,
+                }
+                for descendant_id, depth in depths.items()
+            )
+
+        db.execute(
+            RolesClosure.__table__.delete().where(
+                RolesClosure.ancestor_role_id.in_(list(ancestor_ids))
+            )
+        )
+        db.execute(RolesClosure.__table__.insert(), rows)
+
+
+def _grants_statement(user_id: uuid.UUID, permission_name: str):
+    # lambda_stmt caches the compiled SQL on the lambda's code object, so
+    # permission checks reuse it and only bind new parameter values
+    return lambda_stmt(
+        lambda: select(UsersRole.target_user_id)
+        .join(RolesClosure, RolesClosure.ancestor_role_id == UsersRole.role_id)
+        .join(RolesPermission, RolesPermission.role_id == RolesClosure.descendant_role_id)
+        .join(Permission, Permission.id == RolesPermission.permission_id)
+        .where(
+            UsersRole.user_id == user_id,
+            Permission.permission_name == permission_name,
+        )
+    )
+
+
+role = CRUDRole(Role)
@@ -0,0 +1,15 @@
+from typing import List
+
+from sqlalchemy.orm import Session
+
+from app.crud.base import CRUDBase
+from app.models.tenant import Tenant
+from app.schemas.tenant import TenantCreate, TenantUpdate
+
+
+class CRUDTenant(CRUDBase[Tenant, TenantCreate, TenantUpdate]):
+    def get_multi(self, db: Session, *, skip: int = 0, limit: int = 100) -> List[Tenant]:
+        return db.query(Tenant).order_by(Tenant.id).offset(skip).limit(limit).all()
+
+
+tenant = CRUDTenant(Tenant)
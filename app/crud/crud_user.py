@@ -1,42 +1,122 @@
-from datetime import datetime
-from typing import Any, Dict, List, Optional, Union
+from datetime import datetime, timedelta, timezone
+import uuid
+from typing import Any, Dict, Iterator, List, Optional, Union
 
-from pydantic import EmailError, validate_email
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import and_, lambda_stmt, select, text, update
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session, joinedload, selectinload
 
+from app.core import clock
+from app.core.config import settings
+from app.core.events import auth_events
+from app.core.principal import Principal, forget_principal
 from app.core.security import (
     get_password_hash,
     get_temporary_password,
-    verify_password,
+    verify_and_update_password,
 )
 from app.crud.base import CRUDBase
+from app.db.purge import delete_users
+from app.db.search import build_user_search
 from app.models.join_tables import UsersRole
+from app.models.login_key import LoginKey, normalize_login
 from app.models.role import Role
+from app.models.tenant import DEFAULT_TENANT_ID
 from app.models.user import User
 from app.schemas.user import (
     UserCreate,
     UserUpdate,
 )
 
+# How much of each user the admin listing loads along with it
+USER_PROFILES = ("none", "roles", "permissions")
+
 
 class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
-    def get_by_email(self, db: Session, *, email: str) -> Optional[User]:
-        return db.query(User).filter(User.email == email).first()
+    def get_by_email(
+        self, db: Session, *, email: str, tenant_id: str = DEFAULT_TENANT_ID
+    ) -> Optional[User]:
+        return (
+            db.query(User)
+            .filter(User.tenant_id == tenant_id, User.email == email)
+            .first()
+        )
 
-    def get_by_username(self, db: Session, *, username: str) -> Optional[User]:
-        return db.query(User).filter(User.username == username).first()
+    def get_by_username(
+        self, db: Session, *, username: str, tenant_id: str = DEFAULT_TENANT_ID
+    ) -> Optional[User]:
+        return (
+            db.query(User)
+            .filter(User.tenant_id == tenant_id, User.username == username)
+            .first()
+        )
+
+    def get_in_tenant(
+        self, db: Session, *, id: Any, tenant_id: str  # noqa: A002
+    ) -> Optional[User]:
+        return (
+            db.query(User)
+            .filter(User.id == id, User.tenant_id == tenant_id)
+            .first()
+        )
+
+    def get_principal(
+        self,
+        db: Session,
+        *,
+        user_id: uuid.UUID,
+        tenant_id: str,
+        via_api_key: bool = False,
+    ) -> Optional[Principal]:
+        """
+        The user and their role ids in one query, read as plain rows so
+        nothing enters the session's identity map
+        """
+        rows = db.execute(
+            select(
+                User.id,
+                User.tenant_id,
+                User.username,
+                User.email,
+                User.email_verified_at,
+                UsersRole.role_id,
+            )
+            # Matching on the tenant too lets the join use the grants'
+            # (tenant_id, user_id, role_id) index
+            .outerjoin(
+                UsersRole,
+                and_(UsersRole.tenant_id == User.tenant_id, UsersRole.user_id == User.id),
+            )
+            .where(User.id == user_id, User.tenant_id == tenant_id)
+        ).all()
+        if not rows:
+            return None
+        first = rows[0]
+        return Principal(
+            id=first.id,
+            tenant_id=first.tenant_id,
+            username=first.username,
+            email=first.email,
+            email_verified_at=first.email_verified_at,
+            role_ids=tuple(dict.fromkeys(row.role_id for row in rows if row.role_id)),
+            via_api_key=via_api_key,
+        )
 
     def create(
         self,
         db: Session,
         *,
         obj_in: UserCreate,
+        tenant_id: str = DEFAULT_TENANT_ID,
     ) -> User:
         db_obj = User(
+            tenant_id=tenant_id,
             email=obj_in.email,
             hashed_password=get_password_hash(obj_in.password),
             username=obj_in.username,
+            password_expires_at=self.password_expiry(),
         )
+        self._set_login_keys(db_obj, username=obj_in.username, email=obj_in.email)
         db.add(db_obj)
         db.commit()
         db.refresh(db_obj)
@@ -57,21 +137,83 @@ class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
             if update_data["password"]:
                 hashed_password = get_password_hash(update_data["password"])
                 update_data["hashed_password"] = hashed_password
+                update_data["password_expires_at"] = self.password_expiry()
             del update_data["password"]
+        if update_data.get("email", db_obj.email) != db_obj.email:
+            # The new address hasn't been verified yet
+            update_data["email_verified_at"] = None
+        self._set_login_keys(
+            db_obj,
+            username=update_data.get("username", db_obj.username),
+            email=update_data.get("email", db_obj.email),
+        )
+        forget_principal(db_obj.id)
         return super().update(db, db_obj=db_obj, obj_in=update_data)
 
+    def password_expiry(self) -> Optional[datetime]:
+        """
+        When a password set now expires, under PASSWORD_MAX_AGE_DAYS
+        """
+        if settings.PASSWORD_MAX_AGE_DAYS is None:
+            return None
+        return clock.utcnow() + timedelta(days=settings.PASSWORD_MAX_AGE_DAYS)
+
+    def is_password_expired(self, user: User) -> bool:
+        """
+        Whether the user's password is past its expiry. Expiries stamped
+        while the policy was on are ignored once PASSWORD_MAX_AGE_DAYS is
+        unset, so turning the policy off lets everyone log in again.
+        """
+        expires_at = user.password_expires_at
+        if expires_at is None or settings.PASSWORD_MAX_AGE_DAYS is None:
+            return False
+        if expires_at.tzinfo is not None:
+            expires_at = expires_at.astimezone(timezone.utc).replace(tzinfo=None)
+        return expires_at <= clock.utcnow()
+
+    def stamp_password_expiry(self, db: Session, *, limit: int) -> int:
+        """
+        Give up to limit users whose password has no expiry yet one under
+        the current PASSWORD_MAX_AGE_DAYS, counted from now so that turning
+        the policy on doesn't expire everyone's password at once
+        """
+        expires_at = self.password_expiry()
+        if expires_at is None:
+            return 0
+        unstamped = select(User.id).where(User.password_expires_at.is_(None)).limit(limit)
+        updated = db.execute(
+            update(User)
+            .where(User.id.in_(unstamped))
+            .values(password_expires_at=expires_at)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        return updated
+
+    def get_by_login(
+        self, db: Session, *, login: str, tenant_id: str = DEFAULT_TENANT_ID
+    ) -> Optional[User]:
+        """
+        The user whose username or email normalizes to the same login key
+        """
+        statement = _login_statement(tenant_id, normalize_login(login))
+        return db.execute(statement).scalars().first()
+
     def authenticate(
-        self, db: Session, *, email: str, password: str
+        self, db: Session, *, email: str, password: str, tenant_id: str = DEFAULT_TENANT_ID
     ) -> Optional[User]:
-        try:
-            validate_email(email)
-            user = self.get_by_email(db, email=email)
-        except EmailError:
-            user = self.get_by_username(db, username=email)
+        user = self.get_by_login(db, login=email, tenant_id=tenant_id)
         if not user:
             return None
-        if not verify_password(password, user.hashed_password):
+        verified, new_hash = verify_and_update_password(password, user.hashed_password)
+        if not verified:
             return None
+        if new_hash:
+            # Legacy hash: this is the only time we see the plain password,
+            # so upgrade it to the current scheme now
+            user.hashed_password = new_hash
+            db.add(user)
+            db.commit()
         return user
 
     def add_role(
@@ -80,19 +222,28 @@ class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
         users_role = (
             db.query(UsersRole)
             .filter_by(
-                user_id=user.id, role_id=role.id, target_user_id=target_user.id
+                user_id=user.id,
+                role_id=role.id,
+                target_user_id=target_user.id if target_user else None,
             )
             .first()
         )
         if users_role:
             return users_role
 
-        db_obj = UsersRole(user_id=user.id, role_id=role.id)
+        db_obj = UsersRole(tenant_id=user.tenant_id, user_id=user.id, role_id=role.id)
         if target_user:
             db_obj.target_user_id = target_user.id
         db.add(db_obj)
         db.commit()
         db.refresh(db_obj)
+        forget_principal(user.id)
+        auth_events.emit(
+            "role_added",
+            user_id=user.id,
+            role_id=role.id,
+            target_user_id=db_obj.target_user_id,
+        )
         return db_obj
 
     def delete_role(
@@ -101,57 +252,174 @@ class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
         users_role = (
             db.query(UsersRole)
             .filter_by(
-                user_id=user.id, role_id=role.id, target_user_id=target_user.id
+                user_id=user.id,
+                role_id=role.id,
+                target_user_id=target_user.id if target_user else None,
             )
             .first()
         )
         if users_role:
+            target_user_id = users_role.target_user_id
             db.delete(users_role)
             db.commit()
+            forget_principal(user.id)
+            auth_events.emit(
+                "role_removed",
+                user_id=user.id,
+                role_id=role.id,
+                target_user_id=target_user_id,
+            )
         return True
 
     def get_all_users(
-        self, db: Session, *, created_after: datetime, created_before: datetime
+        self,
+        db: Session,
+        *,
+        created_after: datetime,
+        created_before: datetime,
+        tenant_id: str = DEFAULT_TENANT_ID,
+        profile: str = "none",
+        skip: int = 0,
+        limit: Optional[int] = None,
     ) -> Optional[List[User]]:
-        return (
+        """
+        With the "roles" or "permissions" profile, each user's grants and
+        their roles come preloaded by selectinload: one query per level
+        (per 500 users), however many users there are, instead of a lazy
+        load per user
+        """
+        query = (
             db.query(User)
             .filter(
+                User.tenant_id == tenant_id,
                 User.created_at < created_before,
                 User.created_at > created_after,
             )
             .order_by(User.created_at)
-            .all()
         )
+        if profile in ("roles", "permissions"):
+            query = query.options(selectinload(User.roles).selectinload(UsersRole.role))
+        return query.offset(skip).limit(limit).all()
 
-    def delete_user(self, db: Session, *, user: User) -> bool:
-        user_obj = (
+    def search(
+        self,
+        db: Session,
+        *,
+        query: str,
+        mode: str = "substring",
+        skip: int = 0,
+        limit: int = 50,
+        tenant_id: str = DEFAULT_TENANT_ID,
+    ) -> List[User]:
+        query = query.strip()
+        if not query:
+            return []
+        dialect = db.get_bind().dialect.name
+        if len(query) < 3 and dialect != "postgresql":
+            # Too short for the trigram index; a range scan over the
+            # tenant's part of the unique username index still avoids a
+            # full table scan
+            return (
+                db.query(User)
+                .filter(
+                    User.tenant_id == tenant_id,
+                    User.username >= query,
+                    User.username < query + "\uffff",
+                )
+                .order_by(User.username)
+                .offset(skip)
+                .limit(limit)
+                .all()
+            )
+        statement, params = build_user_search(dialect, query, mode)
+        return (
             db.query(User)
-            .filter(User.id == user.id)
-            .first()
+            .from_statement(text(f"{statement} LIMIT :limit OFFSET :skip"))
+            .params(limit=limit, skip=skip, tenant_id=tenant_id, **params)
+            .all()
         )
-        if user_obj:
-            db.flush()
-            db.delete(user_obj)
-            db.commit()
-            return True
-        return False
+
+    def delete_user(self, db: Session, *, user: User) -> bool:
+        # The same deletes as a bulk purge, so grants held by or scoped to
+        # the user and their keys and events go with them
+        deleted = delete_users(db.connection(), [(user.id, user.tenant_id)])
+        db.commit()
+        forget_principal(user.id)
+        return deleted["users"] > 0
 
     def get_by_email_or_username(
-        self, db: Session, *, email_or_username: str
+        self, db: Session, *, email_or_username: str, tenant_id: str = DEFAULT_TENANT_ID
     ) -> Optional[User]:
-        try:
-            validate_email(email_or_username)
-            user = self.get_by_email(db, email=email_or_username)
-        except EmailError:
-            user = self.get_by_username(db, username=email_or_username)
-        if not user:
-            return None
-        return user
+        return self.get_by_login(db, login=email_or_username, tenant_id=tenant_id)
+
+    def _set_login_keys(self, user: User, **identifiers: Optional[str]) -> None:
+        """
+        Point the user's login keys at their current username and email
+        """
+        current = {key.kind: key for key in user.login_keys}
+        for kind, identifier in identifiers.items():
+            login_key = normalize_login(identifier) if identifier else None
+            existing = current.get(kind)
+            if existing is not None:
+                if existing.login_key == login_key:
+                    continue
+                user.login_keys.remove(existing)
+            if login_key and login_key not in {key.login_key for key in user.login_keys}:
+                user.login_keys.append(
+                    LoginKey(tenant_id=user.tenant_id, login_key=login_key, kind=kind)
+                )
+
+    def iter_password_reset_targets(
+        self,
+        db: Session,
+        *,
+        tenant_id: str,
+        user_ids: Optional[List[uuid.UUID]] = None,
+        created_before: Optional[datetime] = None,
+        chunk_size: int = 5000,
+    ) -> Iterator[List[Row]]:
+        """
+        Chunks of (id, username, email, hashed_password) of every user with
+        an email matching the filters. Each chunk is its own query, picking
+        up after the last id of the one before, so no cursor stays open
+        while the caller works through a chunk.
+        """
+        statement = select(User.id, User.username, User.email, User.hashed_password).where(
+            User.tenant_id == tenant_id, User.email.isnot(None)
+        )
+        if user_ids is not None:
+            statement = statement.where(User.id.in_(user_ids))
+        if created_before is not None:
+            statement = statement.where(User.created_at < created_before)
+        statement = statement.order_by(User.id).limit(chunk_size)
+        after = None
+        while True:
+            chunk_statement = statement if after is None else statement.where(User.id > after)
+            chunk = db.execute(chunk_statement).all()
+            if not chunk:
+                return
+            yield chunk
+            after = chunk[-1].id
 
     def get_multiple(
         self, db: Session, *, user_ids: List[int]
     ) -> Optional[List[User]]:
         return db.query(User).filter(User.id.in_(user_ids)).all()
 
+    def get_tenant_ids(self, db: Session, *, user_ids: List[uuid.UUID]) -> Dict[uuid.UUID, str]:
+        """
+        The tenant of each of the users that still exist
+        """
+        return dict(db.execute(select(User.id, User.tenant_id).where(User.id.in_(user_ids))).all())
+
+
+def _login_statement(tenant_id: str, login_key: str):
+    # Compiled once and cached on the lambda, like the permission checks
+    return lambda_stmt(
+        lambda: select(User)
+        .join(LoginKey, LoginKey.user_id == User.id)
+        .where(LoginKey.tenant_id == tenant_id, LoginKey.login_key == login_key)
+    )
+
 
 user = CRUDUser(User)
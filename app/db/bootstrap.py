@@ -0,0 +1,210 @@
+"""
+Idempotent schema and seed data bootstrap.
+
+The roles and permissions the app needs are declared in a manifest
+(app/db/manifest.json by default). bootstrap() creates any missing tables
+and indexes, diffs the manifest against the database and applies only the
+difference, in bulk. Running it again against an up to date database
+changes nothing.
+
+Schema changes create_all() can't make to an existing database are
+applied by app.db.migrations before anything else.
+
+For the roles it lists, the manifest is authoritative: permissions and
+inherited roles missing from the manifest are removed from them. Roles and
+permissions the manifest doesn't mention are left alone.
+"""
+import json
+import uuid
+from collections import Counter
+from typing import Any, Dict, Optional
+
+from sqlalchemy import bindparam, delete, insert, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.migrations import migrate
+from app.db.search import ensure_user_search_index
+from app.models import Base, EnumsPermissionName, Permission, Role
+from app.models.join_tables import RolesParent, RolesPermission
+
+Manifest = Dict[str, Any]
+
+
+def load_manifest(path: Optional[str] = None) -> Manifest:
+    with open(path or settings.BOOTSTRAP_MANIFEST_PATH) as f:
+        return json.load(f)
+
+
+def create_schema(engine: Engine) -> None:
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        migrate(connection)
+        ensure_user_search_index(connection)
+
+
+def _update_descriptions(db: Session, column, table, rows, *criteria) -> None:
+    if rows:
+        db.execute(
+            update(table)
+            .where(column == bindparam("key"), *criteria)
+            .values(description=bindparam("description")),
+            rows,
+        )
+
+
+def apply_manifest(db: Session, manifest: Manifest, *, dry_run: bool = False) -> Dict[str, int]:
+    from app import crud
+
+    report: Counter = Counter()
+    permissions: Dict[str, str] = manifest.get("permissions", {})
+    roles: Dict[str, Dict[str, Any]] = manifest.get("roles", {})
+
+    # Permission names. Each one has a single permissions row
+    enum_descriptions = dict(
+        db.execute(
+            select(EnumsPermissionName.title, EnumsPermissionName.description)
+        ).all()
+    )
+    permission_rows = {
+        name: (id_, description)
+        for id_, name, description in db.execute(
+            select(Permission.id, Permission.permission_name, Permission.description)
+        )
+    }
+    new_enums, new_permissions, changed_enums, changed_permissions = [], [], [], []
+    for name, description in permissions.items():
+        if name not in enum_descriptions:
+            new_enums.append({"title": name, "description": description})
+        elif enum_descriptions[name] != description:
+            changed_enums.append({"key": name, "description": description})
+        if name not in permission_rows:
+            permission_id = uuid.uuid4()
+            new_permissions.append(
+                {"id": permission_id, "permission_name": name, "description": description}
+            )
+            permission_rows[name] = (permission_id, description)
+        elif permission_rows[name][1] != description:
+            changed_permissions.append({"key": name, "description": description})
+
+    if new_enums:
+        db.execute(insert(EnumsPermissionName.__table__), new_enums)
+    if new_permissions:
+        db.execute(insert(Permission.__table__), new_permissions)
+    _update_descriptions(db, EnumsPermissionName.title, EnumsPermissionName.__table__, changed_enums)
+    _update_descriptions(db, Permission.permission_name, Permission.__table__, changed_permissions)
+    report["permissions_created"] = len(new_permissions)
+    report["permissions_updated"] = len(changed_permissions)
+
+    # Roles. The manifest only manages system roles, which have no tenant
+    role_rows = {
+        name: (id_, description)
+        for id_, name, description in db.execute(
+            select(Role.id, Role.role_name, Role.description).where(Role.tenant_id.is_(None))
+        )
+    }
+    new_roles, changed_roles = [], []
+    for name, spec in roles.items():
+        description = spec.get("description")
+        if name not in role_rows:
+            role_id = uuid.uuid4()
+            new_roles.append({"id": role_id, "role_name": name, "description": description})
+            role_rows[name] = (role_id, description)
+        elif role_rows[name][1] != description:
+            changed_roles.append({"key": name, "description": description})
+    if new_roles:
+        db.execute(insert(Role.__table__), new_roles)
+    _update_descriptions(
+        db, Role.role_name, Role.__table__, changed_roles, Role.tenant_id.is_(None)
+    )
+    report["roles_created"] = len(new_roles)
+    report["roles_updated"] = len(changed_roles)
+
+    role_ids = {name: role_rows[name][0] for name in roles}
+    permission_ids = {}
+    for spec in roles.values():
+        for name in spec.get("permissions", []):
+            if name not in permission_rows:
+                raise ValueError(f"Unknown permission {name!r} in manifest")
+            permission_ids[name] = permission_rows[name][0]
+        for name in spec.get("inherits", []):
+            if name not in role_rows:
+                raise ValueError(f"Unknown inherited role {name!r} in manifest")
+
+    # Role permissions
+    wanted_grants = {
+        (role_ids[name], permission_ids[permission])
+        for name, spec in roles.items()
+        for permission in spec.get("permissions", [])
+    }
+    existing_grants = {
+        (role_id, permission_id): id_
+        for id_, role_id, permission_id in db.execute(
+            select(
+                RolesPermission.id, RolesPermission.role_id, RolesPermission.permission_id
+            ).where(RolesPermission.role_id.in_(list(role_ids.values())))
+        )
+    }
+    added_grants = [
+        {"id": uuid.uuid4(), "role_id": role_id, "permission_id": permission_id}
+        for role_id, permission_id in wanted_grants - existing_grants.keys()
+    ]
+    removed_grants = [existing_grants[pair] for pair in existing_grants.keys() - wanted_grants]
+    if added_grants:
+        db.execute(insert(RolesPermission.__table__), added_grants)
+    if removed_grants:
+        db.execute(delete(RolesPermission.__table__).where(RolesPermission.id.in_(removed_grants)))
+    report["role_permissions_added"] = len(added_grants)
+    report["role_permissions_removed"] = len(removed_grants)
+
+    # Inheritance: "Admin": {"inherits": ["Support"]} is the edge Support -> Admin
+    wanted_edges = {
+        (role_rows[inherited][0], role_ids[name])
+        for name, spec in roles.items()
+        for inherited in spec.get("inherits", [])
+    }
+    existing_edges = {
+        (role_id, parent_role_id): id_
+        for id_, role_id, parent_role_id in db.execute(
+            select(RolesParent.id, RolesParent.role_id, RolesParent.parent_role_id).where(
+                RolesParent.parent_role_id.in_(list(role_ids.values()))
+            )
+        )
+    }
+    added_edges = [
+        {"id": uuid.uuid4(), "role_id": role_id, "parent_role_id": parent_role_id}
+        for role_id, parent_role_id in wanted_edges - existing_edges.keys()
+    ]
+    removed_edges = [existing_edges[edge] for edge in existing_edges.keys() - wanted_edges]
+    if added_edges:
+        db.execute(insert(RolesParent.__table__), added_edges)
+    if removed_edges:
+        db.execute(delete(RolesParent.__table__).where(RolesParent.id.in_(removed_edges)))
+    report["role_parents_added"] = len(added_edges)
+    report["role_parents_removed"] = len(removed_edges)
+
+    if dry_run:
+        db.rollback()
+    elif new_roles or added_edges or removed_edges:
+        # Core inserts skip the ORM event that adds closure rows,
+        # and the hierarchy may have changed shape; rebuild_closure commits
+        crud.role.rebuild_closure(db)
+    else:
+        db.commit()
+    return dict(report)
+
+
+def bootstrap(
+    engine: Engine,
+    manifest: Optional[Manifest] = None,
+    *,
+    dry_run: bool = False,
+) -> Dict[str, int]:
+    if not dry_run:
+        create_schema(engine)
+    db = Session(bind=engine)
+    try:
+        return apply_manifest(db, manifest or load_manifest(), dry_run=dry_run)
+    finally:
+        db.close()
@@ -0,0 +1,98 @@
+"""
+Periodic database maintenance, run by the in-process scheduler.
+
+- expire_passwords: gives users without a password expiry one, when
+  PASSWORD_MAX_AGE_DAYS is set; logins enforce it
+- purge_consumed_nonces: single-use token nonces past their token's expiry
+- purge_api_keys: keys revoked or expired API_KEY_RETENTION_DAYS ago
+- purge_auth_events: events older than AUTH_EVENTS_RETENTION_DAYS
+- checkpoint: copies SQLite's write-ahead log back into the database
+  file; a no-op unless the database is in WAL mode
+- optimize: refreshes the query planner's statistics
+"""
+from datetime import timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import text
+
+from app import crud
+from app.core import clock
+from app.core.config import settings
+from app.core.scheduler import LeaderLock, Scheduler, Throttle
+from app.db.session import SessionLocal, engine
+
+
+def expire_passwords(throttle: Throttle) -> int:
+    with SessionLocal() as db:
+        return throttle.run(
+            lambda limit: crud.user.stamp_password_expiry(db, limit=limit),
+            settings.SCHEDULER_CHUNK_SIZE,
+        )
+
+
+def purge_consumed_nonces(throttle: Throttle) -> int:
+    now = clock.utcnow()
+    with SessionLocal() as db:
+        return throttle.run(
+            lambda limit: crud.consumed_nonce.purge_expired(db, now=now, limit=limit),
+            settings.SCHEDULER_CHUNK_SIZE,
+        )
+
+
+def purge_api_keys(throttle: Throttle) -> int:
+    before = clock.utcnow() - timedelta(days=settings.API_KEY_RETENTION_DAYS)
+    with SessionLocal() as db:
+        return throttle.run(
+            lambda limit: crud.api_key.purge_dead(db, before=before, limit=limit),
+            settings.SCHEDULER_CHUNK_SIZE,
+        )
+
+
+def purge_auth_events(throttle: Throttle) -> int:
+    if settings.AUTH_EVENTS_RETENTION_DAYS is None:
+        return 0
+    before = clock.utcnow() - timedelta(days=settings.AUTH_EVENTS_RETENTION_DAYS)
+    with SessionLocal() as db:
+        return throttle.run(
+            lambda limit: crud.auth_event.purge_before(db, before=before, limit=limit),
+            settings.SCHEDULER_CHUNK_SIZE,
+        )
+
+
+def checkpoint(throttle: Throttle) -> Optional[Dict[str, int]]:
+    if engine.dialect.name != "sqlite":
+        return None
+    with engine.connect() as connection:
+        # PASSIVE copies what it can without waiting on readers or writers
+        busy, log_frames, checkpointed = connection.execute(
+            text("PRAGMA wal_checkpoint(PASSIVE)")
+        ).one()
+    return {"busy": busy, "log_frames": log_frames, "checkpointed": checkpointed}
+
+
+def optimize(throttle: Throttle) -> None:
+    with engine.begin() as connection:
+        if engine.dialect.name == "sqlite":
+            # Only analyzes tables whose statistics look stale, with a
+            # bounded number of rows per index
+            connection.execute(text("PRAGMA analysis_limit=1000"))
+            connection.execute(text("PRAGMA optimize"))
+        else:
+            connection.execute(text("ANALYZE"))
+
+
+def create_scheduler() -> Scheduler:
+    scheduler = Scheduler(
+        LeaderLock(settings.SCHEDULER_LOCK_PATH), duty_cycle=settings.SCHEDULER_DUTY_CYCLE
+    )
+    sweep = settings.SCHEDULER_SWEEP_INTERVAL_SECONDS
+    scheduler.add("expire_passwords", sweep, expire_passwords)
+    scheduler.add("purge_consumed_nonces", sweep, purge_consumed_nonces)
+    scheduler.add("purge_api_keys", sweep, purge_api_keys)
+    scheduler.add("purge_auth_events", sweep, purge_auth_events)
+    scheduler.add("checkpoint", settings.SCHEDULER_CHECKPOINT_INTERVAL_SECONDS, checkpoint)
+    scheduler.add("optimize", settings.SCHEDULER_OPTIMIZE_INTERVAL_SECONDS, optimize)
+    return scheduler
+
+
+scheduler = create_scheduler()
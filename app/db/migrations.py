@@ -0,0 +1,178 @@
+"""
+Schema changes that create_all() can't make to an existing database.
+
+create_all() only creates missing tables and their indexes, so columns
+added to existing tables and constraints that changed shape are applied
+here. Each migration runs once per database and is recorded in
+schema_migrations. They are written to be no-ops against a database
+create_all() just made, so a fresh database simply records them all.
+"""
+from typing import Callable, List, Set, Tuple
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, func, inspect, select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import CreateColumn, CreateTable
+
+from app.models import DEFAULT_TENANT_ID, Base, LoginKey, Tenant, User, normalize_login
+
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("id", String, primary_key=True),
+    Column("applied_at", DateTime, nullable=False, server_default=func.current_timestamp()),
+)
+
+
+def _rebuild_sqlite_table(connection: Connection, table: Table) -> None:
+    """
+    Recreate a table from its model, keeping its rows and rowids.
+    SQLite can't add constrained columns or drop inline UNIQUE constraints
+    in place, so this is its documented way of changing a table's shape.
+    The app doesn't turn on PRAGMA foreign_keys, so dropping the old table
+    leaves the rows referencing it alone.
+    """
+    existing = {column["name"] for column in inspect(connection).get_columns(table.name)}
+    copied = ", ".join(column.name for column in table.columns if column.name in existing)
+    temporary = f"{table.name}__new"
+
+    ddl = str(CreateTable(table).compile(connection)).replace(
+        f"CREATE TABLE {table.name} ", f"CREATE TABLE {temporary} ", 1
+    )
+    connection.execute(text(ddl))
+    connection.execute(
+        text(
+            f"INSERT INTO {temporary} (rowid, {copied}) SELECT rowid, {copied} FROM {table.name}"
+        )
+    )
+    connection.execute(text(f"DROP TABLE {table.name}"))
+    connection.execute(text(f"ALTER TABLE {temporary} RENAME TO {table.name}"))
+    for index in table.indexes:
+        index.create(connection, checkfirst=True)
+
+
+def _add_column(connection: Connection, table: Table, column_name: str) -> None:
+    column = table.c[column_name]
+    ddl = str(CreateColumn(column).compile(connection))
+    for foreign_key in column.foreign_keys:
+        ddl += (
+            f" REFERENCES {foreign_key.column.table.name} ({foreign_key.column.name})"
+            f" ON DELETE {foreign_key.ondelete} ON UPDATE {foreign_key.onupdate}"
+        )
+    connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+
+
+def _replace_unique_indexes(connection: Connection, table: Table) -> None:
+    """
+    Drop unique constraints and indexes the model no longer declares,
+    then create the ones it does
+    """
+    inspector = inspect(connection)
+    wanted = {index.name for index in table.indexes}
+    for constraint in inspector.get_unique_constraints(table.name):
+        if constraint["name"] not in wanted:
+            connection.execute(
+                text(f'ALTER TABLE {table.name} DROP CONSTRAINT "{constraint["name"]}"')
+            )
+    for index in inspector.get_indexes(table.name):
+        if index["unique"] and index["name"] not in wanted:
+            connection.execute(text(f'DROP INDEX IF EXISTS "{index["name"]}"'))
+    for index in table.indexes:
+        index.create(connection, checkfirst=True)
+
+
+def add_tenants(connection: Connection) -> None:
+    """
+    Give users, roles and their grants a tenant. Existing users and grants
+    join the default tenant; existing roles become system roles. Uniqueness
+    of usernames, emails and role names becomes per tenant.
+    """
+    if not connection.execute(select(Tenant.id).where(Tenant.id == DEFAULT_TENANT_ID)).first():
+        connection.execute(Tenant.__table__.insert().values(id=DEFAULT_TENANT_ID, name="Default"))
+    for table_name in ("users", "roles", "users_roles"):
+        table = Base.metadata.tables[table_name]
+        columns = {column["name"] for column in inspect(connection).get_columns(table_name)}
+        if "tenant_id" in columns:
+            continue
+        if connection.dialect.name == "sqlite":
+            # Rowids are kept, so the users search index stays valid
+            _rebuild_sqlite_table(connection, table)
+        else:
+            _add_column(connection, table, "tenant_id")
+            _replace_unique_indexes(connection, table)
+
+
+def add_email_verified_at(connection: Connection) -> None:
+    columns = {column["name"] for column in inspect(connection).get_columns("users")}
+    if "email_verified_at" not in columns:
+        _add_column(connection, Base.metadata.tables["users"], "email_verified_at")
+
+
+def add_login_keys(connection: Connection, chunk_size: int = 10_000) -> None:
+    """
+    Backfill login_keys from every user's username and email. Where two
+    identifiers only differed by case, the earliest user keeps the key;
+    the later one still logs in with their other identifier.
+    """
+    seen: Set[Tuple[str, str]] = set(
+        connection.execute(select(LoginKey.tenant_id, LoginKey.login_key)).all()
+    )
+    rows = connection.execute(
+        select(User.tenant_id, User.id, User.username, User.email).order_by(
+            User.created_at, User.id
+        )
+    )
+    chunk: List[dict] = []
+    for tenant_id, user_id, username, email in rows:
+        for kind, identifier in (("username", username), ("email", email)):
+            if not identifier:
+                continue
+            key = (tenant_id, normalize_login(identifier))
+            if key in seen:
+                continue
+            seen.add(key)
+            chunk.append(
+                {"tenant_id": tenant_id, "login_key": key[1], "user_id": user_id, "kind": kind}
+            )
+        if len(chunk) >= chunk_size:
+            connection.execute(LoginKey.__table__.insert(), chunk)
+            chunk = []
+    if chunk:
+        connection.execute(LoginKey.__table__.insert(), chunk)
+
+
+def add_last_login(connection: Connection) -> None:
+    """
+    Logins already set User.last_login, which had no column to go to.
+    Also replace the grants' target_user_id index with one that covers
+    user_id too.
+    """
+    columns = {column["name"] for column in inspect(connection).get_columns("users")}
+    if "last_login" not in columns:
+        _add_column(connection, Base.metadata.tables["users"], "last_login")
+    connection.execute(text("DROP INDEX IF EXISTS ix_users_roles_target_user_id"))
+    for index in Base.metadata.tables["users_roles"].indexes:
+        index.create(connection, checkfirst=True)
+
+
+MIGRATIONS: List[Tuple[str, Callable[[Connection], None]]] = [
+    ("0001_tenants", add_tenants),
+    ("0002_email_verified_at", add_email_verified_at),
+    ("0003_login_keys", add_login_keys),
+    ("0004_last_login", add_last_login),
+]
+
+
+def migrate(connection: Connection) -> List[str]:
+    """
+    Apply every migration this database hasn't seen yet, in order
+    """
+    schema_migrations.create(connection, checkfirst=True)
+    applied = set(connection.execute(select(schema_migrations.c.id)).scalars())
+    ran = []
+    for migration_id, step in MIGRATIONS:
+        if migration_id in applied:
+            continue
+        step(connection)
+        connection.execute(schema_migrations.insert().values(id=migration_id))
+        ran.append(migration_id)
+    return ran
@@ -0,0 +1,256 @@
+"""
+Bulk deletion of users and everything that refers to them.
+
+Candidates are read in primary key order, a chunk at a time, and each
+chunk is deleted in its own short transaction with Core statements of
+the form DELETE ... WHERE user_id IN (...). Every table that refers to
+users is handled here explicitly rather than left to ON DELETE CASCADE,
+which SQLite only honours with PRAGMA foreign_keys on:
+
+- login_keys and api_keys of the users
+- grants held by the users, and grants scoped to them
+- the users' own auth events (events they acted in on others keep the
+  actor's id, which no longer resolves to anyone)
+
+The last id done is recorded in a checkpoint, so an interrupted purge
+resumes where it stopped. Chunk size adapts to measured latency: each
+chunk's transaction should take about target_seconds. The purge rests
+between chunks so that it holds the database at most duty_cycle of the
+time.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_right
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, exists, func, or_, select
+from sqlalchemy.engine import Connection, Engine, Row
+
+from app.core import clock
+from app.core.principal import forget_principal
+from app.models import ApiKey, AuthEvent, LoginKey, User, UsersRole
+
+
+@dataclass
+class PurgeCriteria:
+    """
+    Users matching every given criterion are purged
+    """
+
+    tenant_id: Optional[str] = None
+    # Last logged in before this, or never logged in and created before it,
+    # and holding no live API key: last_login only records password
+    # logins, and an API key client may never make one
+    inactive_before: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+    user_ids: Optional[List[uuid.UUID]] = None
+
+    def clauses(self) -> list:
+        clauses = []
+        if self.tenant_id is not None:
+            clauses.append(User.tenant_id == self.tenant_id)
+        if self.inactive_before is not None:
+            clauses.append(func.coalesce(User.last_login, User.created_at) < self.inactive_before)
+            clauses.append(
+                ~exists().where(
+                    ApiKey.user_id == User.id,
+                    ApiKey.revoked_at.is_(None),
+                    or_(ApiKey.expires_at.is_(None), ApiKey.expires_at > clock.utcnow()),
+                )
+            )
+        if self.created_before is not None:
+            clauses.append(User.created_at < self.created_before)
+        return clauses
+
+    def to_json(self) -> Dict[str, Any]:
+        return json.loads(json.dumps(asdict(self), default=str))
+
+
+@dataclass
+class PurgeCheckpoint:
+    criteria: Dict[str, Any]
+    # Candidates are visited in id order; everything up to here is done
+    last_id: Optional[str] = None
+    deleted: Dict[str, int] = field(default_factory=dict)
+    chunks: int = 0
+    finished: bool = False
+
+    @classmethod
+    def load(cls, path: str) -> Optional["PurgeCheckpoint"]:
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            return cls(**json.load(f))
+
+    def save(self, path: str) -> None:
+        # Written aside and renamed, so a crash never leaves half a file
+        temporary_path = path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump(asdict(self), f)
+        os.replace(temporary_path, path)
+
+
+class LatencyThrottle:
+    """
+    Halves the chunk size when a chunk takes over 1.5x target_seconds and
+    grows it by half when it takes under half of it, then rests in
+    proportion to the chunk's duration
+    """
+
+    def __init__(
+        self,
+        chunk_size: int,
+        *,
+        target_seconds: float,
+        duty_cycle: float,
+        min_chunk_size: int = 10,
+        max_chunk_size: int = 5000,
+        stopping: Optional[threading.Event] = None,
+    ):
+        self.chunk_size = chunk_size
+        self.target_seconds = target_seconds
+        self.duty_cycle = duty_cycle
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.stopping = stopping or threading.Event()
+
+    def observe(self, elapsed: float) -> bool:
+        """
+        Adjust to a chunk that took elapsed seconds, rest, and return
+        False if the purge should stop
+        """
+        if elapsed > self.target_seconds * 1.5:
+            self.chunk_size = max(self.min_chunk_size, self.chunk_size // 2)
+        elif elapsed < self.target_seconds / 2:
+            self.chunk_size = min(self.max_chunk_size, self.chunk_size + self.chunk_size // 2)
+        return not self.stopping.wait(elapsed * (1 - self.duty_cycle) / self.duty_cycle)
+
+
+def delete_users(connection: Connection, users: Sequence[Tuple[uuid.UUID, str]]) -> Dict[str, int]:
+    """
+    Delete the (id, tenant_id) users and the rows referring to them, in the
+    connection's current transaction
+    """
+    ids = [user_id for user_id, _ in users]
+    tenant_ids = list({tenant_id for _, tenant_id in users})
+    deleted = {
+        "login_keys": connection.execute(
+            delete(LoginKey.__table__).where(LoginKey.user_id.in_(ids))
+        ).rowcount,
+        "api_keys": connection.execute(
+            delete(ApiKey.__table__).where(ApiKey.user_id.in_(ids))
+        ).rowcount,
+        # Both through an index: (tenant_id, user_id, ...) and
+        # (target_user_id, user_id)
+        "grants": connection.execute(
+            delete(UsersRole.__table__).where(
+                UsersRole.tenant_id.in_(tenant_ids), UsersRole.user_id.in_(ids)
+            )
+        ).rowcount
+        + connection.execute(
+            delete(UsersRole.__table__).where(UsersRole.target_user_id.in_(ids))
+        ).rowcount,
+        "auth_events": connection.execute(
+            delete(AuthEvent.__table__).where(AuthEvent.user_id.in_(ids))
+        ).rowcount,
+        "users": connection.execute(delete(User.__table__).where(User.id.in_(ids))).rowcount,
+    }
+    return deleted
+
+
+def _candidates(
+    connection: Connection,
+    criteria: PurgeCriteria,
+    after: Optional[str],
+    limit: Optional[int],
+) -> Tuple[List[Row], Optional[str]]:
+    """
+    The next chunk of users to delete, and the id the chunk after it
+    starts from, or None when there are no more chunks
+    """
+    statement = select(User.id, User.tenant_id).where(*criteria.clauses())
+    if criteria.user_ids is not None:
+        # Listed ids are walked in the same order, a chunk at a time, so
+        # no statement carries more of them than one chunk
+        pending = sorted(str(user_id) for user_id in criteria.user_ids)
+        if after is not None:
+            pending = pending[bisect_right(pending, after) :]
+        if limit is not None:
+            pending = pending[: limit]
+        if not pending:
+            return [], None
+        statement = statement.where(User.id.in_([uuid.UUID(user_id) for user_id in pending]))
+        # A chunk of listed ids that no longer exist matches nothing, but
+        # the walk goes on past it
+        return connection.execute(statement.order_by(User.id)).all(), pending[-1]
+    if after is not None:
+        statement = statement.where(User.id > uuid.UUID(after))
+    users = connection.execute(statement.order_by(User.id).limit(limit)).all()
+    return users, str(users[-1].id) if users else None
+
+
+def count_candidates(engine: Engine, criteria: PurgeCriteria, chunk_size: int = 10_000) -> int:
+    if criteria.user_ids is None:
+        with engine.connect() as connection:
+            return connection.execute(
+                select(func.count()).select_from(User).where(*criteria.clauses())
+            ).scalar()
+    count, after = 0, None
+    with engine.connect() as connection:
+        while True:
+            users, after = _candidates(connection, criteria, after, chunk_size)
+            count += len(users)
+            if after is None:
+                return count
+
+
+def purge_users(
+    engine: Engine,
+    criteria: PurgeCriteria,
+    throttle: LatencyThrottle,
+    *,
+    checkpoint_path: Optional[str] = None,
+    on_chunk: Optional[Callable[[PurgeCheckpoint, float, int], None]] = None,
+) -> PurgeCheckpoint:
+    checkpoint = None
+    if checkpoint_path:
+        checkpoint = PurgeCheckpoint.load(checkpoint_path)
+        if checkpoint is not None and checkpoint.criteria != criteria.to_json():
+            raise ValueError(
+                f"{checkpoint_path} belongs to a purge with other criteria: {checkpoint.criteria}"
+            )
+    if checkpoint is None:
+        checkpoint = PurgeCheckpoint(criteria=criteria.to_json())
+
+    while not checkpoint.finished:
+        started = time.monotonic()
+        with engine.begin() as connection:
+            # Chosen inside the deleting transaction, so a user who logs in
+            # meanwhile is either still a candidate or not picked at all
+            users, next_id = _candidates(
+                connection, criteria, checkpoint.last_id, throttle.chunk_size
+            )
+            deleted = delete_users(connection, users) if users else {}
+        elapsed = time.monotonic() - started
+
+        if next_id is None:
+            checkpoint.finished = True
+        else:
+            for user_id, _ in users:
+                forget_principal(user_id)
+            checkpoint.last_id = next_id
+            checkpoint.chunks += 1
+            for table, count in deleted.items():
+                checkpoint.deleted[table] = checkpoint.deleted.get(table, 0) + count
+        if checkpoint_path:
+            checkpoint.save(checkpoint_path)
+        if on_chunk is not None:
+            on_chunk(checkpoint, elapsed, throttle.chunk_size)
+        if not checkpoint.finished and not throttle.observe(elapsed):
+            break
+    return checkpoint
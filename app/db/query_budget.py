@@ -0,0 +1,212 @@
+"""
+Per-request SQL accounting.
+
+QueryBudgetMiddleware gives every request a QueryRecorder, and a
+before_cursor_execute listener counts each statement sent to the
+database against it, keyed by a fingerprint: the SQL with literals and
+IN lists collapsed, so the same query with different parameters counts
+as one fingerprint.
+
+Two things are flagged:
+
+- A fingerprint run QUERY_REPEAT_THRESHOLD times or more in one request,
+  which is what a lazy load in a loop (an N+1) looks like.
+- A route going over the budget it declares with deps.query_budget(n),
+  or QUERY_BUDGET_DEFAULT when it declares none.
+
+With QUERY_BUDGET_STRICT, as in tests, both raise QueryBudgetExceeded
+and fail the request. Otherwise they're logged. Either way every request
+is added to query_stats, a per-route histogram of statement counts plus
+the most frequent fingerprints, for the admin stats endpoint.
+"""
+import logging
+import re
+import threading
+from bisect import bisect_left
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the statements-per-request histogram buckets
+HISTOGRAM_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAMETER_LIST = re.compile(r"\(\s*(?:\?|%s|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+))*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(statement: str) -> str:
+    """
+    The statement with literals replaced by ? and parameter lists of any
+    length collapsed to (...)
+    """
+    statement = _STRING.sub("?", statement)
+    statement = _NUMBER.sub("?", statement)
+    statement = _PARAMETER_LIST.sub("(...)", statement)
+    return _WHITESPACE.sub(" ", statement).strip()
+
+
+@dataclass
+class QueryRecorder:
+    budget: Optional[int] = None
+    route: str = "request"
+    statements: int = 0
+    fingerprints: Counter = field(default_factory=Counter)
+    # An overrun is reported once per request
+    over_budget: bool = False
+
+    def record(self, statement: str) -> None:
+        self.statements += 1
+        self.fingerprints[fingerprint(statement)] += 1
+        self.check_budget()
+
+    def check_budget(self) -> None:
+        """
+        Report the request if it has run more statements than its budget.
+        Called on every statement, and again whenever the budget is set,
+        since dependencies may have run statements before it was declared.
+        """
+        if self.over_budget or self.budget is None or self.statements <= self.budget:
+            return
+        self.over_budget = True
+        _violation(f"{self.route} ran more than its budget of {self.budget} statements")
+
+    def repeated(self, threshold: int) -> Dict[str, int]:
+        return {fp: count for fp, count in self.fingerprints.items() if count >= threshold}
+
+
+_recorder: ContextVar[Optional[QueryRecorder]] = ContextVar("query_recorder", default=None)
+
+
+def current_recorder() -> Optional[QueryRecorder]:
+    return _recorder.get()
+
+
+def _violation(message: str) -> None:
+    if settings.QUERY_BUDGET_STRICT:
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+# On the Engine class rather than app.db.session.engine, so the engines
+# of test databases cloned from a template are counted too
+@event.listens_for(Engine, "before_cursor_execute")
+def _record_statement(conn, cursor, statement, parameters, context, executemany):
+    recorder = _recorder.get()
+    if recorder is not None:
+        recorder.record(statement)
+
+
+class QueryStats:
+    """
+    Statement counts per route since startup, as histograms, and the
+    fingerprints run most often. Bounded, since a fingerprint per distinct
+    query would otherwise grow without limit.
+    """
+
+    def __init__(self, max_fingerprints: int):
+        self.max_fingerprints = max_fingerprints
+        self._lock = threading.Lock()
+        self._routes: Dict[str, Dict[str, Any]] = {}
+        self._fingerprints: Counter = Counter()
+        self._repeated: Counter = Counter()
+
+    def record(self, route: str, recorder: QueryRecorder, repeated: Dict[str, int]) -> None:
+        with self._lock:
+            stats = self._routes.get(route)
+            if stats is None:
+                stats = self._routes[route] = {
+                    "requests": 0,
+                    "statements": 0,
+                    "max_statements": 0,
+                    "histogram": [0] * (len(HISTOGRAM_BUCKETS) + 1),
+                }
+            stats["requests"] += 1
+            stats["statements"] += recorder.statements
+            stats["max_statements"] = max(stats["max_statements"], recorder.statements)
+            stats["histogram"][bisect_left(HISTOGRAM_BUCKETS, recorder.statements)] += 1
+
+            for fp, count in recorder.fingerprints.items():
+                if fp in self._fingerprints or len(self._fingerprints) < self.max_fingerprints:
+                    self._fingerprints[fp] += count
+            for fp in repeated:
+                if fp in self._repeated or len(self._repeated) < self.max_fingerprints:
+                    self._repeated[fp] += 1
+
+    def stats(self, top: int = 50) -> Dict[str, Any]:
+        buckets = [str(bound) for bound in HISTOGRAM_BUCKETS] + ["+Inf"]
+        with self._lock:
+            return {
+                "buckets": buckets,
+                "routes": {
+                    route: dict(stats, histogram=list(stats["histogram"]))
+                    for route, stats in self._routes.items()
+                },
+                "fingerprints": [
+                    {"fingerprint": fp, "statements": count}
+                    for fp, count in self._fingerprints.most_common(top)
+                ],
+                "repeated": [
+                    {"fingerprint": fp, "requests": count}
+                    for fp, count in self._repeated.most_common(top)
+                ],
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._routes.clear()
+            self._fingerprints.clear()
+            self._repeated.clear()
+
+
+query_stats = QueryStats(settings.QUERY_STATS_MAX_FINGERPRINTS)
+
+
+def route_name(scope: Scope) -> str:
+    route = scope.get("route")
+    path = getattr(route, "path", None) or "<unmatched>"
+    return f"{scope.get('method', 'WS')} {path}"
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        recorder = QueryRecorder(budget=settings.QUERY_BUDGET_DEFAULT)
+        token = _recorder.set(recorder)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _recorder.reset(token)
+            self._finish(scope, recorder)
+
+    @staticmethod
+    def _finish(scope: Scope, recorder: QueryRecorder) -> None:
+        route = route_name(scope)
+        repeated = recorder.repeated(settings.QUERY_REPEAT_THRESHOLD)
+        query_stats.record(route, recorder, repeated)
+        recorder.check_budget()
+        if repeated:
+            details: List[str] = [f"{count}x {fp}" for fp, count in repeated.items()]
+            _violation(f"{route} repeated statements (N+1?): " + "; ".join(details))
@@ -0,0 +1,148 @@
+from typing import Any, Dict, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+# SQLite: a trigram FTS5 index over users(username, email). It is an external
+# content table, so the text itself lives only in users and the index stores
+# rowids; the triggers keep it in sync with every insert, update and delete.
+#
+# Tables without an INTEGER PRIMARY KEY may get new rowids on VACUUM, so run
+# rebuild_user_search_index() after vacuuming the database.
+SQLITE_DDL = (
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS users_search USING fts5(
+        username,
+        email,
+        content='users',
+        content_rowid='rowid',
+        tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS users_search_after_insert AFTER INSERT ON users BEGIN
+        INSERT INTO users_search(rowid, username, email)
+        VALUES (new.rowid, new.username, new.email);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS users_search_after_delete AFTER DELETE ON users BEGIN
+        INSERT INTO users_search(users_search, rowid, username, email)
+        VALUES ('delete', old.rowid, old.username, old.email);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS users_search_after_update
+    AFTER UPDATE OF username, email ON users BEGIN
+        INSERT INTO users_search(users_search, rowid, username, email)
+        VALUES ('delete', old.rowid, old.username, old.email);
+        INSERT INTO users_search(rowid, username, email)
+        VALUES (new.rowid, new.username, new.email);
+    END
+    """,
+)
+
+# Postgres: trigram GIN indexes serve ILIKE prefix/substring lookups as well
+# as similarity() ranking for fuzzy matches
+POSTGRESQL_DDL = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS users_username_trgm_index "
+    "ON users USING gin (username gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS users_email_trgm_index "
+    "ON users USING gin (email gin_trgm_ops)",
+)
+
+
+def ensure_user_search_index(connection: Connection) -> None:
+    """
+    Create the user search index if it doesn't exist yet.
+    Safe to call on every startup; an index created on a populated
+    users table is filled from it straight away.
+    """
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        exists = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE name = 'users_search'")
+        ).first()
+        for statement in SQLITE_DDL:
+            connection.execute(text(statement))
+        if not exists:
+            rebuild_user_search_index(connection)
+    elif dialect == "postgresql":
+        for statement in POSTGRESQL_DDL:
+            connection.execute(text(statement))
+
+
+def rebuild_user_search_index(connection: Connection) -> None:
+    if connection.dialect.name == "sqlite":
+        connection.execute(
+            text("INSERT INTO users_search(users_search) VALUES ('rebuild')")
+        )
+
+
+SEARCH_MODES = ("prefix", "substring", "fuzzy")
+
+
+def _fts_phrase(value: str) -> str:
+    return '"' + value.replace('"', '""') + '"'
+
+
+def _like_prefix(value: str) -> str:
+    escaped = value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped + "%"
+
+
+def build_user_search(dialect: str, query: str, mode: str) -> Tuple[str, Dict[str, Any]]:
+    """
+    Build the ranked SELECT over users for a search query of at least three
+    characters (the shortest string a trigram index can look up).
+    The caller binds :tenant_id and appends LIMIT/OFFSET.
+    """
+    if dialect == "postgresql":
+        if mode == "prefix":
+            return (
+                "SELECT users.* FROM users "
+                "WHERE users.tenant_id = :tenant_id "
+                "AND (users.username ILIKE :pattern ESCAPE '\\' "
+                "OR users.email ILIKE :pattern ESCAPE '\\') "
+                "ORDER BY length(users.username), users.username",
+                {"pattern": _like_prefix(query)},
+            )
+        if mode == "fuzzy":
+            where = "users.username % :query OR users.email % :query"
+        else:
+            where = (
+                "users.username ILIKE :pattern ESCAPE '\\' "
+                "OR users.email ILIKE :pattern ESCAPE '\\'"
+            )
+        return (
+            f"SELECT users.* FROM users WHERE users.tenant_id = :tenant_id AND ({where}) "
+            "ORDER BY greatest(similarity(users.username, :query), "
+            "similarity(coalesce(users.email, ''), :query)) DESC, users.username",
+            {"query": query, "pattern": "%" + _like_prefix(query)},
+        )
+
+    select = (
+        "SELECT users.* FROM users_search "
+        "JOIN users ON users.rowid = users_search.rowid "
+        "WHERE users_search MATCH :match AND users.tenant_id = :tenant_id"
+    )
+    if mode == "prefix":
+        # MATCH narrows the candidates through the index, LIKE keeps the
+        # ones where the query is actually at the start of a field
+        return (
+            f"{select} AND (users_search.username LIKE :pattern ESCAPE '\\' "
+            "OR users_search.email LIKE :pattern ESCAPE '\\') "
+            "ORDER BY length(users.username), users.username",
+            {"match": _fts_phrase(query), "pattern": _like_prefix(query)},
+        )
+    if mode == "fuzzy":
+        # Any shared trigram is a candidate; bm25 ranks the users sharing
+        # the most (and rarest) trigrams with the query first, so small
+        # typos still surface the intended user near the top
+        lowered = query.lower()
+        trigrams = dict.fromkeys(lowered[i : i + 3] for i in range(len(lowered) - 2))
+        match = " OR ".join(_fts_phrase(trigram) for trigram in trigrams)
+    else:
+        match = _fts_phrase(query)
+    return f"{select} ORDER BY bm25(users_search), users.username", {"match": match}
@@ -1,13 +1,70 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import re
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.orm import Session, sessionmaker
 
 from app.core.config import settings
 
+connect_args = {}
+if settings.SQLALCHEMY_DATABASE_URI.startswith("sqlite"):
+    # Sync dependencies are opened and closed on different threadpool threads
+    connect_args["check_same_thread"] = False
+
 engine = create_engine(
     settings.SQLALCHEMY_DATABASE_URI,
     pool_pre_ping=True,
     pool_recycle=600,
+    connect_args=connect_args,
     # connect_args={"application_name": "api-server"},
 )
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
\ No newline at end of file
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def read_only(engine: Engine) -> Engine:
+    """
+    The engine for sessions of requests that only read. Its connections
+    run in autocommit mode, so no transaction is begun or committed around
+    the reads, and every statement that could write is refused before it
+    reaches the database, whether it comes from the ORM, text() or the
+    session's connection.
+    """
+    return engine.execution_options(isolation_level="AUTOCOMMIT", read_only=True)
+
+
+ReadOnlySessionLocal = sessionmaker(
+    autocommit=False,
+    autoflush=False,
+    bind=read_only(engine),
+    info={"read_only": True},
+)
+
+
+class ReadOnlySessionError(InvalidRequestError):
+    pass
+
+
+_READS = re.compile(r"\s*(SELECT|WITH|EXPLAIN|SHOW|VALUES)\b", re.IGNORECASE)
+# A WITH may front a write
+_WRITES = re.compile(r"\b(INSERT|UPDATE|DELETE|REPLACE|MERGE)\b", re.IGNORECASE)
+
+
+@event.listens_for(Session, "before_flush")
+def _refuse_read_only_flush(session, flush_context, instances):
+    # Fails early, with the ORM state still in hand
+    if session.info.get("read_only") and (session.new or session.dirty or session.deleted):
+        raise ReadOnlySessionError("This session is read-only")
+
+
+# At the cursor, so text() and the session's own connection are covered;
+# only connections of engines made by read_only() carry the option
+@event.listens_for(Engine, "before_cursor_execute")
+def _refuse_read_only_write(conn, cursor, statement, parameters, context, executemany):
+    if not conn.get_execution_options().get("read_only"):
+        return
+    is_write = context is not None and (context.isinsert or context.isupdate or context.isdelete)
+    reads = _READS.match(statement)
+    if is_write or not reads or (reads.group(1).upper() == "WITH" and _WRITES.search(statement)):
+        raise ReadOnlySessionError("This session is read-only")
@@ -1,18 +1,70 @@
+from contextlib import asynccontextmanager
+
 import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.middleware.gzip import GZipMiddleware
-from starlette.middleware.sessions import SessionMiddleware
 from app.api.api_v1.api import api_router
 from starlette.responses import PlainTextResponse
 
 from app import settings
+from app.core.admission import AdmissionControlMiddleware, RouteClass, route_matcher
+from app.core.clock import RequestClockMiddleware
+from app.core.compression import CompressionMiddleware
+from app.core.events import auth_events
+from app.core.mail import outbox
+from app.core.openapi import serve_precompressed_openapi
+from app.core.reset_campaigns import reset_campaigns
+from app.core.sessions import LazySessionMiddleware
+from app.core.websocket_sessions import websocket_sessions
+from app.db.maintenance import scheduler
+from app.db.query_budget import QueryBudgetMiddleware
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    auth_events.start()
+    outbox.start()
+    if settings.SCHEDULER_ENABLED:
+        scheduler.start()
+    yield
+    await websocket_sessions.stop()
+    scheduler.stop()
+    # Let campaigns record how far they got, and queue their last chunk
+    reset_campaigns.stop(timeout=30)
+    # Drain whatever is still buffered before the process goes away
+    outbox.stop()
+    auth_events.stop()
+
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan,
 )
 
+# Added before CORS so that shed requests still get CORS headers
+if settings.ADMISSION_CONTROL_ENABLED:
+    password_hashing = RouteClass(
+        name="password_hashing",
+        concurrency=settings.ADMISSION_PASSWORD_CONCURRENCY,
+        queue_timeout=settings.ADMISSION_PASSWORD_QUEUE_TIMEOUT_SECONDS,
+        target_latency=settings.ADMISSION_PASSWORD_TARGET_LATENCY_SECONDS,
+    )
+    app.add_middleware(
+        AdmissionControlMiddleware,
+        route_classes=[
+            (route_matcher("POST", f"{settings.API_V1_STR}/login/access-token"), password_hashing),
+            (route_matcher("POST", f"{settings.API_V1_STR}/login-and-update"), password_hashing),
+            (route_matcher("POST", f"{settings.API_V1_STR}/users/"), password_hashing),
+            (route_matcher("POST", f"{settings.API_V1_STR}/reset-password/"), password_hashing),
+        ],
+        default=RouteClass(
+            name="default",
+            concurrency=settings.ADMISSION_DEFAULT_CONCURRENCY,
+            queue_timeout=settings.ADMISSION_DEFAULT_QUEUE_TIMEOUT_SECONDS,
+            target_latency=settings.ADMISSION_DEFAULT_TARGET_LATENCY_SECONDS,
+        ),
+    )
 
 if settings.BACKEND_CORS_ORIGINS:
     app.add_middleware(
@@ -23,8 +75,12 @@ if settings.BACKEND_CORS_ORIGINS:
         allow_headers=["*"],
     )
 app.include_router(api_router, prefix=settings.API_V1_STR)
-app.add_middleware(SessionMiddleware, secret_key=settings.SESSION_SECRET_KEY)
-app.add_middleware(GZipMiddleware, minimum_size=1000)
+openapi = serve_precompressed_openapi(app)
+app.add_middleware(LazySessionMiddleware, secret_key=settings.SESSION_SECRET_KEY)
+app.add_middleware(CompressionMiddleware, minimum_size=1000)
+app.add_middleware(QueryBudgetMiddleware)
+# Outermost, so everything below shares the request's clock reading
+app.add_middleware(RequestClockMiddleware)
 
 
 @app.exception_handler(500)
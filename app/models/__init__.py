@@ -1,6 +1,11 @@
 from .base import Base
+from .api_key import ApiKey
+from .auth_event import AuthEvent
+from .consumed_nonce import ConsumedNonce
+from .login_key import LoginKey, normalize_login
 from .permission import Permission
 from .role import Role
+from .tenant import DEFAULT_TENANT_ID, Tenant
 from .user import User
 from .enums.all import EnumsPermissionName
-from .join_tables.all import UsersRole
\ No newline at end of file
+from .join_tables.all import RolesClosure, RolesParent, RolesPermission, UsersRole
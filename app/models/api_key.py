@@ -0,0 +1,27 @@
+from sqlalchemy import Column, DateTime, ForeignKey, String
+
+from app.core import clock
+
+from .base import Base
+import uuid
+from .types import UUID
+
+
+class ApiKey(Base):
+    __tablename__ = "api_keys"
+
+    id = Column(
+        UUID, primary_key=True, default=uuid.uuid4,
+    )
+    user_id = Column(
+        ForeignKey("users.id", ondelete="CASCADE", onupdate="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    name = Column(String, nullable=False)
+    # The public part of the key, so authentication is one unique index probe
+    prefix = Column(String, unique=True, index=True, nullable=False)
+    key_hash = Column(String, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=clock.utcnow)
+    expires_at = Column(DateTime)
+    revoked_at = Column(DateTime)
@@ -0,0 +1,25 @@
+from sqlalchemy import Column, DateTime, Index, Integer, String, Text
+
+from app.core import clock
+
+from .base import Base
+from .types import UUID
+
+
+class AuthEvent(Base):
+    __tablename__ = "auth_events"
+    __table_args__ = (
+        Index("auth_events_occurred_at_index", "occurred_at"),
+        Index("auth_events_event_type_occurred_at_index", "event_type", "occurred_at"),
+        Index("auth_events_user_id_occurred_at_index", "user_id", "occurred_at"),
+    )
+
+    # Integer keys keep the batched inserts append-only on the primary key index
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    occurred_at = Column(DateTime, nullable=False, default=clock.utcnow)
+    event_type = Column(String, nullable=False)
+    # No foreign keys: the audit trail has to outlive the users it mentions
+    user_id = Column(UUID)
+    actor_user_id = Column(UUID)
+    ip_address = Column(String)
+    detail = Column(Text)
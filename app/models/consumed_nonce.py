@@ -0,0 +1,16 @@
+from sqlalchemy import Column, DateTime, String
+
+from .base import Base
+
+
+class ConsumedNonce(Base):
+    """
+    Nonces of used single-use tokens. A row only needs to outlive the
+    token it came from, after which the signature check rejects the token
+    anyway, so expired rows can be purged at any time.
+    """
+
+    __tablename__ = "consumed_nonces"
+
+    nonce = Column(String, primary_key=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
@@ -1,13 +1,14 @@
 # coding: utf-8
-from datetime import datetime
-
-from sqlalchemy import Column, DateTime, ForeignKey, Index, text
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, event, text
 from sqlalchemy.orm import relationship
 
+from app.core import clock
+
 from ..base import Base
+from ..role import Role
+from ..tenant import DEFAULT_TENANT_ID
 import uuid
-from setup import UUID
+from ..types import UUID
 metadata = Base.metadata
 
 
@@ -15,16 +16,26 @@ class UsersRole(Base):
     __tablename__ = "users_roles"
     __table_args__ = (
         Index(
-            "users_roles_user_id_role_id_uindex",
+            "users_roles_tenant_id_user_id_role_id_uindex",
+            "tenant_id",
             "user_id",
             "role_id",
             unique=True,
         ),
+        # Finds the grants scoped to a user, e.g. to delete them with the
+        # user, without visiting the table
+        Index("users_roles_target_user_id_user_id_index", "target_user_id", "user_id"),
     )
 
     id = Column(
         UUID, primary_key=True, default=uuid.uuid4,
     )
+    tenant_id = Column(
+        ForeignKey("tenants.id", ondelete="CASCADE", onupdate="CASCADE"),
+        nullable=False,
+        default=DEFAULT_TENANT_ID,
+        server_default=DEFAULT_TENANT_ID,
+    )
     user_id = Column(
         ForeignKey("users.id", ondelete="CASCADE", onupdate="CASCADE"),
         nullable=False,
@@ -33,16 +44,15 @@ class UsersRole(Base):
         ForeignKey("roles.id", ondelete="RESTRICT", onupdate="CASCADE"),
         nullable=False,
     )
-    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    created_at = Column(DateTime, nullable=False, default=clock.utcnow)
     updated_at = Column(
         DateTime,
         nullable=False,
-        default=datetime.utcnow,
-        onupdate=datetime.utcnow,
+        default=clock.utcnow,
+        onupdate=clock.utcnow,
     )
     target_user_id = Column(
         ForeignKey("users.id", ondelete="CASCADE", onupdate="CASCADE"),
-        index=True,
     )
 
     target_user = relationship("User", foreign_keys=[target_user_id])
@@ -51,6 +61,13 @@ class UsersRole(Base):
 
 class RolesPermission(Base):
     __tablename__ = "roles_permissions"
+    __table_args__ = (
+        Index(
+            "roles_permissions_role_id_permission_id_index",
+            "role_id",
+            "permission_id",
+        ),
+    )
 
     id = Column(UUID, primary_key=True, default=uuid.uuid4)
     role_id = Column(ForeignKey("roles.id", ondelete="CASCADE", onupdate="CASCADE"), nullable=False)
@@ -60,4 +77,71 @@ class RolesPermission(Base):
     )
 
     permission = relationship("Permission")
-    role = relationship("Role")
\ No newline at end of file
+    role = relationship("Role")
+
+
+class RolesParent(Base):
+    """
+    An inheritance edge: the parent role is granted every permission
+    of the role, e.g. Viewer -> Support -> Admin
+    """
+
+    __tablename__ = "roles_parents"
+    __table_args__ = (
+        Index(
+            "roles_parents_role_id_parent_role_id_uindex",
+            "role_id",
+            "parent_role_id",
+            unique=True,
+        ),
+    )
+
+    id = Column(UUID, primary_key=True, default=uuid.uuid4)
+    role_id = Column(ForeignKey("roles.id", ondelete="CASCADE", onupdate="CASCADE"), nullable=False)
+    parent_role_id = Column(
+        ForeignKey("roles.id", ondelete="CASCADE", onupdate="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+
+    role = relationship("Role", foreign_keys=[role_id])
+    parent_role = relationship("Role", foreign_keys=[parent_role_id])
+
+
+class RolesClosure(Base):
+    """
+    Materialized transitive closure of roles_parents: one row for every
+    (ancestor, descendant) pair, including (role, role) at depth 0.
+    An ancestor holds every permission granted to any of its descendants,
+    so effective permissions are one join away however deep the hierarchy is.
+    """
+
+    __tablename__ = "roles_closure"
+    __table_args__ = (
+        Index(
+            "roles_closure_descendant_role_id_ancestor_role_id_index",
+            "descendant_role_id",
+            "ancestor_role_id",
+        ),
+    )
+
+    ancestor_role_id = Column(
+        ForeignKey("roles.id", ondelete="CASCADE", onupdate="CASCADE"),
+        primary_key=True,
+    )
+    descendant_role_id = Column(
+        ForeignKey("roles.id", ondelete="CASCADE", onupdate="CASCADE"),
+        primary_key=True,
+    )
+    depth = Column(Integer, nullable=False, default=0)
+
+
+@event.listens_for(Role, "after_insert")
+def _insert_role_closure_self_row(mapper, connection, target):
+    # Every role is its own depth-0 ancestor; inserting the row in the same
+    # flush keeps the closure complete however the role was created
+    connection.execute(
+        RolesClosure.__table__.insert().values(
+            ancestor_role_id=target.id, descendant_role_id=target.id, depth=0
+        )
+    )
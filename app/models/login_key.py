@@ -0,0 +1,38 @@
+from sqlalchemy import Column, ForeignKey, String
+
+from .base import Base
+
+
+def normalize_login(identifier: str) -> str:
+    """
+    What a username or email is stored and looked up as, so logins match
+    regardless of case, e.g. Alice@Example.com and alice@example.com
+    """
+    return identifier.strip().casefold()
+
+
+class LoginKey(Base):
+    """
+    Every identifier a user can log in with, normalized: one row for the
+    username and one for the email, if any. The primary key makes them
+    unique per tenant across both kinds, so a login is one probe of it
+    whichever the user typed.
+    """
+
+    __tablename__ = "login_keys"
+    # Stored in key order on SQLite, so the probe finds the user id
+    # without a second lookup by rowid
+    __table_args__ = {"sqlite_with_rowid": False}
+
+    tenant_id = Column(
+        ForeignKey("tenants.id", ondelete="CASCADE", onupdate="CASCADE"),
+        primary_key=True,
+    )
+    login_key = Column(String, primary_key=True)
+    user_id = Column(
+        ForeignKey("users.id", ondelete="CASCADE", onupdate="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    # "username" or "email"
+    kind = Column(String, nullable=False)
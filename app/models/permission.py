@@ -2,7 +2,7 @@ import uuid
 from sqlalchemy import Column, ForeignKey, Text
 from sqlalchemy.orm import relationship
 from .base import Base
-from setup import UUID
+from .types import UUID
 
 class Permission(Base):
     __tablename__ = "permissions"
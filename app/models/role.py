@@ -1,8 +1,7 @@
-from sqlalchemy import Column, String, Text, text
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, ForeignKey, Index, String, Text, text
 from sqlalchemy.orm import relationship
 import uuid
-from setup import UUID
+from .types import UUID
 from .base import Base
 
 
@@ -15,7 +14,13 @@ class Role(Base):
         unique=True,
         default=uuid.uuid4,
     )
-    role_name = Column(String, nullable=False, unique=True)
+    # NULL for system roles (the ones in the bootstrap manifest), which
+    # every tenant shares
+    tenant_id = Column(
+        ForeignKey("tenants.id", ondelete="CASCADE", onupdate="CASCADE"),
+        nullable=True,
+    )
+    role_name = Column(String, nullable=False)
     description = Column(Text)
 
     permissions = relationship(
@@ -24,3 +29,14 @@ class Role(Base):
         back_populates="roles",
         viewonly=True,
     )
+
+
+Index("roles_tenant_id_role_name_uindex", Role.tenant_id, Role.role_name, unique=True)
+# NULLs never collide in a unique index, so system role names need their own
+Index(
+    "roles_role_name_system_uindex",
+    Role.role_name,
+    unique=True,
+    sqlite_where=Role.tenant_id.is_(None),
+    postgresql_where=Role.tenant_id.is_(None),
+)
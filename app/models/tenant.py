@@ -0,0 +1,18 @@
+from sqlalchemy import Column, DateTime, String
+
+from app.core import clock
+
+from .base import Base
+
+# Everything created before tenants existed, and every request that
+# doesn't name a tenant, belongs to this one
+DEFAULT_TENANT_ID = "default"
+
+
+class Tenant(Base):
+    __tablename__ = "tenants"
+
+    # The slug clients send in the tenant header or subdomain, e.g. "acme"
+    id = Column(String, primary_key=True)
+    name = Column(String, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=clock.utcnow)
@@ -0,0 +1,27 @@
+import uuid
+
+from sqlalchemy import TEXT, TypeDecorator
+
+
+class UUID(TypeDecorator):
+    """
+    UUIDs as native uuid on Postgres and as text everywhere else
+    """
+
+    impl = TEXT
+    # Stateless, so statements using it can go in the compiled cache
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        elif dialect.name != 'postgresql':
+            return str(value)
+        return value
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        if not isinstance(value, uuid.UUID):
+            return uuid.UUID(value)
+        return value
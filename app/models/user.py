@@ -1,5 +1,3 @@
-from datetime import datetime
-
 from sqlalchemy import (
     Boolean,
     Column,
@@ -10,32 +8,50 @@ from sqlalchemy import (
     Text,
     text,
 )
-from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 
+from app.core import clock
+
 from .base import Base
 from .join_tables.all import UsersRole
+from .login_key import LoginKey
+from .tenant import DEFAULT_TENANT_ID
 import uuid
-from setup import UUID
+from .types import UUID
 
 
 class User(Base):
     __tablename__ = "users"
+    # Led by the tenant, so a lookup only ever walks its own tenant's entries
+    __table_args__ = (
+        Index("users_tenant_id_username_uindex", "tenant_id", "username", unique=True),
+        Index("users_tenant_id_email_uindex", "tenant_id", "email", unique=True),
+        Index("users_tenant_id_created_at_index", "tenant_id", "created_at"),
+    )
 
     id = Column(
         UUID, primary_key=True, default=uuid.uuid4,
     )
-    username = Column(String, unique=True, index=True, nullable=False)
-    email = Column(String, unique=True, index=True, nullable=True)
+    tenant_id = Column(
+        ForeignKey("tenants.id", ondelete="CASCADE", onupdate="CASCADE"),
+        nullable=False,
+        default=DEFAULT_TENANT_ID,
+        server_default=DEFAULT_TENANT_ID,
+    )
+    username = Column(String, nullable=False)
+    email = Column(String, nullable=True)
     hashed_password = Column(String, nullable=False)
-    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    created_at = Column(DateTime, nullable=False, default=clock.utcnow)
     updated_at = Column(
         DateTime,
         nullable=False,
-        default=datetime.utcnow,
-        onupdate=datetime.utcnow,
+        default=clock.utcnow,
+        onupdate=clock.utcnow,
     )
     password_expires_at = Column(DateTime(True))
+    email_verified_at = Column(DateTime)
+    last_login = Column(DateTime)
 
 
-    roles = relationship("UsersRole", foreign_keys=[UsersRole.user_id])
\ No newline at end of file
+    roles = relationship("UsersRole", foreign_keys=[UsersRole.user_id])
+    login_keys = relationship(LoginKey, cascade="all, delete-orphan")
@@ -1,5 +1,23 @@
 from .msg import Msg
 from .role import Role, RoleCreate, RoleUpdate
 from .user import User, UserCreate, UserInDB, UserUpdate, Me
-from .admin import AllUsers
-from .token import Token, TokenPayload
\ No newline at end of file
+from .admin import (
+    AllUsers,
+    PasswordResetCampaign,
+    PasswordResetCampaignResult,
+    UserListing,
+    UserSearchResults,
+)
+from .api_key import ApiKey, ApiKeyCreate, ApiKeyCreated, ApiKeys
+from .db_usage import DBUsage
+from .auth_event import AuthEvent, AuthEventCreate, AuthEvents, AuthEventStats
+from .introspection import (
+    BatchTokenIntrospection,
+    BatchTokenIntrospectionRequest,
+    TokenIntrospection,
+)
+from .query_stats import QueryStats
+from .scheduler import SchedulerStats
+from .tenant import Tenant, TenantCreate, Tenants, TenantUpdate
+from .token import Token, TokenPayload
+from .websocket_sessions import WebSocketSessionStats
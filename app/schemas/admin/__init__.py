@@ -1 +1,2 @@
-from .all_users import AllUsers
+from .all_users import AllUsers, UserListing, UserSearchResults
+from .password_reset import PasswordResetCampaign, PasswordResetCampaignResult
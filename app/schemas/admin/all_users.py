@@ -1,5 +1,6 @@
+import uuid
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 from pydantic import BaseModel, EmailStr
 
@@ -13,7 +14,7 @@ class UserBase(BaseModel):
 
 
 class UserInDBBase(UserBase):
-    id: Optional[str] = None
+    id: Optional[uuid.UUID] = None
 
     class Config:
         orm_mode = True
@@ -31,3 +32,30 @@ class UserInDB(UserInDBBase):
 
 class AllUsers(BaseModel):
     users: List[AdminUser]
+
+
+class AdminUserRole(BaseModel):
+    id: uuid.UUID
+    role_name: str
+    # Set when the grant only applies to that user
+    target_user_id: Optional[uuid.UUID] = None
+
+
+class AdminUserWithRoles(AdminUser):
+    # Only with the "roles" and "permissions" profiles
+    roles: Optional[List[AdminUserRole]] = None
+
+
+class UserListing(BaseModel):
+    users: List[AdminUserWithRoles]
+    # Only with the "permissions" profile: the effective permissions of
+    # every role above, inherited ones included, listed once per role
+    # rather than once per user
+    permissions: Optional[Dict[uuid.UUID, List[str]]] = None
+    skip: int
+    limit: int
+
+
+class UserSearchResults(AllUsers):
+    skip: int
+    limit: int
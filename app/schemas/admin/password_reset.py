@@ -0,0 +1,17 @@
+import uuid
+from datetime import datetime
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+
+class PasswordResetCampaign(BaseModel):
+    # Every user of the tenant when neither is given
+    user_ids: Optional[List[uuid.UUID]] = None
+    created_before: Optional[datetime] = None
+
+
+class PasswordResetCampaignResult(BaseModel):
+    # The password_reset_campaign auth event with this campaign_id records
+    # how many emails were queued, once the campaign is done
+    campaign_id: uuid.UUID
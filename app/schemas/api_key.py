@@ -0,0 +1,33 @@
+import uuid
+from datetime import datetime
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+
+class ApiKeyBase(BaseModel):
+    name: str
+    expires_at: Optional[datetime] = None
+
+
+class ApiKeyCreate(ApiKeyBase):
+    pass
+
+
+class ApiKey(ApiKeyBase):
+    id: uuid.UUID
+    prefix: str
+    created_at: datetime
+    revoked_at: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True
+
+
+# Only returned once, when the key is created
+class ApiKeyCreated(ApiKey):
+    api_key: str
+
+
+class ApiKeys(BaseModel):
+    api_keys: List[ApiKey]
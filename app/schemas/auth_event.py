@@ -0,0 +1,38 @@
+import uuid
+from datetime import datetime
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+
+class AuthEventBase(BaseModel):
+    event_type: str
+    user_id: Optional[uuid.UUID] = None
+    actor_user_id: Optional[uuid.UUID] = None
+    ip_address: Optional[str] = None
+    detail: Optional[str] = None
+
+
+class AuthEventCreate(AuthEventBase):
+    pass
+
+
+class AuthEvent(AuthEventBase):
+    id: int
+    occurred_at: datetime
+
+    class Config:
+        orm_mode = True
+
+
+class AuthEvents(BaseModel):
+    events: List[AuthEvent]
+
+
+class AuthEventStats(BaseModel):
+    buffered: int
+    capacity: int
+    emitted: int
+    dropped: int
+    written: int
+    failed: int
@@ -0,0 +1,7 @@
+from pydantic import BaseModel
+
+
+class DBUsage(BaseModel):
+    requests: int
+    sessions_opened: int
+    statements: int
@@ -0,0 +1,25 @@
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+
+
+class TokenIntrospection(BaseModel):
+    active: bool
+    sub: Optional[str] = None
+    tenant_id: Optional[str] = None
+    username: Optional[str] = None
+    email: Optional[str] = None
+    token_type: Optional[str] = None
+    exp: Optional[int] = None
+    roles: Optional[List[str]] = None
+    permissions: Optional[List[str]] = None
+    # Permissions granted only for particular target users, keyed by user id
+    scoped_permissions: Optional[Dict[str, List[str]]] = None
+
+
+class BatchTokenIntrospectionRequest(BaseModel):
+    tokens: List[str]
+
+
+class BatchTokenIntrospection(BaseModel):
+    results: List[TokenIntrospection]
@@ -0,0 +1,30 @@
+from typing import Dict, List
+
+from pydantic import BaseModel
+
+
+class RouteQueryStats(BaseModel):
+    requests: int
+    statements: int
+    max_statements: int
+    # Requests per bucket of QueryStats.buckets
+    histogram: List[int]
+
+
+class FingerprintCount(BaseModel):
+    fingerprint: str
+    statements: int
+
+
+class RepeatedFingerprint(BaseModel):
+    fingerprint: str
+    # Requests that ran it QUERY_REPEAT_THRESHOLD times or more
+    requests: int
+
+
+class QueryStats(BaseModel):
+    # Upper bounds of the histogram buckets, in statements per request
+    buckets: List[str]
+    routes: Dict[str, RouteQueryStats]
+    fingerprints: List[FingerprintCount]
+    repeated: List[RepeatedFingerprint]
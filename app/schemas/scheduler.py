@@ -0,0 +1,21 @@
+from typing import Any, List, Optional
+
+from pydantic import BaseModel
+
+
+class ScheduledJob(BaseModel):
+    name: str
+    interval: float
+    due_in: float
+    runs: int
+    failures: int
+    # Rows handled, or whatever else the job reports
+    last_result: Any = None
+    last_duration: Optional[float] = None
+    last_error: Optional[str] = None
+
+
+class SchedulerStats(BaseModel):
+    # Whether this worker holds the leader lock
+    leader: bool
+    jobs: List[ScheduledJob]
@@ -0,0 +1,29 @@
+from datetime import datetime
+from typing import List, Optional
+
+from pydantic import BaseModel, constr
+
+
+class TenantBase(BaseModel):
+    name: str
+
+
+class TenantCreate(TenantBase):
+    # Used in the tenant header and as a subdomain, so keep it DNS-safe
+    id: constr(regex=r"^[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?$")
+
+
+class TenantUpdate(TenantBase):
+    pass
+
+
+class Tenant(TenantBase):
+    id: str
+    created_at: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True
+
+
+class Tenants(BaseModel):
+    tenants: List[Tenant]
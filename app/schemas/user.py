@@ -1,6 +1,8 @@
 from typing import Optional
 
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, validator
+
+from app.core.password_policy import validate_password
 
 
 class UserBase(BaseModel):
@@ -13,13 +15,20 @@ class UserCreate(UserBase):
     username: str
     password: str
 
+    _password_policy = validator("password", allow_reuse=True)(validate_password)
+
 
 class UserUpdate(UserBase):
     password: Optional[str] = None
 
+    @validator("password")
+    def password_policy(cls, v: Optional[str]) -> Optional[str]:
+        return validate_password(v) if v else v
+
 
 class UserInDBBase(UserBase):
     id: Optional[str] = None
+    tenant_id: Optional[str] = None
 
     class Config:
         orm_mode = True
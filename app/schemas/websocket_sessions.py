@@ -0,0 +1,22 @@
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class WebSocketSessionsClosed(BaseModel):
+    # Closed by the server, by reason; clients closing aren't counted
+    expired: int
+    revoked: int
+    shutdown: int
+
+
+class WebSocketSessionStats(BaseModel):
+    sessions: int
+    opened: int
+    closed: WebSocketSessionsClosed
+    # Session checks made, and the queries they took
+    revalidated: int
+    revalidation_queries: int
+    last_revalidation_seconds: Optional[float] = None
+    # How far behind the timer wheel's ticks have run, at worst
+    max_tick_lag_seconds: float
@@ -0,0 +1,82 @@
+import os
+
+# Before anything imports app.core.config. Requests go to clones of the
+# template database; nothing should reach the configured one.
+os.environ["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+os.environ["QUERY_BUDGET_STRICT"] = "true"
+os.environ["SCHEDULER_ENABLED"] = "false"
+
+from typing import Callable, Dict, Iterator, Optional  # noqa: E402
+
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy.engine import Engine  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.api.deps.tenant import known_tenants  # noqa: E402
+from app.core.principal import principal_cache  # noqa: E402
+from app.db.testing import TemplateDatabase  # noqa: E402
+from app.main import app  # noqa: E402
+
+PASSWORD = "s3cret-Pass!word"
+
+
+@pytest.fixture(scope="session")
+def template() -> TemplateDatabase:
+    return TemplateDatabase()
+
+
+@pytest.fixture
+def engine(template: TemplateDatabase) -> Iterator[Engine]:
+    principal_cache.clear()
+    known_tenants.clear()
+    with template.override_get_db(app) as engine:
+        yield engine
+
+
+@pytest.fixture
+def db(engine: Engine) -> Iterator[Session]:
+    db = Session(bind=engine)
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def client(engine: Engine) -> TestClient:
+    # Not used as a context manager, so the lifespan (scheduler, event
+    # writer) never starts
+    return TestClient(app)
+
+
+@pytest.fixture
+def signup(client: TestClient) -> Callable[..., Dict[str, str]]:
+    def signup(username: str, password: str = PASSWORD) -> Dict[str, str]:
+        r = client.post(
+            "/api/v1/users/",
+            json={"username": username, "email": f"{username}@example.com", "password": password},
+        )
+        assert r.status_code == 200, r.text
+        return r.json()
+
+    return signup
+
+
+@pytest.fixture
+def login(client: TestClient) -> Callable[..., TestClient]:
+    """
+    A client of its own with the user's session cookies
+    """
+
+    def login(
+        username: str, password: str = PASSWORD, headers: Optional[Dict[str, str]] = None
+    ) -> TestClient:
+        user_client = TestClient(app, headers=headers)
+        r = user_client.post(
+            "/api/v1/login/access-token", data={"username": username, "password": password}
+        )
+        assert r.status_code == 200, r.text
+        return user_client
+
+    return login
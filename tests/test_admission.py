@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+from app.core.admission import (
+    AdaptiveLimiter,
+    AdmissionControlMiddleware,
+    Overloaded,
+    RouteClass,
+    route_matcher,
+)
+
+
+def route_class(name: str = "test", **kwargs) -> RouteClass:
+    return RouteClass(
+        name=name,
+        **{"concurrency": 1, "queue_timeout": 1, "target_latency": 1, **kwargs},
+    )
+
+
+def test_routes_of_one_class_share_a_limiter():
+    hashing = route_class("hashing")
+    middleware = AdmissionControlMiddleware(
+        None,
+        route_classes=[
+            (route_matcher("POST", "/login"), hashing),
+            (route_matcher("POST", "/users/"), hashing),
+        ],
+        default=route_class("default"),
+    )
+    assert middleware.limiter_for("POST", "/login") is middleware.limiter_for("POST", "/users/")
+    assert middleware.limiter_for("GET", "/login") is middleware.default
+    assert set(middleware.stats()) == {"hashing", "default"}
+
+
+def test_queued_request_times_out():
+    async def run() -> AdaptiveLimiter:
+        limiter = AdaptiveLimiter(route_class(queue_timeout=0.01))
+        await limiter.acquire()
+        with pytest.raises(Overloaded):
+            await limiter.acquire()
+        return limiter
+
+    limiter = asyncio.run(run())
+    assert (limiter.in_flight, len(limiter._waiters), limiter.shed) == (1, 0, 1)
+
+
+def test_cancelled_waiter_gives_up_its_place():
+    async def run() -> AdaptiveLimiter:
+        limiter = AdaptiveLimiter(route_class())
+        await limiter.acquire()
+        waiting = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        limiter.release(None)
+        return limiter
+
+    limiter = asyncio.run(run())
+    assert (limiter.in_flight, len(limiter._waiters)) == (0, 0)
@@ -0,0 +1,37 @@
+from app.core.config import settings
+
+
+def create_api_key(user_client) -> dict:
+    r = user_client.post("/api/v1/users/me/api-keys", json={"name": "ci"})
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def test_api_key_authenticates(client, signup, login):
+    signup("alice")
+    api_key = create_api_key(login("alice"))["api_key"]
+
+    for headers in (
+        {"Authorization": f"Bearer {api_key}"},
+        {settings.API_KEY_HEADER_NAME: api_key},
+    ):
+        r = client.get("/api/v1/users/me", headers=headers)
+        assert r.status_code == 200, r.text
+        assert r.json()["username"] == "alice"
+
+
+def test_revoked_api_key_is_refused(client, signup, login):
+    signup("alice")
+    alice = login("alice")
+    created = create_api_key(alice)
+    assert alice.delete(f"/api/v1/users/me/api-keys/{created['id']}").status_code == 200
+
+    r = client.get("/api/v1/users/me", headers={"Authorization": f"Bearer {created['api_key']}"})
+    assert r.status_code == 403
+
+
+def test_unknown_api_key_is_refused(client):
+    r = client.get(
+        "/api/v1/users/me", headers={"Authorization": f"Bearer {settings.API_KEY_PREFIX}_nope"}
+    )
+    assert r.status_code == 403
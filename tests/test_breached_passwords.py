@@ -0,0 +1,57 @@
+import hashlib
+
+import pytest
+
+from app.cli.breached_passwords import build_index
+from app.core.password_policy import MAGIC, BreachedPasswordIndex
+
+BREACHED = ["password", "123456", "letmein"]
+
+
+def sha1(password: str) -> str:
+    return hashlib.sha1(password.encode()).hexdigest().upper()
+
+
+def test_index_contains_the_listed_passwords(tmp_path):
+    source = tmp_path / "pwned.txt"
+    source.write_text("".join(f"{sha1(p)}:{n}\n" for n, p in enumerate(BREACHED)))
+    output = str(tmp_path / "breached.idx")
+
+    assert build_index([str(source)], output) == (3, 0)
+    index = BreachedPasswordIndex(output)
+    try:
+        assert len(index) == 3
+        assert all(password in index for password in BREACHED)
+        assert "correct horse battery staple" not in index
+    finally:
+        index.close()
+
+
+def test_malformed_lines_are_skipped(tmp_path):
+    source = tmp_path / "pwned.txt"
+    lines = [sha1(BREACHED[0]), "8846F7EAEE8FB117AD06BDD830B7586C:3", "not hex:1"]
+    lines += [sha1(p) for p in BREACHED[1:]]
+    source.write_text("\n".join(lines) + "\n")
+    output = str(tmp_path / "breached.idx")
+
+    assert build_index([str(source)], output, chunk_size=2) == (3, 2)
+    index = BreachedPasswordIndex(output)
+    try:
+        assert all(password in index for password in BREACHED)
+    finally:
+        index.close()
+
+
+def test_plaintext_input(tmp_path):
+    source = tmp_path / "passwords.txt"
+    source.write_text("\n".join(BREACHED + BREACHED) + "\n")
+    output = str(tmp_path / "breached.idx")
+
+    assert build_index([str(source)], output, plaintext=True) == (3, 0)
+
+
+def test_truncated_index_is_refused(tmp_path):
+    path = tmp_path / "breached.idx"
+    path.write_bytes(MAGIC + bytes(30))
+    with pytest.raises(ValueError):
+        BreachedPasswordIndex(str(path))
@@ -0,0 +1,44 @@
+from datetime import timedelta
+
+from app import crud, schemas
+from app.core import clock
+from app.core.introspection import claims_cache, introspect_tokens
+
+
+def create_api_key(db, username: str, expires_at=None) -> str:
+    user = crud.user.get_by_login(db, login=username)
+    _, api_key = crud.api_key.create_for_user(
+        db, user_id=user.id, obj_in=schemas.ApiKeyCreate(name="ci", expires_at=expires_at)
+    )
+    return api_key
+
+
+def test_api_key_is_active_until_revoked(db, signup):
+    signup("alice")
+    claims_cache.clear()
+    api_key = create_api_key(db, "alice")
+
+    [claims] = introspect_tokens(db, [api_key])
+    assert claims["active"] and claims["username"] == "alice"
+    assert claims["token_type"] == "api_key"
+
+    key = crud.api_key.get_multi_by_user(db, user_id=claims["sub"])[0]
+    crud.api_key.revoke(db, user_id=key.user_id, id=key.id)
+    # Cached, but revoked since
+    assert introspect_tokens(db, [api_key]) == [{"active": False}]
+
+
+def test_api_key_expires_with_its_key(db, signup):
+    signup("alice")
+    claims_cache.clear()
+    expires_at = clock.utcnow() + timedelta(seconds=30)
+    api_key = create_api_key(db, "alice", expires_at=expires_at)
+
+    [claims] = introspect_tokens(db, [api_key])
+    assert claims["exp"] == int(clock.Instant(expires_at, 0).timestamp)
+    with clock.freeze(expires_at + timedelta(seconds=1)):
+        assert introspect_tokens(db, [api_key]) == [{"active": False}]
+
+
+def test_unknown_tokens_are_inactive(db):
+    assert introspect_tokens(db, ["not-a-token"]) == [{"active": False}]
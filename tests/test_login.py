@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+from unittest import mock
+
+from app import crud
+from app.api.api_v1.endpoints.login import login as login_endpoints
+from app.core.config import settings
+
+from .conftest import PASSWORD
+
+
+def test_signup_login_and_me(signup, login):
+    created = signup("alice")
+    me = login("alice").get("/api/v1/users/me")
+    assert me.status_code == 200
+    assert me.json() == created
+
+
+def test_login_ignores_case(signup, login):
+    signup("alice")
+    assert login("ALICE@Example.com").get("/api/v1/users/me").json()["username"] == "alice"
+
+
+def test_login_refuses_a_wrong_password(client, signup):
+    signup("alice")
+    r = client.post(
+        "/api/v1/login/access-token", data={"username": "alice", "password": "wrong-" + PASSWORD}
+    )
+    assert r.status_code == 400
+
+
+def test_me_requires_credentials(client):
+    assert client.get("/api/v1/users/me").status_code == 401
+
+
+def test_password_recovery_ignores_case(client, signup):
+    signup("alice")
+    with mock.patch.object(login_endpoints, "send_reset_password_email") as send:
+        r = client.post("/api/v1/password-recovery/Alice@EXAMPLE.com")
+    assert r.status_code == 200
+    assert send.call_args.args[:2] == ("alice@example.com", "alice")
+
+
+def test_stamped_expiry_is_ignored_once_the_policy_is_off(db, signup, login, monkeypatch):
+    signup("alice")
+    user = crud.user.get_by_login(db, login="alice")
+    user.password_expires_at = datetime.utcnow() - timedelta(days=1)
+    db.commit()
+
+    monkeypatch.setattr(settings, "PASSWORD_MAX_AGE_DAYS", 90)
+    assert crud.user.is_password_expired(user)
+    monkeypatch.setattr(settings, "PASSWORD_MAX_AGE_DAYS", None)
+    assert login("alice").get("/api/v1/users/me").status_code == 200
@@ -0,0 +1,70 @@
+from datetime import timedelta
+from unittest import mock
+
+from app import crud
+from app.core import clock, reset_campaigns as campaigns_module
+from app.core.reset_campaigns import reset_campaigns
+
+from .conftest import PASSWORD
+from .test_permissions import grant_admin
+
+NEW_PASSWORD = "an0ther-Pass!word"
+
+
+def reset_password(client, token: str, new_password: str = NEW_PASSWORD):
+    return client.post(
+        "/api/v1/reset-password/", json={"token": token, "new_password": new_password}
+    )
+
+
+def test_campaign_runs_in_the_background(db, client, signup, login):
+    for name in ("alice", "bob", "carol"):
+        signup(name)
+    grant_admin(db, "alice")
+
+    with mock.patch.object(campaigns_module, "send_reset_password_email") as send:
+        r = login("alice").post("/api/v1/roles/admin/password-reset-campaign", json={})
+        assert r.status_code == 202, r.text
+        assert "campaign_id" in r.json()
+        assert reset_campaigns.join(timeout=10)
+
+    tokens = {call.args[1]: call.args[2] for call in send.call_args_list}
+    assert sorted(tokens) == ["alice", "bob", "carol"]
+
+    # The emailed links work
+    assert reset_password(client, tokens["bob"]).status_code == 200
+    login("bob", NEW_PASSWORD)
+
+
+def test_campaign_requires_permission(signup, login):
+    signup("alice")
+    r = login("alice").post("/api/v1/roles/admin/password-reset-campaign", json={})
+    assert r.status_code == 403
+
+
+def test_reset_token_stops_working_once_used(client, signup):
+    signup("alice")
+    with mock.patch("app.api.api_v1.endpoints.login.login.send_reset_password_email") as send:
+        client.post("/api/v1/password-recovery/alice@example.com")
+    token = send.call_args.args[2]
+
+    assert reset_password(client, token).status_code == 200
+    # Bound to the old password hash
+    assert reset_password(client, token, PASSWORD).status_code == 400
+
+
+def test_tampered_reset_token_is_refused(client, signup):
+    signup("alice")
+    with mock.patch("app.api.api_v1.endpoints.login.login.send_reset_password_email") as send:
+        client.post("/api/v1/password-recovery/alice@example.com")
+    token = send.call_args.args[2]
+
+    tampered = token[:-1] + ("A" if token[-1] != "A" else "B")
+    assert reset_password(client, tampered).status_code == 400
+    assert reset_password(client, "garbage").status_code == 400
+
+
+def test_nonce_is_consumed_once(db):
+    expires_at = clock.utcnow() + timedelta(hours=1)
+    assert crud.consumed_nonce.consume(db, nonce="n1", expires_at=expires_at)
+    assert not crud.consumed_nonce.consume(db, nonce="n1", expires_at=expires_at)
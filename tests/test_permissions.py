@@ -0,0 +1,51 @@
+from app import crud
+
+
+def grant_admin(db, username: str, target: str = None) -> None:
+    user = crud.user.get_by_login(db, login=username)
+    target_user = crud.user.get_by_login(db, login=target) if target else None
+    role = crud.role.get_by_name(db, role_name="Admin")
+    crud.user.add_role(db, user=user, role=role, target_user=target_user)
+
+
+def test_users_only_see_themselves(signup, login):
+    alice = signup("alice")
+    bob = signup("bob")
+    client = login("alice")
+    assert client.get(f"/api/v1/users/{alice['id']}").status_code == 200
+    assert client.get(f"/api/v1/users/{bob['id']}").status_code == 401
+
+
+def test_scoped_grant_covers_only_its_target(db, signup, login):
+    signup("alice")
+    bob = signup("bob")
+    carol = signup("carol")
+    grant_admin(db, "alice", target="bob")
+
+    client = login("alice")
+    assert client.get(f"/api/v1/users/{bob['id']}").json()["username"] == "bob"
+    assert client.get(f"/api/v1/users/{carol['id']}").status_code == 401
+
+
+def test_unscoped_grant_covers_everyone(db, signup, login):
+    signup("alice")
+    carol = signup("carol")
+    grant_admin(db, "alice")
+
+    assert login("alice").get(f"/api/v1/users/{carol['id']}").status_code == 200
+
+
+def test_revoked_grant_stops_applying(db, signup, login):
+    signup("alice")
+    bob = signup("bob")
+    grant_admin(db, "alice", target="bob")
+    client = login("alice")
+    assert client.get(f"/api/v1/users/{bob['id']}").status_code == 200
+
+    crud.user.delete_role(
+        db,
+        user=crud.user.get_by_login(db, login="alice"),
+        role=crud.role.get_by_name(db, role_name="Admin"),
+        target_user=crud.user.get_by_login(db, login="bob"),
+    )
+    assert client.get(f"/api/v1/users/{bob['id']}").status_code == 401
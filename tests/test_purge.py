@@ -0,0 +1,104 @@
+import uuid
+from datetime import timedelta
+
+from sqlalchemy import func, select
+
+from app import crud, schemas
+from app.core import clock
+from app.db.purge import (
+    LatencyThrottle,
+    PurgeCheckpoint,
+    PurgeCriteria,
+    count_candidates,
+    purge_users,
+)
+from app.models import User, UsersRole
+
+
+def throttle(chunk_size: int) -> LatencyThrottle:
+    return LatencyThrottle(
+        chunk_size,
+        target_seconds=60,
+        duty_cycle=1.0,
+        min_chunk_size=chunk_size,
+        max_chunk_size=chunk_size,
+    )
+
+
+def user_ids(engine, usernames) -> list:
+    with engine.connect() as connection:
+        return list(
+            connection.execute(select(User.id).where(User.username.in_(usernames))).scalars()
+        )
+
+
+def test_purge_by_ids(engine, db, signup):
+    for name in ("alice", "bob", "carol"):
+        signup(name)
+    crud.user.add_role(
+        db,
+        user=crud.user.get_by_login(db, login="carol"),
+        role=crud.role.get_by_name(db, role_name="Admin"),
+        target_user=crud.user.get_by_login(db, login="alice"),
+    )
+    criteria = PurgeCriteria(user_ids=user_ids(engine, ["alice", "bob"]))
+    assert count_candidates(engine, criteria) == 2
+
+    checkpoint = purge_users(engine, criteria, throttle(10))
+    assert checkpoint.finished
+    assert checkpoint.deleted["users"] == 2
+    assert user_ids(engine, ["alice", "bob", "carol"]) == user_ids(engine, ["carol"])
+    with engine.connect() as connection:
+        # Including carol's grant scoped to alice
+        assert connection.execute(select(func.count()).select_from(UsersRole)).scalar() == 0
+
+
+def test_purge_by_ids_skips_ids_that_no_longer_exist(engine, signup):
+    for name in ("alice", "bob"):
+        signup(name)
+    # Sorted ahead of every real id, and more than a chunk of them
+    stale = [uuid.UUID(f"00000000-0000-4000-8000-{i:012d}") for i in range(5)]
+    criteria = PurgeCriteria(user_ids=stale + user_ids(engine, ["alice", "bob"]))
+    assert count_candidates(engine, criteria, chunk_size=2) == 2
+
+    checkpoint = purge_users(engine, criteria, throttle(2))
+    assert checkpoint.finished
+    assert checkpoint.deleted["users"] == 2
+    assert user_ids(engine, ["alice", "bob"]) == []
+
+
+def test_purge_resumes_from_its_checkpoint(engine, signup, tmp_path):
+    names = [f"user{i}" for i in range(5)]
+    for name in names:
+        signup(name)
+    criteria = PurgeCriteria(user_ids=user_ids(engine, names))
+    path = str(tmp_path / "purge.json")
+
+    stopping = throttle(2)
+    stopping.stopping.set()
+    checkpoint = purge_users(engine, criteria, stopping, checkpoint_path=path)
+    assert not checkpoint.finished
+    assert len(user_ids(engine, names)) == 3
+
+    checkpoint = purge_users(engine, criteria, throttle(2), checkpoint_path=path)
+    assert checkpoint.finished
+    assert checkpoint.deleted["users"] == 5
+    assert PurgeCheckpoint.load(path).finished
+    assert user_ids(engine, names) == []
+
+
+def test_inactive_users_with_live_api_keys_are_kept(engine, db, signup):
+    for name in ("alice", "bob", "carol"):
+        signup(name)
+    alice, bob = (crud.user.get_by_login(db, login=name) for name in ("alice", "bob"))
+    crud.api_key.create_for_user(db, user_id=alice.id, obj_in=schemas.ApiKeyCreate(name="live"))
+    revoked, _ = crud.api_key.create_for_user(
+        db, user_id=bob.id, obj_in=schemas.ApiKeyCreate(name="revoked")
+    )
+    crud.api_key.revoke(db, user_id=bob.id, id=revoked.id)
+
+    # Everyone signed up before this, so everyone is inactive by date
+    criteria = PurgeCriteria(inactive_before=clock.utcnow() + timedelta(days=1))
+    checkpoint = purge_users(engine, criteria, throttle(10))
+    assert checkpoint.deleted["users"] == 2
+    assert user_ids(engine, ["alice", "bob", "carol"]) == [alice.id]
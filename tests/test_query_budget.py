@@ -0,0 +1,69 @@
+from typing import Iterator
+
+import pytest
+from fastapi import APIRouter, Depends
+
+from app.api import deps
+from app.db.query_budget import QueryBudgetExceeded, QueryRecorder, fingerprint, query_stats
+from app.main import app
+
+router = APIRouter()
+
+
+# Authentication runs a statement before the budget is declared
+@router.get("/budget-zero")
+def budget_zero(
+    _user=Depends(deps.user.get_current_user), _budget: None = Depends(deps.query_budget(0))
+) -> dict:
+    return {}
+
+
+@pytest.fixture
+def budget_zero_route() -> Iterator[None]:
+    # Taken off again afterwards, so the app other tests see is unchanged
+    routes = list(app.router.routes)
+    app.include_router(router, prefix="/tests")
+    try:
+        yield
+    finally:
+        app.router.routes[:] = routes
+
+
+def test_fingerprint_collapses_literals_and_lists():
+    assert fingerprint("SELECT * FROM t WHERE a = 1 AND b IN (?, ?, ?)") == fingerprint(
+        "SELECT  * FROM t WHERE a = 22 AND b IN (?)"
+    )
+
+
+def test_overrun_is_reported_once():
+    recorder = QueryRecorder(budget=1)
+    recorder.record("SELECT 1")
+    with pytest.raises(QueryBudgetExceeded):
+        recorder.record("SELECT 2")
+    recorder.record("SELECT 3")
+
+
+def test_overrun_before_the_budget_is_set_is_reported():
+    recorder = QueryRecorder()
+    recorder.record("SELECT 1")
+    recorder.record("SELECT 2")
+    recorder.budget = 1
+    with pytest.raises(QueryBudgetExceeded):
+        recorder.check_budget()
+
+
+@pytest.mark.usefixtures("budget_zero_route")
+def test_statements_run_by_dependencies_count(signup, login):
+    signup("alice")
+    with pytest.raises(QueryBudgetExceeded, match="budget of 0"):
+        login("alice").get("/tests/budget-zero")
+
+
+def test_me_with_an_api_key_fits_its_budget(client, signup, login):
+    signup("alice")
+    api_key = login("alice").post("/api/v1/users/me/api-keys", json={"name": "ci"}).json()
+    query_stats.clear()
+
+    r = client.get("/api/v1/users/me", headers={"Authorization": f"Bearer {api_key['api_key']}"})
+    assert r.status_code == 200
+    assert query_stats.stats()["routes"]["GET /api/v1/users/me"]["requests"] == 1
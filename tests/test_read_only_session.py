@@ -0,0 +1,56 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+
+from app.api.deps.db import db_usage
+from app.db.query_budget import query_stats
+from app.db.session import ReadOnlySessionError, read_only
+
+
+@pytest.fixture
+def read_only_db(engine: Engine):
+    db = sessionmaker(bind=read_only(engine), info={"read_only": True})()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def test_reads_go_through(read_only_db):
+    assert read_only_db.execute(text("SELECT count(*) FROM users")).scalar() >= 0
+    assert read_only_db.execute(text("WITH t AS (SELECT 1 AS a) SELECT a FROM t")).scalar() == 1
+
+
+@pytest.mark.parametrize(
+    "statement",
+    [
+        "INSERT INTO tenants (id, name) VALUES ('sneaky', 'Sneaky')",
+        "UPDATE users SET is_active = 0",
+        "DELETE FROM users",
+        "WITH t AS (SELECT 1) DELETE FROM users",
+        "PRAGMA query_only = 0",
+    ],
+)
+def test_text_writes_are_refused(read_only_db, db, statement):
+    users = db.execute(text("SELECT count(*) FROM users")).scalar()
+    with pytest.raises(ReadOnlySessionError):
+        read_only_db.execute(text(statement))
+    # Nor through the session's connection, which autocommits
+    with pytest.raises(ReadOnlySessionError):
+        read_only_db.connection().execute(text(statement))
+    assert db.execute(text("SELECT count(*) FROM tenants WHERE id = 'sneaky'")).scalar() == 0
+    assert db.execute(text("SELECT count(*) FROM users")).scalar() == users
+
+
+def test_usage_counts_flushed_statements(client):
+    query_stats.clear()
+    before = db_usage.stats()["statements"]
+    r = client.post(
+        "/api/v1/users/",
+        json={"username": "erin", "email": "erin@example.com", "password": "s3cret-Pass!word"},
+    )
+    assert r.status_code == 200, r.text
+    # Everything the request ran went through its session, INSERTs included
+    ran = query_stats.stats()["routes"]["POST /api/v1/users/"]["statements"]
+    assert db_usage.stats()["statements"] - before == ran
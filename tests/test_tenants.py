@@ -0,0 +1,62 @@
+import uuid
+
+import pytest
+
+from app import crud, models, schemas
+from app.core.principal import forget_principal
+from app.models.join_tables.all import RolesPermission
+
+TENANT = {"X-Tenant-ID": "acme"}
+
+
+@pytest.fixture
+def tenant_admin(db, client, signup, login):
+    """
+    A client for a user of the acme tenant who holds a tenant role with
+    AdminManageRoles
+    """
+    crud.tenant.create(db, obj_in=schemas.TenantCreate(id="acme", name="Acme"))
+    r = client.post(
+        "/api/v1/users/",
+        headers=TENANT,
+        json={"username": "ann", "email": "ann@acme.com", "password": "s3cret-Pass!word"},
+    )
+    assert r.status_code == 200, r.text
+
+    manager = models.Role(id=uuid.uuid4(), role_name="Manager", tenant_id="acme")
+    staff = models.Role(id=uuid.uuid4(), role_name="Staff", tenant_id="acme")
+    db.add_all([manager, staff])
+    permission = (
+        db.query(models.Permission).filter_by(permission_name="AdminManageRoles").one()
+    )
+    db.add(RolesPermission(role_id=manager.id, permission_id=permission.id))
+    db.commit()
+    crud.role.rebuild_closure(db)
+    ann = crud.user.get_by_login(db, login="ann", tenant_id="acme")
+    crud.user.add_role(db, user=ann, role=manager)
+    forget_principal(ann.id)
+
+    return login("ann", headers=TENANT)
+
+
+def test_tenant_can_arrange_its_own_roles(tenant_admin, db):
+    r = tenant_admin.put("/api/v1/roles/admin/roles/Staff/parents/Manager")
+    assert r.status_code == 200, r.text
+
+
+@pytest.mark.parametrize(
+    "role, parent",
+    [
+        # Manager would gain every permission of Admin
+        ("Admin", "Manager"),
+        ("Manager", "Admin"),
+        ("Gateway", "Admin"),
+    ],
+)
+def test_tenant_cannot_involve_system_roles(tenant_admin, db, role, parent):
+    r = tenant_admin.put(f"/api/v1/roles/admin/roles/{role}/parents/{parent}")
+    assert r.status_code == 403
+    manager = crud.role.get_by_name(db, role_name="Manager", tenant_id="acme")
+    assert "AdminSeeServerStats" not in crud.role.get_effective_permission_names(
+        db, role_ids=[manager.id]
+    )
@@ -0,0 +1,70 @@
+import pytest
+
+from app import crud, models
+from app.core.security import get_password_hash
+from .test_permissions import grant_admin
+
+
+@pytest.fixture
+def admin(db, signup, login):
+    signup("alice")
+    grant_admin(db, "alice")
+    return login("alice")
+
+
+def add_users(db, count: int) -> None:
+    # Straight into the table; signing up hashes a password per user
+    hashed_password = get_password_hash("unused")
+    gateway = crud.role.get_by_name(db, role_name="Gateway")
+    for i in range(count):
+        user = models.User(
+            username=f"user{i}", email=f"user{i}@example.com", hashed_password=hashed_password
+        )
+        db.add(user)
+        db.flush()
+        db.add(models.UsersRole(tenant_id=user.tenant_id, user_id=user.id, role_id=gateway.id))
+    db.commit()
+
+
+def listed(admin, profile: str) -> dict:
+    r = admin.get("/api/v1/roles/admin/all-users", params={"profile": profile})
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def test_no_profile_lists_users_only(admin, signup):
+    signup("bob")
+    listing = listed(admin, "none")
+    assert {user["username"] for user in listing["users"]} == {"alice", "bob"}
+    assert all("roles" not in user for user in listing["users"])
+    assert "permissions" not in listing
+
+
+def test_roles_profile_lists_grants(admin, signup):
+    signup("bob")
+    users = {user["username"]: user for user in listed(admin, "roles")["users"]}
+    assert [grant["role_name"] for grant in users["alice"]["roles"]] == ["Admin"]
+    assert users["bob"]["roles"] == []
+
+
+def test_permissions_profile_lists_effective_permissions_once_per_role(admin):
+    listing = listed(admin, "permissions")
+    (grant,) = listing["users"][0]["roles"]
+    # Inherited from Gateway
+    assert "IntrospectTokens" in listing["permissions"][grant["id"]]
+    assert "AdminSeeAllUsers" in listing["permissions"][grant["id"]]
+
+
+def test_unknown_profile_is_rejected(admin):
+    r = admin.get("/api/v1/roles/admin/all-users", params={"profile": "everything"})
+    assert r.status_code == 422
+
+
+@pytest.mark.parametrize("profile", ["none", "roles", "permissions"])
+def test_profiles_fit_the_budget_however_many_users(db, admin, profile):
+    # The budget is strict under test, so a query per user fails the request
+    add_users(db, 30)
+    listing = listed(admin, profile)
+    assert len(listing["users"]) == 31
+    if profile != "none":
+        assert all(user["roles"] for user in listing["users"])
@@ -0,0 +1,92 @@
+import time
+from datetime import timedelta
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+from starlette.websockets import WebSocketDisconnect
+
+from app import crud
+from app.api.deps import websocket
+from app.core import security
+from app.core.websocket_sessions import CLOSE_EXPIRED, CLOSE_REVOKED, WebSocketSessionManager
+
+from .test_api_keys import create_api_key
+
+
+@pytest.fixture
+def manager(engine, monkeypatch) -> WebSocketSessionManager:
+    # One per test, reading the test's database and ticking fast. Its task
+    # belongs to the event loop of the socket that started it.
+    manager = WebSocketSessionManager(
+        tick=0.05,
+        slots=64,
+        revalidate_interval=0.1,
+        batch_size=500,
+        max_sessions=10,
+        session_factory=sessionmaker(bind=engine),
+    )
+    monkeypatch.setattr(websocket, "websocket_sessions", manager)
+    return manager
+
+
+def closed_with(ws, manager: WebSocketSessionManager, timeout: float = 5) -> int:
+    # Waited for here, since receiving from a socket that's never closed
+    # would hang the test rather than fail it
+    deadline = time.monotonic() + timeout
+    while manager.stats()["sessions"] and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert not manager.stats()["sessions"], "the session was not closed"
+    with pytest.raises(WebSocketDisconnect) as e:
+        ws.receive_json()
+    return e.value.code
+
+
+def test_handshake_without_credentials_is_refused(client, manager):
+    with pytest.raises(WebSocketDisconnect) as e:
+        with client.websocket_connect("/api/v1/ws/session"):
+            pass
+    assert e.value.code == 1008
+
+
+def test_session_answers_pings(signup, login, manager):
+    alice = signup("alice")
+    with login("alice").websocket_connect("/api/v1/ws/session") as ws:
+        assert ws.receive_json()["user_id"] == alice["id"]
+        ws.send_text("ping")
+        assert ws.receive_json() == {"type": "pong"}
+        assert manager.stats()["sessions"] == 1
+    assert manager.stats()["sessions"] == 0
+
+
+def test_revoked_api_key_closes_the_session(client, signup, login, manager):
+    signup("alice")
+    alice = login("alice")
+    created = create_api_key(alice)
+    headers = {"Authorization": f"Bearer {created['api_key']}"}
+    with client.websocket_connect("/api/v1/ws/session", headers=headers) as ws:
+        ws.receive_json()
+        assert alice.delete(f"/api/v1/users/me/api-keys/{created['id']}").status_code == 200
+        assert closed_with(ws, manager) == CLOSE_REVOKED
+    assert manager.stats()["closed"]["revoked"] == 1
+
+
+def test_deleted_user_closes_the_session(db, signup, login, manager):
+    signup("alice")
+    with login("alice").websocket_connect("/api/v1/ws/session") as ws:
+        ws.receive_json()
+        crud.user.remove(db, id=crud.user.get_by_login(db, login="alice").id)
+        assert closed_with(ws, manager) == CLOSE_REVOKED
+
+
+def test_expired_token_closes_the_session(client, signup, manager):
+    alice = signup("alice")
+    token = security.create_access_token(
+        alice["id"], expires_delta=timedelta(seconds=2), token_type="login"
+    )
+    headers = {"Authorization": f"Bearer {token}"}
+    with client.websocket_connect("/api/v1/ws/session", headers=headers) as ws:
+        assert ws.receive_json()["expires_at"] is not None
+        # Checked when it expires, however far off the next revalidation is
+        manager.revalidate_interval = 60
+        assert closed_with(ws, manager) == CLOSE_EXPIRED
+    assert manager.stats()["closed"]["expired"] == 1